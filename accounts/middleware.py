@@ -1,36 +1,69 @@
 import jwt
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
 from django.utils import translation
 from accounts.models import CustomUser  # adjust if needed
 
 
 class LanguagePreferenceMiddleware:
+    # Works in both modes, so async views under ASGI don't get pushed onto a thread
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
+    def get_user_id(self, request):
         token = None
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
 
         if auth_header.startswith('Bearer '):
             token = auth_header.split(' ')[1]
 
-        if token:
-            try:
-                # Decode the JWT token manually
-                decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-                user_id = decoded.get('user_id')
-                user = CustomUser.objects.get(id=user_id)
-                lang = user.preferred_language or 'en'
-                print(f"[Middleware] JWT user: {user.email}, Language: {lang}")
-                translation.activate(lang)
-            except Exception as e:
-                print(f"[Middleware] JWT decode failed: {e}")
-                translation.activate('en')
-        else:
+        if not token:
             print("[Middleware] No JWT token. Defaulting to English.")
+            return None
+
+        # Decode the JWT token manually
+        decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+        return decoded.get('user_id')
+
+    def activate(self, user):
+        lang = user.preferred_language or 'en'
+        print(f"[Middleware] JWT user: {user.email}, Language: {lang}")
+        translation.activate(lang)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        try:
+            user_id = self.get_user_id(request)
+            if user_id is None:
+                translation.activate('en')
+            else:
+                self.activate(CustomUser.objects.get(id=user_id))
+        except Exception as e:
+            print(f"[Middleware] JWT decode failed: {e}")
             translation.activate('en')
 
         response = self.get_response(request)
         translation.deactivate()
         return response
+
+    async def __acall__(self, request):
+        try:
+            user_id = self.get_user_id(request)
+            if user_id is None:
+                translation.activate('en')
+            else:
+                self.activate(await CustomUser.objects.aget(id=user_id))
+        except Exception as e:
+            print(f"[Middleware] JWT decode failed: {e}")
+            translation.activate('en')
+
+        response = await self.get_response(request)
+        translation.deactivate()
+        return response
@@ -5,11 +5,12 @@ from django.utils.encoding import smart_str, force_bytes, smart_bytes, DjangoUni
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
-from django.core.mail import send_mail
+from django.db import transaction
 from django.template.loader import render_to_string
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.tokens import RefreshToken
 from drf_spectacular.utils import extend_schema_field
+from core.outbox import enqueue_email
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(
@@ -35,8 +36,9 @@ class RegisterSerializer(serializers.ModelSerializer):
         }
 
     def create(self, validated_data):
-        user = CustomUser.objects.create_user(**validated_data)
-        self.send_verification_email(user)
+        with transaction.atomic():  # No account without its verification email, and vice versa
+            user = CustomUser.objects.create_user(**validated_data)
+            self.send_verification_email(user)
         return user
 
     def send_verification_email(self, user):
@@ -49,7 +51,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         subject = 'Verify your email'
         message = f"Hi {user.get_full_name()},\n\nClick here to verify your email: {link}"
 
-        send_mail(subject, message, None, [user.email])
+        enqueue_email(subject, message, [user.email])
 class ResetPasswordEmailRequestSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
@@ -9,7 +9,7 @@ from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import smart_str, force_bytes
 from django.urls import reverse
-from django.core.mail import EmailMessage
+from core.outbox import enqueue_email
 from django.conf import settings
 from .models import CustomUser
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -64,8 +64,7 @@ class RequestPasswordResetEmail(generics.GenericAPIView):
             relative_link = reverse('accounts:password-reset-confirm', kwargs={'uidb64': uidb64, 'token': token})
             abs_url = f"http://localhost:8000{relative_link}"
             email_body =  _(f"Hi {user.get_full_name()},\nUse the link below to reset your password:\n{abs_url}")
-            email = EmailMessage(subject="Reset Your Password", body=email_body, to=[user.email])
-            email.send()
+            enqueue_email("Reset Your Password", email_body, [user.email])
         return Response({"message": _("If your email is in our system, we have sent you a link to reset your password.")}, status=status.HTTP_200_OK)
 
 class PasswordTokenCheckAPI(generics.GenericAPIView):
@@ -195,6 +195,14 @@ EMAIL_HOST_USER = 'daramolaponmilee@gmail.com'
 EMAIL_HOST_PASSWORD = 'kobzlvajkabtuhjx'  # We’ll create this next
 DEFAULT_FROM_EMAIL = 'AgriSmart Africa <daramolaponmilee@gmail.com>'
 
+# Emails are queued in core.OutboxEmail and sent by `manage.py send_outbox`
+EMAIL_OUTBOX_BATCH = 100  # Emails claimed and sent per batch, all over the same SMTP connection
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8  # Failed tries before an email is dead-lettered
+EMAIL_OUTBOX_RETRY_SECONDS = 60  # Wait after the first failure; doubles with each further one
+EMAIL_OUTBOX_MAX_RETRY_SECONDS = 6 * 60 * 60  # Cap on that wait
+EMAIL_OUTBOX_LEASE_SECONDS = 5 * 60  # How long a worker's claim holds before the email falls due again
+EMAIL_OUTBOX_KEEP_SENT_DAYS = 7  # Sent emails kept for inspection; dead ones are kept until deleted
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -253,11 +261,68 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 from decouple import config
 
 OPENWEATHER_API_KEY = config('OPENWEATHER_API_KEY')
+OPENWEATHER_BASE_URL = config('OPENWEATHER_BASE_URL', default='https://api.openweathermap.org/data/2.5')
 
+# Weather
+WEATHER_CACHE_TTL = {  # Seconds an OpenWeather response stays fresh, per kind
+    'current': 10 * 60,
+    'forecast': 3 * 60 * 60,
+}
+WEATHER_CACHE_STALE_TTL = 6 * 60 * 60  # How long past its TTL an entry may still be served while it is refreshed
+WEATHER_GRID_DEGREES = 0.05  # Places in the same lat/lon cell of this size (about 5.5 km) share weather cache entries
+WEATHER_FETCH_LOCK_TIMEOUT = 30  # Seconds before a stuck upstream fetch's cache lock lapses and another worker may fetch
+WEATHER_COALESCE_WAIT = 5  # Max seconds a worker waits for another worker's in-flight fetch of the same city
+WEATHER_TIMEOUT = (3.05, 5)  # (connect, read) seconds per OpenWeather request
+WEATHER_MAX_RETRIES = 2  # Extra attempts after a connection error, timeout, 429 or 5xx
+WEATHER_RETRY_BACKOFF = 0.25  # Seconds; retry n sleeps a random 0..backoff * 2**(n-1)
+WEATHER_POOL_SIZE = 10  # Keep-alive connections per worker
+WEATHER_ASYNC_MAX_CONNECTIONS = 100  # Concurrent OpenWeather connections per event loop (async views)
+WEATHER_BREAKER_FAILURES = 5  # Consecutive failed requests that open the circuit breaker
+WEATHER_BREAKER_COOLDOWN = 30  # Seconds the breaker fails fast before letting a trial request through
+WEATHER_OBSERVATION_BATCH = 50  # Readings buffered per worker before one bulk insert into WeatherObservation
+WEATHER_OBSERVATION_FLUSH_SECONDS = 60  # Max seconds a reading waits in the buffer (checked as new readings arrive)
+WEATHER_OBSERVATION_RETENTION_DAYS = 35  # Raw observations kept; older days survive as daily rollups
+WEATHER_DAILY_ROLLUP_RETENTION_DAYS = 2 * 365  # Daily rollups kept; monthly rollups are kept forever
+WEATHER_QUOTA_PER_MINUTE = config('WEATHER_QUOTA_PER_MINUTE', default=60, cast=int)  # OpenWeather plan's calls per minute, shared by all workers; 0 disables
+WEATHER_QUOTA_BACKGROUND_SHARE = 0.5  # Share of each minute's calls prefetching and stale refreshes may use; the rest is kept for requests
+WEATHER_QUOTA_DATABASE = config('WEATHER_QUOTA_DATABASE', default=False, cast=bool)  # Count calls in the QuotaWindow table, atomically across every process
+WEATHER_QUOTA_CACHE = 'default'  # Otherwise the cache alias holding the counter; must be Redis or Memcached to span workers
+WEATHER_PREFETCH_AHEAD = 15 * 60  # prefetch_weather refreshes entries expiring within this many seconds; keep above its schedule
+WEATHER_PREFETCH_CONCURRENCY = 4  # Parallel OpenWeather calls made by prefetch_weather
+WEATHER_PREFETCH_RATE = 50  # Max OpenWeather calls per minute made by prefetch_weather (the free plan allows 60)
+
+# Climate normals (see core/climatology.py and the build_climatology command)
+CLIMATOLOGY_DIR = os.path.join(BASE_DIR, 'data', 'climatology')
+CLIMATOLOGY_GRID_DEGREES = 0.5  # Cell size build_climatology aggregates normals to
+CLIMATOLOGY_SEASON_MONTHS = 3  # Months from now that predictions average normals over (a growing season)
+
+# Crop recommendation
+CROP_BATCH_MAX_ROWS = 10000  # Max samples per /predict-crop/batch/ request
+CROP_SWEEP_MAX_CELLS = 20000  # Max grid cells per /predict-crop/sweep/ request
+CROP_MODEL_ENGINE = config('CROP_MODEL_ENGINE', default='sklearn')  # 'compiled' also flattens forests published without forest arrays (legacy pickles); published ones always serve from theirs
+CROP_MODEL_WATCH_INTERVAL = 5  # Seconds between checks of core/ml_models/CURRENT for a newly published model
+CROP_MODEL_LATENCY_BUDGET_MS = 5  # Max single-row p99 latency when train_crop_model picks a winner
+CROP_MODEL_RELOAD_SIGNAL = 'SIGUSR2'  # Send to a worker pid to reload the model immediately; '' to disable
+CROP_PREDICTION_CACHE_SIZE = 4096  # Entries per worker; 0 disables the prediction cache
+CROP_PREDICTION_CACHE_TTL = 3600  # Seconds
+CROP_PREDICTION_CACHE_PRECISION = {  # Decimals each feature is rounded to when building cache keys
+    'N': 0, 'P': 0, 'K': 0,
+    'temperature': 1, 'humidity': 0, 'ph': 1, 'rainfall': 0,
+}
+CROP_MICRO_BATCH_ENABLED = config('CROP_MICRO_BATCH_ENABLED', default=False, cast=bool)  # Batch concurrent single predictions
+CROP_MICRO_BATCH_MAX_SIZE = 32  # Rows per batched predict_proba call
+CROP_MICRO_BATCH_MAX_WAIT_MS = 2  # Max time the first queued row waits for others
+
+# The weather cache must be shared for the cron jobs' prefetching to reach the web workers. Deployments set
+# CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache and CACHE_LOCATION=agrismart_cache (a table made by
+# `manage.py createcachetable`); the per-process default is fine for development and tests.
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "weather-cache",
+        "BACKEND": config('CACHE_BACKEND', default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config('CACHE_LOCATION', default="weather-cache"),
+        "OPTIONS": {
+            "MAX_ENTRIES": config('CACHE_MAX_ENTRIES', default=20000, cast=int),  # Two kinds per grid cell, plus locks
+        },
     }
 }
 
@@ -1,7 +1,26 @@
 from django.contrib import admin
-from .models import Farmer, Agronomist, SoilTest
+from django.utils import timezone
+
+from .models import CropRecommendation, Farmer, Agronomist, OutboxEmail, SoilTest, WeatherObservation, WeatherRollup
 
 # Register your models here.
 admin.site.register(Farmer)
 admin.site.register(Agronomist)
-admin.site.register(SoilTest)
\ No newline at end of file
+admin.site.register(SoilTest)
+admin.site.register(CropRecommendation)
+admin.site.register(WeatherObservation)
+admin.site.register(WeatherRollup)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['subject']
+    actions = ['retry_now']
+
+    @admin.action(description="Retry now (also revives dead emails)")
+    def retry_now(self, request, queryset):
+        queryset.exclude(status=OutboxEmail.SENT).update(
+            status=OutboxEmail.PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
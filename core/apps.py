@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from .model_registry import install_reload_signal
+        install_reload_signal()
+
+        from .climatology import climatology
+        climatology()  # Map the table once here so forked workers share its pages
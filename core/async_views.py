@@ -0,0 +1,112 @@
+# core/async_views.py
+
+"""
+Async variants of the weather-bound endpoints for ASGI deployments
+(agrismart.asgi). While a request waits on OpenWeather the worker's event
+loop keeps serving others, so throughput is no longer capped by the number
+of workers. They take the same JWT and return the same payloads as the
+DRF views in core.views.
+"""
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.utils.translation import gettext as _
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .geocode import stored_place
+from .models import Farmer
+from .predict import recommend_crop
+from .prediction_request import PredictionInputError, PredictionRequest, missing_city_error
+from .weather import aget_forecast_by_city, aget_forecast_entries_by_city, aget_prediction_weather, aget_weather_by_city
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAuthenticatedView(View):
+    """
+    Requires a valid JWT, like IsAuthenticated with JWTAuthentication on the DRF views.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            result = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except AuthenticationFailed as e:
+            return JsonResponse({"detail": e.detail}, status=401)
+        if result is None:
+            return JsonResponse({"detail": _("Authentication credentials were not provided.")}, status=401)
+        request.user = result[0]
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def farmer_location(self, user):
+        farmer = await Farmer.objects.filter(user=user).values_list('location', 'latitude', 'longitude').afirst()
+        return stored_place(*farmer) if farmer is not None else None
+
+
+class AsyncWeatherView(AsyncAuthenticatedView):
+    async def get(self, request):
+        city = request.GET.get("city")
+
+        if not city:
+            city = await self.farmer_location(request.user)
+            if city is None:
+                return JsonResponse({"error": _("City not provided and no location found for user.")}, status=400)
+
+        weather_data = await aget_weather_by_city(city)
+        return JsonResponse(weather_data)
+
+
+class AsyncWeatherForecastView(AsyncAuthenticatedView):
+    async def get(self, request):
+        city = request.GET.get("city")
+
+        if not city:
+            city = await self.farmer_location(request.user)
+            if city is None:
+                return JsonResponse({"error": _("City not provided and no location found for user.")}, status=400)
+
+        if request.GET.get("view") == "3h":
+            forecast_data = await aget_forecast_entries_by_city(city)
+        else:
+            forecast_data = await aget_forecast_by_city(city)
+        return JsonResponse(forecast_data, safe=False)
+
+
+class AsyncCropPredictionView(AsyncAuthenticatedView):
+    def get_data(self, request):
+        if request.content_type == 'application/json':
+            return json.loads(request.body or b'{}')
+        return request.POST
+
+    async def post(self, request):
+        try:
+            prediction = PredictionRequest(self.get_data(request))
+        except PredictionInputError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        except ValueError:
+            return JsonResponse({"error": _("Invalid JSON body.")}, status=400)
+
+        try:
+            if prediction.needs_weather:
+                city = prediction.city
+                if city is None:
+                    city = await self.farmer_location(request.user)
+                    if city is None:
+                        return JsonResponse(missing_city_error(), status=400)
+
+                weather = await aget_prediction_weather(city, prediction.use_forecast, prediction.weather_source)
+                error = prediction.set_weather(*weather)
+                if error:
+                    body, code, headers = error
+                    return JsonResponse(body, status=code, headers=headers)
+
+            # Off the event loop: the micro-batcher may block while it waits for other rows
+            recommend = await sync_to_async(recommend_crop, thread_sensitive=False)(prediction.data)
+            return JsonResponse(prediction.response(recommend))
+
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
@@ -0,0 +1,138 @@
+# core/batching.py
+
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class _Pending:
+    __slots__ = ('row', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, row):
+        self.row = row
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Collects single rows from concurrent callers and scores them together.
+
+    A dispatcher thread takes the first queued row, keeps collecting until the
+    batch holds `max_batch_size` rows or `max_wait` seconds have passed since
+    that row arrived, then calls `score(matrix)` once for the whole batch.
+    `score` returns (context, probabilities); every caller gets the shared
+    context (e.g. the model version used) and its own probability row. If
+    scoring the batch fails, its rows are scored one at a time so only the
+    callers whose rows fail get the error.
+    """
+
+    def __init__(self, score, max_batch_size=32, max_wait=0.002, timeout=5.0):
+        self.score = score
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def submit(self, row):
+        """
+        Blocks until the batch containing `row` has been scored.
+        """
+        self._ensure_started()
+        pending = _Pending(row)
+        self._queue.put(pending)
+        if not pending.done.wait(self.timeout):
+            raise TimeoutError("Prediction batch was not scored in time.")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so a pre-forked worker starts its own dispatcher
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='crop-micro-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            flushed_at = time.monotonic()
+            try:
+                self._score(batch)
+            finally:
+                self._record(batch, flushed_at)
+                for pending in batch:
+                    pending.done.set()
+
+    def _score(self, batch):
+        try:
+            context, probabilities = self.score(np.vstack([p.row for p in batch]))
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].error = e
+                return
+            # One bad row shouldn't fail everyone it happened to be batched with
+            for pending in batch:
+                self._score([pending])
+            return
+        for pending, proba in zip(batch, probabilities):
+            pending.result = (context, proba)
+
+    def _record(self, batch, flushed_at):
+        waits = [flushed_at - p.enqueued_at for p in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._rows += len(batch)
+            self._max_batch_size_seen = max(self._max_batch_size_seen, len(batch))
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            self._wait_total += sum(waits)
+            self._wait_max = max(self._wait_max, max(waits))
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._batches = 0
+            self._rows = 0
+            self._max_batch_size_seen = 0
+            self._batch_sizes = {}
+            self._wait_total = 0.0
+            self._wait_max = 0.0
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches': self._batches,
+                'rows': self._rows,
+                'queued': self._queue.qsize(),
+                'mean_batch_size': round(self._rows / self._batches, 2) if self._batches else 0.0,
+                'max_batch_size': self._max_batch_size_seen,
+                'batch_size_counts': dict(sorted(self._batch_sizes.items())),
+                'mean_queue_wait_ms': round(self._wait_total / self._rows * 1000, 3) if self._rows else 0.0,
+                'max_queue_wait_ms': round(self._wait_max * 1000, 3),
+            }
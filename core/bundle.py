@@ -0,0 +1,164 @@
+# core/bundle.py
+
+"""
+Portable crop model bundle for clients that run recommendations offline.
+
+The bundle is one JSON document ("agrismart-forest", format_version 1):
+
+    model_version, features, classes    features in input column order; classes
+                                        are crop names in probability column order
+    n_trees, value_scale, roots         roots[t] is tree t's root reference
+    feature, threshold, left, right,    one entry per internal (split) node
+    missing_left
+    leaf_offsets, leaf_classes,         sparse class values of every leaf:
+    leaf_values                         leaf k owns entries leaf_offsets[k] to
+                                        leaf_offsets[k + 1]
+
+A reference r >= 0 is internal node r; r < 0 is leaf -r - 1. At a split,
+round x[feature] to float32 first (Math.fround in JavaScript), then go left
+when x <= threshold, or when x is NaN and missing_left is 1. A row's
+probabilities are the sum of its leaves' values in tree order, divided by
+n_trees * value_scale.
+
+The checksum is the SHA-256 of the exact bundle bytes. It is served as the
+ETag, so clients can verify a stored bundle and revalidate it cheaply.
+"""
+
+import gzip
+import hashlib
+import json
+import struct
+import threading
+
+import numpy as np
+
+from .forest import CompiledForest, is_compilable
+
+BUNDLE_FORMAT = 'agrismart-forest'
+BUNDLE_FORMAT_VERSION = 1
+
+
+def bundle_forest(loaded):
+    """
+    The forest a bundle of this model version is built from: the one
+    LoadedModel.predict_proba would use, so client results match the server.
+    """
+    if loaded.compiled is not None:
+        return loaded.compiled
+    if is_compilable(loaded.model):
+        return CompiledForest.from_sklearn(loaded.model)
+    raise ValueError(f"Model version {loaded.version} is not a tree ensemble and cannot be bundled.")
+
+
+def build_bundle(loaded):
+    """
+    The bundle document for a LoadedModel, as a dict.
+    """
+    forest = bundle_forest(loaded)
+    children = np.asarray(forest.children)
+    is_leaf = children[:, 0] == np.arange(forest.n_nodes)
+
+    # Renumber so internal nodes and leaves each count from 0; leaves get negative references
+    refs = np.empty(forest.n_nodes, dtype=np.int64)
+    refs[~is_leaf] = np.arange(int((~is_leaf).sum()))
+    refs[is_leaf] = -np.arange(int(is_leaf.sum())) - 1
+
+    # Compact forests number leaves first and only store their rows, so this indexing works for both layouts
+    leaf_value = np.asarray(forest.value)[np.flatnonzero(is_leaf)]
+    nonzero = leaf_value != 0
+    integer_values = forest.value_scale != 1.0
+
+    internal = ~is_leaf
+    return {
+        'format': BUNDLE_FORMAT,
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'model_version': loaded.version,
+        'features': list(loaded.features),
+        'classes': loaded.crop_labels.tolist(),
+        'n_trees': forest.n_trees,
+        'value_scale': int(forest.value_scale) if integer_values else forest.value_scale,
+        'roots': refs[np.asarray(forest.roots)].tolist(),
+        'feature': np.asarray(forest.feature)[internal].astype(int).tolist(),
+        'threshold': np.asarray(forest.threshold)[internal].astype(np.float64).tolist(),
+        'left': refs[children[internal, 0]].tolist(),
+        'right': refs[children[internal, 1]].tolist(),
+        'missing_left': np.asarray(forest.missing_left)[internal].astype(int).tolist(),
+        'leaf_offsets': np.concatenate([[0], np.cumsum(nonzero.sum(axis=1))]).tolist(),
+        'leaf_classes': np.nonzero(nonzero)[1].tolist(),
+        'leaf_values': (leaf_value[nonzero].astype(int) if integer_values else leaf_value[nonzero]).tolist(),
+    }
+
+
+def bundle_bytes(bundle):
+    return json.dumps(bundle, separators=(',', ':')).encode()
+
+
+def bundle_checksum(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class BundleCache:
+    """
+    Serialized bundle (plain and gzipped) and checksum of the active model
+    version, built on first request and rebuilt when the version changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = None
+
+    def get(self, loaded):
+        entry = self._entry
+        if entry is None or entry[0] != loaded.version:
+            with self._lock:
+                entry = self._entry
+                if entry is None or entry[0] != loaded.version:
+                    data = bundle_bytes(build_bundle(loaded))
+                    entry = (loaded.version, data, gzip.compress(data, mtime=0), bundle_checksum(data))
+                    self._entry = entry
+        return entry[1:]
+
+
+bundle_cache = BundleCache()
+
+
+# Reference evaluator: plain Python, no NumPy, as a template for client ports
+
+def _float32(x):
+    return struct.unpack('f', struct.pack('f', x))[0]
+
+
+def bundle_predict_proba(bundle, row):
+    """
+    Class probabilities for one row (values in bundle['features'] order).
+    """
+    feature, threshold = bundle['feature'], bundle['threshold']
+    left, right, missing_left = bundle['left'], bundle['right'], bundle['missing_left']
+    offsets, leaf_classes, leaf_values = bundle['leaf_offsets'], bundle['leaf_classes'], bundle['leaf_values']
+    x = [_float32(float(v)) for v in row]
+
+    totals = [0.0] * len(bundle['classes'])
+    for node in bundle['roots']:
+        while node >= 0:
+            value = x[feature[node]]
+            if value != value:
+                node = left[node] if missing_left[node] else right[node]
+            else:
+                node = left[node] if value <= threshold[node] else right[node]
+        leaf = -node - 1
+        for i in range(offsets[leaf], offsets[leaf + 1]):
+            totals[leaf_classes[i]] += leaf_values[i]
+
+    scale = bundle['n_trees'] * bundle['value_scale']
+    return [total / scale for total in totals]
+
+
+def bundle_recommend(bundle, data, top_n=3):
+    """
+    Same result as core.predict.recommend_crop: [(crop, confidence %), ...].
+    Classes with equal probability are ordered by column.
+    """
+    probabilities = bundle_predict_proba(bundle, [data[field] for field in bundle['features']])
+    ranked = sorted(range(len(probabilities)), key=lambda i: -probabilities[i])[:top_n]
+    # Rounded like np.round(p * 100, 2)
+    return [(bundle['classes'][i], round(probabilities[i] * 100 * 100) / 100) for i in ranked]
@@ -0,0 +1,138 @@
+# core/climatology.py
+
+import datetime
+import functools
+import json
+import logging
+import math
+import os
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+META_NAME = 'meta.json'
+INDEX_NAME = 'index.npy'  # int32 (rows, cols): row of NORMALS_NAME for each grid cell, -1 where there is no data
+NORMALS_NAME = 'normals.npy'  # float32 (cells, 12, 3): per calendar month, FIELDS; NaN where unknown
+
+FIELDS = ('temperature', 'humidity', 'rainfall')  # °C mean, % mean, mm total per month
+
+
+class Climatology:
+    """
+    Monthly climate normals on a regular lat/lon grid, stored as .npy files
+    and memory-mapped, so every worker shares the pages and lookups cost
+    two array reads. The grid covers a bounding box; `index` maps each cell
+    to a row of `normals` (or -1), so only cells with data take space.
+    """
+
+    def __init__(self, meta, index, normals):
+        self.meta = meta
+        self.grid = meta['grid_degrees']
+        self.south = meta['south']
+        self.west = meta['west']
+        self.index = index
+        self.normals = normals
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, META_NAME)) as f:
+            meta = json.load(f)
+        index = np.load(os.path.join(directory, INDEX_NAME), mmap_mode='r')
+        normals = np.load(os.path.join(directory, NORMALS_NAME), mmap_mode='r')
+        return cls(meta, index, normals)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, INDEX_NAME), np.ascontiguousarray(self.index, dtype=np.int32))
+        np.save(os.path.join(directory, NORMALS_NAME), np.ascontiguousarray(self.normals, dtype=np.float32))
+        with open(os.path.join(directory, META_NAME), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    @classmethod
+    def from_points(cls, latitudes, longitudes, months, values, grid_degrees, **meta):
+        """
+        Builds the table from point normals: parallel arrays of coordinates,
+        calendar months (1-12) and (n, 3) FIELDS values. Points falling in
+        the same cell and month are averaged.
+        """
+        rows = np.floor(np.asarray(latitudes) / grid_degrees).astype(np.int64)
+        cols = np.floor(np.asarray(longitudes) / grid_degrees).astype(np.int64)
+        months = np.asarray(months, dtype=np.int64) - 1
+        values = np.asarray(values, dtype=np.float64)
+
+        south, west = int(rows.min()), int(cols.min())
+        shape = (int(rows.max()) - south + 1, int(cols.max()) - west + 1)
+        flat_cell = (rows - south) * shape[1] + (cols - west)
+        cells, cell_of_point = np.unique(flat_cell, return_inverse=True)
+
+        # Means per (cell, month, field) through one flat bincount per field
+        slot = cell_of_point * 12 + months
+        normals = np.full((len(cells) * 12, len(FIELDS)), np.nan)
+        for i in range(len(FIELDS)):
+            known = ~np.isnan(values[:, i])
+            totals = np.bincount(slot[known], weights=values[known, i], minlength=len(cells) * 12)
+            n = np.bincount(slot[known], minlength=len(cells) * 12)
+            normals[n > 0, i] = totals[n > 0] / n[n > 0]
+
+        index = np.full(shape[0] * shape[1], -1, dtype=np.int32)
+        index[cells] = np.arange(len(cells), dtype=np.int32)
+        meta = dict(meta, grid_degrees=grid_degrees, south=south * grid_degrees, west=west * grid_degrees,
+                    fields=list(FIELDS), cells=len(cells), points=len(values))
+        return cls(meta, index.reshape(shape), normals.reshape(len(cells), 12, len(FIELDS)).astype(np.float32))
+
+    def cell_normals(self, latitude, longitude):
+        """
+        The (12, 3) normals of the cell containing a point, or None.
+        """
+        row = math.floor(round((latitude - self.south) / self.grid, 9))
+        col = math.floor(round((longitude - self.west) / self.grid, 9))
+        if not (0 <= row < self.index.shape[0] and 0 <= col < self.index.shape[1]):
+            return None
+        i = self.index[row, col]
+        return None if i < 0 else self.normals[i]
+
+    def season(self, latitude, longitude, month, months=1):
+        """
+        Mean temperature and humidity, and total rainfall, over `months`
+        calendar months starting at `month`; None if the point has no data
+        for them. A month with unknown rainfall counts as the average of
+        the known ones.
+        """
+        normals = self.cell_normals(latitude, longitude)
+        if normals is None:
+            return None
+        window = normals[[(month - 1 + i) % 12 for i in range(months)]]
+        if np.isnan(window).all(axis=0).any():
+            return None
+        values = np.nanmean(window, axis=0)
+        values[FIELDS.index('rainfall')] *= months
+        return {field: round(float(value), 2) for field, value in zip(FIELDS, values)}
+
+
+@functools.lru_cache(maxsize=4)
+def _load(directory):
+    try:
+        return Climatology.load(directory)
+    except FileNotFoundError:
+        logger.info("No climatology table in %s; run build_climatology", directory)
+        return None
+
+
+def climatology():
+    """
+    The table in CLIMATOLOGY_DIR, or None if it hasn't been built.
+    """
+    return _load(settings.CLIMATOLOGY_DIR)
+
+
+def climate_normals(latitude, longitude, month=None):
+    """
+    Temperature, humidity and rainfall normals for the CLIMATOLOGY_SEASON_MONTHS
+    starting this month (or `month`), or None. Never touches the network.
+    """
+    table = climatology()
+    if table is None:
+        return None
+    return table.season(latitude, longitude, month or datetime.date.today().month, settings.CLIMATOLOGY_SEASON_MONTHS)
@@ -0,0 +1,123 @@
+# core/compact.py
+
+import numpy as np
+
+from .forest import CompiledForest
+
+# Leaf class fractions are stored as uint16 in units of 1 / VALUE_SCALE
+VALUE_SCALE = 65535
+
+
+def tree_probabilities(forest, X):
+    """
+    Class fractions predicted by every tree, shape (n_rows, n_trees, n_classes).
+    """
+    return forest.value[forest.apply(X)] / forest.value_scale
+
+
+def select_trees(forest, X, y, tolerance=0.005, min_trees=1):
+    """
+    The fewest trees (at least `min_trees`) whose average still scores within
+    `tolerance` of the whole forest's accuracy on (X, y). Trees are added
+    best-first by their own accuracy. Returns (tree indices, full accuracy,
+    reduced accuracy).
+    """
+    per_tree = tree_probabilities(forest, X)
+    column = np.searchsorted(forest.classes_, y)
+    full_accuracy = float((per_tree.sum(axis=1).argmax(axis=1) == column).mean())
+
+    tree_accuracy = (per_tree.argmax(axis=2) == column[:, None]).mean(axis=0)
+    order = np.argsort(-tree_accuracy, kind='stable')
+    cumulative = np.cumsum(per_tree[:, order], axis=1)
+    accuracies = (cumulative.argmax(axis=2) == column[:, None]).mean(axis=0)
+
+    k = int(np.argmax(accuracies >= full_accuracy - tolerance)) + 1
+    k = min(max(k, min_trees), forest.n_trees)
+    return np.sort(order[:k]), full_accuracy, float(accuracies[k - 1])
+
+
+def floor_float32(values):
+    """
+    Largest float32 <= each value. For any float32 x, x <= t holds exactly when
+    x <= floor_float32(t), so float32 thresholds give the same splits.
+    """
+    rounded = values.astype(np.float32)
+    too_high = rounded.astype(np.float64) > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+def compact_forest(forest, tree_ids=None):
+    """
+    Rebuilds `forest` from `tree_ids` with float32 thresholds, uint16 leaf
+    values and identical subtrees stored once. Leaves are numbered first so
+    `value` only holds leaf rows.
+    """
+    tree_ids = range(forest.n_trees) if tree_ids is None else tree_ids
+    threshold32 = floor_float32(np.asarray(forest.threshold))
+    value16 = np.rint(np.asarray(forest.value) / forest.value_scale * VALUE_SCALE).astype(np.uint16)
+    children = np.asarray(forest.children)
+
+    leaf_ids, leaf_values = {}, []
+    internal_ids, internal_nodes = {}, []
+    depth = 0
+    # References: leaf i -> i, internal node j -> -(j + 1); resolved once the leaf count is known
+    refs, depths = {}, {}
+
+    for t in tree_ids:
+        stack = [(int(forest.roots[t]), False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in refs:
+                continue
+            left, right = children[node]
+            if left == node:
+                key = value16[node].tobytes()
+                if key not in leaf_ids:
+                    leaf_ids[key] = len(leaf_values)
+                    leaf_values.append(value16[node])
+                refs[node], depths[node] = leaf_ids[key], 0
+            elif not expanded:
+                stack.append((node, True))
+                stack.append((int(right), False))
+                stack.append((int(left), False))
+            else:
+                key = (
+                    int(forest.feature[node]), threshold32[node].tobytes(),
+                    refs[int(left)], refs[int(right)], bool(forest.missing_left[node]),
+                )
+                if key not in internal_ids:
+                    internal_ids[key] = -(len(internal_nodes) + 1)
+                    internal_nodes.append(key)
+                refs[node] = internal_ids[key]
+                depths[node] = 1 + max(depths[int(left)], depths[int(right)])
+        depth = max(depth, depths[int(forest.roots[t])])
+
+    n_leaves = len(leaf_values)
+    n_nodes = n_leaves + len(internal_nodes)
+
+    def resolve(ref):
+        return ref if ref >= 0 else n_leaves - ref - 1
+
+    feature = np.zeros(n_nodes, dtype=np.uint8)
+    threshold = np.full(n_nodes, np.inf, dtype=np.float32)
+    node_children = np.repeat(np.arange(n_nodes, dtype=np.int32)[:, None], 2, axis=1)
+    missing_left = np.zeros(n_nodes, dtype=bool)
+    for j, (feat, thr, left, right, missing) in enumerate(internal_nodes):
+        node = n_leaves + j
+        feature[node] = feat
+        threshold[node] = np.frombuffer(thr, dtype=np.float32)[0]
+        node_children[node] = resolve(left), resolve(right)
+        missing_left[node] = missing
+
+    return CompiledForest(
+        feature=feature,
+        threshold=threshold,
+        children=np.ascontiguousarray(node_children),
+        missing_left=missing_left,
+        value=np.ascontiguousarray(np.array(leaf_values, dtype=np.uint16)),
+        roots=np.array([resolve(refs[int(forest.roots[t])]) for t in tree_ids], dtype=np.int32),
+        depth=depth,
+        classes=np.asarray(forest.classes_),
+        value_scale=VALUE_SCALE,
+    )
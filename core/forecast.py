@@ -0,0 +1,111 @@
+# core/forecast.py
+
+import numpy as np
+
+
+class ForecastRecord:
+    """
+    One city's 5 day / 3 hour OpenWeather forecast as parallel NumPy arrays.
+
+    Each index is one 3-hourly slot. `time` holds UTC timestamps and
+    descriptions and icons are stored as small integer codes into the
+    `descriptions` / `icons` vocabularies. The daily summary, the 5-day
+    averages and the 3-hourly view are all derived from this one record, so
+    they share a single cache entry and upstream call.
+    """
+
+    def __init__(self, time, temperature, humidity, wind_speed, rainfall, description_code, descriptions, icon_code, icons):
+        self.time = time
+        self.temperature = temperature
+        self.humidity = humidity
+        self.wind_speed = wind_speed
+        self.rainfall = rainfall
+        self.description_code = description_code
+        self.descriptions = descriptions
+        self.icon_code = icon_code
+        self.icons = icons
+
+    def __len__(self):
+        return len(self.time)
+
+    @classmethod
+    def from_api(cls, entries):
+        """
+        Builds the record from the `list` of an OpenWeather /forecast response.
+        """
+        descriptions, description_code = np.unique(
+            [e["weather"][0]["description"] for e in entries], return_inverse=True)
+        icons, icon_code = np.unique([e["weather"][0]["icon"] for e in entries], return_inverse=True)
+        return cls(
+            time=np.array([e["dt"] for e in entries], dtype='datetime64[s]'),
+            temperature=np.array([e["main"]["temp"] for e in entries], dtype=np.float64),
+            humidity=np.array([e["main"]["humidity"] for e in entries], dtype=np.uint8),
+            wind_speed=np.array([e["wind"]["speed"] for e in entries], dtype=np.float64),
+            rainfall=np.array([e.get("rain", {}).get("3h", 0.0) for e in entries], dtype=np.float64),
+            description_code=description_code.astype(np.int16),
+            descriptions=descriptions.tolist(),
+            icon_code=icon_code.astype(np.int16),
+            icons=icons.tolist(),
+        )
+
+    def entries(self):
+        """
+        The 3-hourly view: one dict per slot.
+        """
+        times = np.char.replace(np.datetime_as_string(self.time, unit='s'), 'T', ' ')
+        return [
+            {
+                "time": str(time),
+                "temp": float(temp),
+                "description": self.descriptions[description],
+                "humidity": int(humidity),
+                "wind_speed": float(wind_speed),
+                "rainfall": float(rainfall),
+                "icon": self.icons[icon],
+            }
+            for time, temp, description, humidity, wind_speed, rainfall, icon in zip(
+                times, self.temperature, self.description_code, self.humidity,
+                self.wind_speed, self.rainfall, self.icon_code,
+            )
+        ]
+
+    def daily(self):
+        """
+        Per-day average temperature and humidity, total rainfall, most
+        common description and the day's first icon.
+        """
+        days, first, day_index = np.unique(self.time.astype('datetime64[D]'), return_index=True, return_inverse=True)
+        counts = np.bincount(day_index, minlength=len(days))
+        avg_temp = np.bincount(day_index, weights=self.temperature, minlength=len(days)) / counts
+        avg_humidity = np.bincount(day_index, weights=self.humidity, minlength=len(days)) / counts
+        total_rainfall = np.bincount(day_index, weights=self.rainfall, minlength=len(days))
+
+        # Mode per day: count (day, description) pairs in one flat bincount; ties go to the first description
+        n_descriptions = len(self.descriptions)
+        pair_counts = np.bincount(day_index * n_descriptions + self.description_code,
+                                  minlength=len(days) * n_descriptions)
+        common = pair_counts.reshape(len(days), n_descriptions).argmax(axis=1)
+
+        return [
+            {
+                "date": str(day),
+                "average_temperature": round(float(temp), 1),
+                "average_humidity": round(float(humidity), 1),
+                "total_rainfall": round(float(rainfall), 1),
+                "description": self.descriptions[description],
+                "icon": self.icons[self.icon_code[i]],
+            }
+            for day, temp, humidity, rainfall, description, i in zip(
+                days, avg_temp, avg_humidity, total_rainfall, common, first,
+            )
+        ]
+
+    def averages(self):
+        """
+        Average temperature and humidity and total rainfall over the whole forecast.
+        """
+        return {
+            "temperature": float(self.temperature.mean()),
+            "humidity": float(self.humidity.mean()),
+            "rainfall": float(self.rainfall.sum()),  # Total over 5 days
+        }
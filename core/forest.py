@@ -0,0 +1,176 @@
+# core/forest.py
+
+import json
+import os
+
+import numpy as np
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+
+# Arrays written by CompiledForest.save(), one .npy file each
+ARRAY_NAMES = ['feature', 'threshold', 'children', 'missing_left', 'value', 'roots', 'classes_']
+
+
+def is_compilable(estimator):
+    """
+    Whether CompiledForest.from_sklearn() can flatten this estimator.
+    """
+    return isinstance(estimator, (RandomForestClassifier, ExtraTreesClassifier)) and estimator.n_outputs_ == 1
+
+
+class CompiledForest:
+    """
+    A trained tree ensemble flattened into contiguous node arrays.
+
+    Every tree lives in the same feature/threshold/children/value arrays and
+    `roots` holds the index of each tree's root node. `children` stores the
+    (left, right) pair of every node side by side. Leaves point back at
+    themselves with an infinite threshold, so all rows walk all trees together
+    for `depth` steps without any per-tree Python work.
+    """
+
+    def __init__(self, feature, threshold, children, missing_left, value, roots, depth, classes, value_scale=1.0):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.depth = int(depth)
+        self.classes_ = classes
+        # Leaf values may be stored as integers; value / value_scale gives the class fractions
+        self.value_scale = float(value_scale)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def left(self):
+        return self.children[:, 0]
+
+    @property
+    def right(self):
+        return self.children[:, 1]
+
+    @classmethod
+    def from_sklearn(cls, estimator):
+        """
+        Compiles a fitted RandomForestClassifier or ExtraTreesClassifier.
+        """
+        features, thresholds, children, missing, values, roots = [], [], [], [], [], []
+        offset = 0
+        depth = 0
+
+        for tree_estimator in estimator.estimators_:
+            tree = tree_estimator.tree_
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            children.append(np.stack([
+                np.where(is_leaf, nodes, tree.children_left) + offset,
+                np.where(is_leaf, nodes, tree.children_right) + offset,
+            ], axis=1))
+            missing.append(np.asarray(tree.missing_go_to_left, dtype=bool))
+
+            value = tree.value[:, 0, :]
+            totals = value.sum(axis=1, keepdims=True)
+            if not np.allclose(totals, 1.0):
+                # Pickles from scikit-learn < 1.4 store class counts, not fractions
+                value = value / np.where(totals == 0, 1.0, totals)
+            values.append(value)
+
+            roots.append(offset)
+            offset += tree.node_count
+            depth = max(depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            children=np.ascontiguousarray(np.concatenate(children), dtype=np.int32),
+            missing_left=np.ascontiguousarray(np.concatenate(missing)),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            depth=depth,
+            classes=np.asarray(estimator.classes_),
+        )
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'forest.json'), 'w') as f:
+            json.dump({
+                'depth': self.depth,
+                'n_trees': self.n_trees,
+                'n_nodes': self.n_nodes,
+                'value_scale': self.value_scale,
+            }, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Loads arrays written by save(). With mmap_mode='r' the node arrays stay
+        in the OS page cache and are shared by every worker that maps them.
+        """
+        with open(os.path.join(directory, 'forest.json')) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        return cls(
+            feature=arrays['feature'],
+            threshold=arrays['threshold'],
+            children=arrays['children'],
+            missing_left=arrays['missing_left'],
+            value=arrays['value'],
+            roots=arrays['roots'],
+            depth=meta['depth'],
+            classes=arrays['classes_'],
+            value_scale=meta.get('value_scale', 1.0),
+        )
+
+    def apply(self, X):
+        """
+        Leaf node reached by every row in every tree, shape (n_rows, n_trees).
+        """
+        # sklearn compares float32 features against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        has_nan = bool(np.isnan(X).any())
+        flat_X = X.ravel()
+        flat_children = self.children.reshape(-1)
+        row_offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(np.asarray(self.roots, dtype=np.int64), (len(X), self.n_trees)).copy()
+
+        for _ in range(self.depth):
+            x = flat_X[row_offsets + self.feature[nodes]]
+            go_right = x > self.threshold[nodes]
+            if has_nan:
+                go_right = np.where(np.isnan(x), ~self.missing_left[nodes], go_right)
+            nodes = flat_children[2 * nodes + go_right]
+        return nodes
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAY_NAMES)
+
+    def predict_proba(self, X, chunk_size=4096):
+        """
+        Mean class fractions over all trees. Rows are scored chunk_size at a
+        time so the (rows x trees) node matrix stays small for large batches.
+        """
+        X = np.asarray(X)
+        proba = np.zeros((len(X), self.value.shape[1]), dtype=np.float64)
+        for start in range(0, len(X), chunk_size):
+            leaves = self.apply(X[start:start + chunk_size])
+            chunk = proba[start:start + chunk_size]
+            # Accumulate tree by tree, in the same order as sklearn, so sums match bit for bit
+            for t in range(self.n_trees):
+                chunk += self.value[leaves[:, t]]
+        proba /= self.n_trees * self.value_scale
+        return proba
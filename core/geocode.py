@@ -0,0 +1,135 @@
+# core/geocode.py
+
+import csv
+import functools
+import math
+import os
+import re
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+from .text import split_words
+
+GAZETTEER_PATH = os.path.join(settings.BASE_DIR, 'data', 'gazetteer.csv')
+
+Place = namedtuple('Place', 'name admin1 country_code country latitude longitude population')
+
+# "lat, lon" in decimal degrees, for farmers who entered their farm's GPS position
+COORDINATES = re.compile(r'^\s*([-+]?\d{1,2}(?:\.\d+)?)\s*[,;\s]\s*([-+]?\d{1,3}(?:\.\d+)?)\s*$')
+
+# Words that only say what kind of place a qualifier is ("Oyo State", "Nakuru County")
+FILLER_WORDS = {'state', 'county', 'province', 'region', 'district', 'town', 'city', 'near', 'of', 'the'}
+
+
+class Gazetteer:
+    """
+    Offline place lookup over data/gazetteer.csv, so free-text farmer
+    locations ("ibadan, oyo", "Ibadan Nigeria", "Ibadan") resolve to the
+    same coordinates without a network call.
+    """
+
+    def __init__(self, places):
+        self.places = places
+        self._by_name = defaultdict(list)
+        for place, names in places:
+            for name in names:
+                self._by_name[' '.join(split_words(name))].append(place)
+        self._max_words = max((len(name.split()) for name in self._by_name), default=0)
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        with open(path, newline='', encoding='utf-8') as f:
+            places = []
+            for row in csv.DictReader(f):
+                place = Place(
+                    name=row['name'], admin1=row['admin1'], country_code=row['country_code'],
+                    country=row['country'], latitude=float(row['latitude']),
+                    longitude=float(row['longitude']), population=int(row['population'] or 0),
+                )
+                names = [row['name']] + [n for n in row['alternate_names'].split('|') if n]
+                places.append((place, names))
+        return cls(places)
+
+    @staticmethod
+    def _qualifies(place, rest):
+        """
+        How many of place's admin1, country name and country code appear in the leftover words.
+        """
+        text = f" {' '.join(rest)} "
+        return sum(
+            f" {' '.join(split_words(qualifier))} " in text
+            for qualifier in (place.admin1, place.country, place.country_code)
+        )
+
+    def lookup(self, text):
+        """
+        The Place a free-text location refers to, or None. The longest run of
+        words that names a place wins; the other words ("oyo", "nigeria")
+        pick between places of that name, then the most populous one wins.
+        """
+        words = split_words(text)
+        for n in range(min(self._max_words, len(words)), 0, -1):
+            best = None
+            for start in range(len(words) - n + 1):
+                candidates = self._by_name.get(' '.join(words[start:start + n]))
+                if not candidates:
+                    continue
+                rest = [w for w in words[:start] + words[start + n:] if w not in FILLER_WORDS]
+                for place in candidates:
+                    score = (self._qualifies(place, rest), place.population)
+                    if best is None or score > best[0]:
+                        best = (score, place)
+            if best is not None:
+                return best[1]
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def gazetteer():
+    return Gazetteer.load()
+
+
+@functools.lru_cache(maxsize=4096)
+def geocode(text):
+    """
+    Place for a free-text location (or "lat, lon") from the local gazetteer,
+    or None. A Place is returned as it is, so callers holding one (see
+    stored_place) can pass it wherever a location is expected.
+    """
+    if isinstance(text, Place):
+        return text
+    if not text or not text.strip():
+        return None
+    match = COORDINATES.match(text)
+    if match:
+        latitude, longitude = float(match[1]), float(match[2])
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            return Place(f"{latitude}, {longitude}", '', '', '', latitude, longitude, 0)
+        return None
+    return gazetteer().lookup(text)
+
+
+def stored_place(location, latitude, longitude):
+    """
+    A farmer's location as resolved when it was saved: a Place at the
+    stored coordinates, named as the farmer spelled it, or the location
+    text itself if it didn't resolve.
+    """
+    if latitude is None or longitude is None:
+        return location
+    return Place(location.strip(), '', '', '', latitude, longitude, 0)
+
+
+def grid_cell(latitude, longitude, size=None):
+    """
+    (row, column) of the WEATHER_GRID_DEGREES square containing a point.
+    Everything in one cell shares a weather cache entry.
+    """
+    size = size or settings.WEATHER_GRID_DEGREES
+    return math.floor(latitude / size), math.floor(longitude / size)
+
+
+def cell_center(cell, size=None):
+    size = size or settings.WEATHER_GRID_DEGREES
+    return round((cell[0] + 0.5) * size, 4), round((cell[1] + 0.5) * size, 4)
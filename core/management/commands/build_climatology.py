@@ -0,0 +1,79 @@
+import re
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.climatology import FIELDS, Climatology
+from core.geocode import cell_center
+from core.models import WeatherRollup
+
+CSV_COLUMNS = ['latitude', 'longitude', 'month', *FIELDS]
+CELL_KEY = re.compile(r'^cell:(-?\d+):(-?\d+)$')
+
+
+def observed_normals():
+    """
+    Monthly rollups of our own observations as point normals, one point per
+    weather grid cell and calendar month (averaged over the years we have).
+    """
+    rows = []
+    for location, period_start, temperature, humidity, rainfall in (
+        WeatherRollup.objects.filter(period=WeatherRollup.MONTH, location__startswith='cell:')
+        .values_list('location', 'period_start', 'temperature', 'humidity', 'rainfall').iterator()
+    ):
+        match = CELL_KEY.match(location)
+        if match:
+            latitude, longitude = cell_center((int(match[1]), int(match[2])))
+            rows.append((latitude, longitude, period_start.month, temperature, humidity, rainfall))
+    return pd.DataFrame(rows, columns=CSV_COLUMNS)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the climatology table (monthly temperature, humidity and rainfall normals per grid cell) "
+        "that crop predictions fall back to, from a CSV of point normals and/or our stored monthly "
+        "weather rollups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', action='append', default=[],
+                            help=f"CSV with columns {', '.join(CSV_COLUMNS)} (month 1-12, rainfall in mm per month), "
+                                 "e.g. station normals or a gridded WorldClim/CRU export. Repeatable.")
+        parser.add_argument('--from-observations', action='store_true',
+                            help="Also use the monthly WeatherRollup rows of grid-cell locations.")
+        parser.add_argument('--grid', type=float, default=settings.CLIMATOLOGY_GRID_DEGREES, help="Cell size in degrees.")
+        parser.add_argument('--output', default=settings.CLIMATOLOGY_DIR)
+
+    def handle(self, *args, **options):
+        frames = []
+        for path in options['csv']:
+            frame = pd.read_csv(path)
+            missing = set(CSV_COLUMNS) - set(frame.columns)
+            if missing:
+                raise CommandError(f"{path} is missing columns: {', '.join(sorted(missing))}")
+            frames.append(frame[CSV_COLUMNS])
+        if options['from_observations']:
+            frames.append(observed_normals())
+
+        points = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=CSV_COLUMNS)
+        if points.empty:
+            raise CommandError("No normals to build from; pass --csv and/or --from-observations.")
+        if not points['month'].between(1, 12).all():
+            raise CommandError("month must be 1-12.")
+
+        table = Climatology.from_points(
+            points['latitude'].to_numpy(), points['longitude'].to_numpy(), points['month'].to_numpy(),
+            points[list(FIELDS)].to_numpy(dtype=np.float64), options['grid'],
+            sources=options['csv'] + (['observations'] if options['from_observations'] else []),
+            built_at=timezone.now().isoformat(),
+        )
+        table.save(options['output'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {table.meta['cells']} cells ({table.index.shape[0]} x {table.index.shape[1]} grid, "
+            f"{options['grid']}°) from {len(points)} points to {options['output']}. "
+            "Restart workers to map the new table."
+        ))
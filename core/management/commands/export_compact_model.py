@@ -0,0 +1,130 @@
+import datetime
+import json
+import os
+import tempfile
+import time
+
+import joblib
+from django.core.management.base import BaseCommand, CommandError
+
+from core.compact import compact_forest, select_trees
+from core.forest import CompiledForest, is_compilable
+from core.model_registry import FEATURES, registry
+from core.training import DATA_PATH, load_dataset, train_validation_split
+
+from .train_crop_model import REPORTS_DIR
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(dirpath, name))
+        for dirpath, _, filenames in os.walk(path) for name in filenames
+    )
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the active crop model as a compact forest: fewest trees within an accuracy tolerance, "
+        "float32 thresholds, uint16 leaf values and shared identical subtrees. Reports size, load time "
+        "and accuracy against the current model, then publishes it as a new version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', default=DATA_PATH, help="Training CSV; its held-out 20% is the validation set.")
+        parser.add_argument('--tolerance', type=float, default=0.005,
+                            help="Max drop in validation accuracy allowed when dropping trees.")
+        parser.add_argument('--min-trees', type=int, default=20,
+                            help="Keep at least this many trees so rarely seen inputs still get smooth probabilities.")
+        parser.add_argument('--all-trees', action='store_true', help="Skip tree pruning, only compact the storage.")
+        parser.add_argument('--version-name', help="Version name for the export (default: UTC timestamp).")
+        parser.add_argument('--no-publish', action='store_true', help="Only print the report.")
+        parser.add_argument('--no-activate', action='store_true', help="Publish without switching CURRENT to it.")
+
+    def handle(self, *args, **options):
+        loaded = registry.get()
+        if loaded.compiled is not None:
+            source = loaded.compiled
+        elif loaded.has_sklearn_model and is_compilable(loaded.model):
+            source = CompiledForest.from_sklearn(loaded.model)
+        else:
+            raise CommandError(f"Model version {loaded.version} is not a random forest or extra trees model.")
+        if source.value_scale != 1.0:
+            raise CommandError(f"Model version {loaded.version} is already a compact export.")
+
+        X, labels = load_dataset(options['data'])
+        _, X_val, _, labels_val = train_validation_split(X, labels)
+        y_val = loaded.label_encoder.transform(labels_val)
+
+        if options['all_trees']:
+            tree_ids = list(range(source.n_trees))
+        else:
+            tree_ids, _, _ = select_trees(source, X_val, y_val, options['tolerance'], options['min_trees'])
+        compact = compact_forest(source, tree_ids)
+
+        source_pred = source.classes_[source.predict_proba(X_val).argmax(axis=1)]
+        compact_pred = compact.classes_[compact.predict_proba(X_val).argmax(axis=1)]
+
+        report = {
+            'source_version': loaded.version,
+            'tolerance': options['tolerance'],
+            'trees': [source.n_trees, compact.n_trees],
+            'nodes': [source.n_nodes, compact.n_nodes],
+            'array_kb': [round(source.nbytes() / 1024, 1), round(compact.nbytes() / 1024, 1)],
+            'validation_accuracy': [
+                round(float((source_pred == y_val).mean()), 4),
+                round(float((compact_pred == y_val).mean()), 4),
+            ],
+            'agreement_with_source': round(float((source_pred == compact_pred).mean()), 4),
+        }
+        report['accuracy_delta'] = round(report['validation_accuracy'][1] - report['validation_accuracy'][0], 4)
+
+        if loaded.has_sklearn_model:
+            pickle_path = loaded.path('model')
+            report['pickle_kb'] = round(os.path.getsize(pickle_path) / 1024, 1)
+            _, report['pickle_load_ms'] = timed(joblib.load, pickle_path)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            compact.save(tmp)
+            report['compact_kb'] = round(directory_size(tmp) / 1024, 1)
+            _, report['compact_load_ms'] = timed(CompiledForest.load, tmp, mmap_mode=None)
+        report['pickle_load_ms'] = round(report.get('pickle_load_ms', 0.0), 2)
+        report['compact_load_ms'] = round(report['compact_load_ms'], 2)
+
+        self.print_report(report)
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d-%H%M%S')
+        report_path = os.path.join(REPORTS_DIR, f'compact-{stamp}.json')
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"Report written to {report_path}")
+
+        if options['no_publish']:
+            return
+        version = registry.publish_forest(
+            compact, loaded.label_encoder, FEATURES,
+            version=options['version_name'], metrics=report, activate=not options['no_activate'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Published compact model version {version}."))
+
+    def print_report(self, report):
+        rows = [
+            ('trees', *report['trees']),
+            ('nodes', *report['nodes']),
+            ('in-memory arrays (KB)', *report['array_kb']),
+            ('on disk (KB)', report.get('pickle_kb', '-'), report['compact_kb']),
+            ('load time (ms)', report['pickle_load_ms'] or '-', report['compact_load_ms']),
+            ('validation accuracy', *report['validation_accuracy']),
+        ]
+        self.stdout.write(f"{'':<24}{report['source_version']:>16}{'compact':>16}")
+        for name, before, after in rows:
+            self.stdout.write(f"{name:<24}{before:>16}{after:>16}")
+        self.stdout.write(
+            f"Accuracy delta {report['accuracy_delta']:+}, "
+            f"top-1 agreement with {report['source_version']} {report['agreement_with_source']}"
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bundle import build_bundle, bundle_bytes, bundle_checksum
+from core.model_registry import registry
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the active crop model as a portable JSON bundle (see core/bundle.py), e.g. to ship it "
+        "inside a mobile app build. Prints the SHA-256 checksum, which is also the API's ETag."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the JSON file to write.")
+
+    def handle(self, *args, **options):
+        loaded = registry.get()
+        try:
+            data = bundle_bytes(build_bundle(loaded))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        with open(options['output'], 'wb') as f:
+            f.write(data)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote model version {loaded.version} to {options['output']} "
+            f"({len(data) / 1024:.1f} KB, sha256 {bundle_checksum(data)})."
+        ))
@@ -0,0 +1,57 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Farmer
+from core.weather import weather_place_key
+
+
+class Command(BaseCommand):
+    help = (
+        "Resolve every farmer's free-text location to coordinates with the local gazetteer "
+        "(data/gazetteer.csv) and list the spellings it could not resolve."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--unresolved', type=int, default=20, help="How many unresolved spellings to list.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        unresolved = Counter()
+        weather_keys = set()
+        spellings = set()
+        resolved = changed = 0
+
+        batch = []
+        farmers = Farmer.objects.only('id', 'location', 'latitude', 'longitude').iterator(chunk_size=batch_size)
+        for farmer in farmers:
+            before = (farmer.latitude, farmer.longitude)
+            place = farmer.geocode()
+            if farmer.location.strip():
+                spellings.add(farmer.location.strip().casefold())
+                weather_keys.add(weather_place_key(farmer.location))
+                if place is None:
+                    unresolved[farmer.location.strip()] += 1
+                else:
+                    resolved += 1
+            if (farmer.latitude, farmer.longitude) != before:
+                batch.append(farmer)
+            if len(batch) >= batch_size:
+                changed += self.write(batch)
+        changed += self.write(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resolved} farmers resolved, {sum(unresolved.values())} unresolved, {changed} updated. "
+            f"{len(spellings)} distinct spellings share {len(weather_keys)} weather cache keys."
+        ))
+        for location, count in unresolved.most_common(options['unresolved']):
+            self.stdout.write(f"  {count:>6}  {location}")
+
+    def write(self, batch):
+        with transaction.atomic():
+            Farmer.objects.bulk_update(batch, ['latitude', 'longitude'])
+        written = len(batch)
+        batch.clear()
+        return written
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from core.models import Farmer
+from core.weather import is_error, prefetch_weather, weather_expires_in, weather_place_key
+
+KINDS = ('current', 'forecast')
+
+
+class RateLimiter:
+    """
+    Spaces calls to wait() at least 60 / per_minute seconds apart across threads.
+    """
+
+    def __init__(self, per_minute):
+        self.interval = 60 / per_minute
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def farmer_locations():
+    """
+    Active-farmer locations that share a weather cache entry (same grid cell,
+    or same normalized name if not in the gazetteer) as (location, farmers),
+    most farmers first. `location` is the most common spelling among them.
+    """
+    farmers = Counter()
+    spellings = defaultdict(Counter)
+    rows = (
+        Farmer.objects.filter(user__is_active=True).exclude(location='')
+        .values('location').annotate(farmers=Count('id')).values_list('location', 'farmers')
+    )
+    for location, count in rows:
+        key = weather_place_key(location)
+        if key:
+            farmers[key] += count
+            spellings[key][location.strip()] += count
+    return [(spellings[key].most_common(1)[0][0], count) for key, count in farmers.most_common()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh cached current weather and forecasts for every active farmer location before they expire, "
+        "busiest locations first, so request-path reads hit the cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.WEATHER_PREFETCH_AHEAD,
+                            help="Refresh entries that expire within this many seconds.")
+        parser.add_argument('--concurrency', type=int, default=settings.WEATHER_PREFETCH_CONCURRENCY)
+        parser.add_argument('--rate', type=float, default=settings.WEATHER_PREFETCH_RATE,
+                            help="Max OpenWeather calls per minute.")
+        parser.add_argument('--max-calls', type=int, default=None,
+                            help="Stop after this many calls; the least shared locations are left out.")
+        parser.add_argument('--kind', choices=KINDS, action='append', help="Only refresh this kind (repeatable).")
+
+    def handle(self, *args, **options):
+        if isinstance(caches['default'], LocMemCache):
+            self.stderr.write(self.style.WARNING(
+                "The default cache is in-process (locmem), so nothing fetched here reaches the web workers. "
+                "Set CACHE_BACKEND to a shared cache (see CACHES in settings)."
+            ))
+        kinds = options['kind'] or KINDS
+        locations = farmer_locations()
+
+        due = []
+        for location, _ in locations:
+            for kind in kinds:
+                expires_in = weather_expires_in(kind, location)
+                if expires_in is None or expires_in < options['ahead']:
+                    due.append((kind, location))
+        fresh = len(locations) * len(kinds) - len(due)
+        over_budget = due[options['max_calls']:] if options['max_calls'] is not None else []
+        due = due[:len(due) - len(over_budget)]
+
+        limiter = RateLimiter(options['rate'])
+
+        def refresh(kind, location):
+            limiter.wait()
+            return prefetch_weather(kind, location)
+
+        results = Counter()
+        # Submitted busiest location first; the pool starts them in that order
+        with ThreadPoolExecutor(max_workers=options['concurrency'], thread_name_prefix='weather-prefetch') as pool:
+            futures = [pool.submit(refresh, kind, location) for kind, location in due]
+            for (kind, location), future in zip(due, futures):
+                value = future.result()
+                if value is None:
+                    results['in_flight'] += 1
+                elif is_error(value) and 'retry_after' in value:
+                    results['over_quota'] += 1
+                elif is_error(value):
+                    results['failed'] += 1
+                    self.stderr.write(f"{kind} weather for {location!r}: {value['error']}")
+                else:
+                    results['refreshed'] += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(locations)} locations: {results['refreshed']} entries refreshed, {results['failed']} failed, "
+            f"{results['in_flight']} already being fetched, {fresh} still fresh, "
+            f"{len(over_budget) + results['over_quota']} left for the next run (--max-calls or quota)."
+        ))
@@ -0,0 +1,48 @@
+import joblib
+from django.core.management.base import BaseCommand, CommandError
+
+from core.model_registry import FEATURES, registry
+
+
+class Command(BaseCommand):
+    help = "Publish a trained crop model as a new version under core/ml_models/ and make it active."
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', nargs='?', help="Path to a pickled model (joblib).")
+        parser.add_argument('label_encoder', nargs='?', help="Path to the pickled LabelEncoder (joblib).")
+        parser.add_argument('--version-name', help="Version name (default: UTC timestamp).")
+        parser.add_argument('--no-activate', action='store_true', help="Publish without switching CURRENT to it.")
+        parser.add_argument('--activate', dest='activate_version', help="Only switch CURRENT to an existing version.")
+        parser.add_argument('--list', action='store_true', help="List published versions.")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            active = registry.get().version
+            for version in registry.versions():
+                marker = '*' if version == active else ' '
+                self.stdout.write(f"{marker} {version}")
+            return
+
+        if options['activate_version']:
+            try:
+                registry.activate(options['activate_version'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Version {options['activate_version']} is now active."))
+            return
+
+        if not options['model'] or not options['label_encoder']:
+            raise CommandError("Both model and label_encoder paths are required.")
+
+        model = joblib.load(options['model'])
+        label_encoder = joblib.load(options['label_encoder'])
+        try:
+            version = registry.publish(
+                model, label_encoder, FEATURES,
+                version=options['version_name'],
+                activate=not options['no_activate'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"Published crop model version {version}."))
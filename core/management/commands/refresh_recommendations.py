@@ -0,0 +1,120 @@
+from itertools import islice
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from core.geocode import stored_place
+from core.models import CropRecommendation, Farmer, SoilTest
+from core.predict import FEATURES, get_model, iter_crop_recommendations
+from core.weather import get_prediction_weather, weather_place_key
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every active farmer's crop recommendation from their latest soil test and the weather "
+        "inputs the prediction endpoint would use for their location (cached weather adjusted by the "
+        "seasonal normals), scoring all farmers in one vectorized prediction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per database read and write batch.")
+        parser.add_argument('--top-n', type=int, default=3)
+        parser.add_argument('--fetch-missing-weather', action='store_true',
+                            help="Call OpenWeather for locations that are not cached (default: use their "
+                                 "climate normals, or skip those farmers without any).")
+        parser.add_argument('--weather-source', choices=['live', 'climatology'], default='live',
+                            help="'climatology' scores from the climate normals alone, without OpenWeather.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cached_only = not options['fetch_missing_weather']
+        weather_by_location = {}
+
+        latest_soil_test = SoilTest.objects.filter(user_id=OuterRef('user_id')).order_by('-test_date', '-id')
+        farmers = (
+            Farmer.objects.filter(user__is_active=True)
+            .annotate(soil_test_id=Subquery(latest_soil_test.values('id')[:1]))
+            .filter(soil_test_id__isnull=False)
+            .values_list('id', 'location', 'latitude', 'longitude', 'soil_test_id')
+            .iterator(chunk_size=batch_size)
+        )
+
+        farmer_ids, soil_test_ids, rows = [], [], []
+        skipped = 0
+        for chunk in chunked(farmers, batch_size):
+            soil = {
+                s['id']: s for s in SoilTest.objects.filter(id__in=[c[-1] for c in chunk])
+                .values('id', 'nitrogen', 'phosphorus', 'potassium', 'ph')
+            }
+            for farmer_id, location, latitude, longitude, soil_test_id in chunk:
+                place = stored_place(location, latitude, longitude)
+                key = weather_place_key(place)
+                if key not in weather_by_location:
+                    # The same inputs /predict-crop/ would use, so both paths agree for a farmer
+                    weather, source = (
+                        get_prediction_weather(place, source=options['weather_source'], cached_only=cached_only)
+                        if key else (None, None)
+                    )
+                    weather_by_location[key] = weather if source is not None else None
+                weather = weather_by_location[key]
+                if weather is None:
+                    skipped += 1
+                    continue
+
+                test = soil[soil_test_id]
+                values = {
+                    'N': test['nitrogen'], 'P': test['phosphorus'], 'K': test['potassium'], 'ph': test['ph'],
+                    'temperature': weather['temperature'], 'humidity': weather['humidity'],
+                    'rainfall': weather['rainfall'],
+                }
+                farmer_ids.append(farmer_id)
+                soil_test_ids.append(soil_test_id)
+                rows.append([values[f] for f in FEATURES])
+
+        if not rows:
+            self.stdout.write(f"No farmers to score ({skipped} skipped without weather).")
+            return
+
+        loaded = get_model()
+        matrix = np.array(rows, dtype=np.float64)
+        results = iter_crop_recommendations(matrix, options['top_n'], loaded)
+        now = timezone.now()
+
+        created = updated = 0
+        for start in range(0, len(farmer_ids), batch_size):
+            ids = farmer_ids[start:start + batch_size]
+            existing = {r.farmer_id: r for r in CropRecommendation.objects.filter(farmer_id__in=ids)}
+            to_create, to_update = [], []
+
+            for i, farmer_id in enumerate(ids, start):
+                recommend = next(results)
+                rec = existing.get(farmer_id) or CropRecommendation(farmer_id=farmer_id)
+                rec.soil_test_id = soil_test_ids[i]
+                rec.top_crop = recommend[0][0]
+                rec.crops = [[crop, confidence] for crop, confidence in recommend]
+                rec.inputs = dict(zip(FEATURES, rows[i]))
+                rec.model_version = loaded.version
+                rec.computed_at = now
+                (to_update if rec.pk else to_create).append(rec)
+
+            with transaction.atomic():
+                CropRecommendation.objects.bulk_create(to_create)
+                CropRecommendation.objects.bulk_update(
+                    to_update, ['soil_test', 'top_crop', 'crops', 'inputs', 'model_version', 'computed_at']
+                )
+            created += len(to_create)
+            updated += len(to_update)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {len(farmer_ids)} farmers with model {loaded.version}: "
+            f"{created} created, {updated} updated, {skipped} skipped without weather."
+        ))
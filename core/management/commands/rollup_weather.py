@@ -0,0 +1,33 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.observations import observations, prune, rollup_days, rollup_months
+
+
+class Command(BaseCommand):
+    help = (
+        "Downsample stored weather observations to daily rollups and daily to monthly rollups, "
+        "then delete raw observations and daily rollups past their retention."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help="Recompute the daily rollups of this many recent days (default: today and yesterday).")
+        parser.add_argument('--full', action='store_true', help="Recompute every day that still has raw observations.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        observations.flush()
+
+        today = timezone.localdate()
+        since = datetime.date.min if options['full'] else today - datetime.timedelta(days=options['days'] - 1)
+        earliest = rollup_days(since, options['batch_size'])
+        months = rollup_months(earliest) if earliest else 0
+        raw, daily = prune()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Daily rollups from {earliest or 'nothing'}, {months} monthly rollups updated; "
+            f"pruned {raw} observations and {daily} daily rollups."
+        ))
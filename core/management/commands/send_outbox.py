@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.outbox import drain, purge_sent
+
+
+class Command(BaseCommand):
+    help = (
+        "Send the queued emails in the outbox in batches over one SMTP connection, retrying failures "
+        "with backoff and dead-lettering those that keep failing. With --watch, keep polling."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.EMAIL_OUTBOX_BATCH,
+                            help="Emails claimed and sent per batch (default: EMAIL_OUTBOX_BATCH).")
+        parser.add_argument('--watch', action='store_true', help="Keep running, draining the outbox every --interval.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between polls with --watch.")
+
+    def handle(self, *args, **options):
+        while True:
+            counts = drain(options['batch_size'])
+            purged = purge_sent()
+            if any(counts.values()) or purged or not options['watch']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Sent {counts['sent']}, {counts['retrying']} to retry, {counts['dead']} dead-lettered; "
+                    f"purged {purged} old sent emails."
+                ))
+            if not options['watch']:
+                return
+            time.sleep(options['interval'])
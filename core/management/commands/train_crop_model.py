@@ -0,0 +1,167 @@
+import datetime
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from sklearn.ensemble import ExtraTreesClassifier, HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+from core.forest import CompiledForest, is_compilable
+from core.model_registry import FEATURES, MODELS_DIR, registry
+from core.training import DATA_PATH, load_dataset, train_validation_split
+
+REPORTS_DIR = os.path.join(MODELS_DIR, 'reports')
+
+# (family, params) pairs searched by default; --quick keeps the first of each family
+CANDIDATES = (
+    [('random_forest', {'n_estimators': n, 'max_depth': d}) for n in (25, 50, 100, 200) for d in (None, 12)]
+    + [('extra_trees', {'n_estimators': n, 'max_depth': d}) for n in (25, 50, 100, 200) for d in (None, 12)]
+    + [('hist_gradient_boosting', {'max_iter': n, 'max_depth': d}) for n in (100, 200) for d in (None, 6)]
+    + [('knn', {'n_neighbors': k}) for k in (3, 5, 9)]
+)
+
+
+def build_estimator(family, params, random_state=42):
+    if family == 'random_forest':
+        return RandomForestClassifier(random_state=random_state, n_jobs=1, **params)
+    if family == 'extra_trees':
+        return ExtraTreesClassifier(random_state=random_state, n_jobs=1, **params)
+    if family == 'hist_gradient_boosting':
+        return HistGradientBoostingClassifier(random_state=random_state, **params)
+    if family == 'knn':
+        return make_pipeline(StandardScaler(), KNeighborsClassifier(**params))
+    raise ValueError(f"Unknown model family {family}.")
+
+
+def cross_validate_candidate(family, params, X, y, folds):
+    """
+    Runs in a worker process: cross-validated accuracy on the training split.
+    """
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    scores = cross_val_score(build_estimator(family, params), X, y, cv=cv, n_jobs=1)
+    return float(scores.mean()), float(scores.std())
+
+
+def serving_engine(estimator):
+    """
+    The engine core.predict would use for this estimator once published:
+    publish() writes forest arrays for every compilable one.
+    """
+    if is_compilable(estimator):
+        return CompiledForest.from_sklearn(estimator)
+    return estimator
+
+
+def measure_latency(predict_proba, X, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict_proba(X)
+        timings.append(time.perf_counter() - start)
+    return float(np.percentile(timings, 50) * 1000), float(np.percentile(timings, 99) * 1000)
+
+
+class Command(BaseCommand):
+    help = (
+        "Cross-validate RandomForest, ExtraTrees, HistGradientBoosting and kNN crop models in parallel, "
+        "report accuracy vs. size vs. latency, and publish the most accurate model within the latency budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', default=DATA_PATH, help="Training CSV (default: data/Crop_recommendation.csv).")
+        parser.add_argument('--folds', type=int, default=5)
+        parser.add_argument('--jobs', type=int, default=os.cpu_count(), help="Worker processes for cross-validation.")
+        parser.add_argument('--latency-budget-ms', type=float, default=settings.CROP_MODEL_LATENCY_BUDGET_MS,
+                            help="Max single-row p99 latency of the winner.")
+        parser.add_argument('--quick', action='store_true', help="Only try one configuration per model family.")
+        parser.add_argument('--no-publish', action='store_true', help="Write the report but don't publish the winner.")
+
+    def handle(self, *args, **options):
+        X, labels = load_dataset(options['data'])
+        label_encoder = LabelEncoder()
+        y = label_encoder.fit_transform(labels)
+        X_train, X_test, y_train, y_test = train_validation_split(X, y)
+
+        candidates = CANDIDATES
+        if options['quick']:
+            seen = set()
+            candidates = [c for c in CANDIDATES if not (c[0] in seen or seen.add(c[0]))]
+
+        self.stdout.write(f"Cross-validating {len(candidates)} candidates on {options['jobs']} processes...")
+        with ProcessPoolExecutor(max_workers=options['jobs']) as pool:
+            futures = [
+                pool.submit(cross_validate_candidate, family, params, X_train, y_train, options['folds'])
+                for family, params in candidates
+            ]
+            cv_results = [f.result() for f in futures]
+
+        # Size and latency are measured here, one model at a time, so timings aren't skewed by the pool
+        single_row = X_test[:1]
+        batch = X_test[np.arange(1000) % len(X_test)]
+        results = []
+        for (family, params), (cv_mean, cv_std) in zip(candidates, cv_results):
+            estimator = build_estimator(family, params).fit(X_train, y_train)
+            engine = serving_engine(estimator)
+            buffer = io.BytesIO()
+            joblib.dump(estimator, buffer)
+            single_p50, single_p99 = measure_latency(engine.predict_proba, single_row, repeats=200)
+            batch_p50, _ = measure_latency(engine.predict_proba, batch, repeats=10)
+            results.append({
+                'family': family,
+                'params': params,
+                'cv_accuracy': round(cv_mean, 4),
+                'cv_std': round(cv_std, 4),
+                'test_accuracy': round(float((estimator.predict(X_test) == y_test).mean()), 4),
+                'size_kb': round(len(buffer.getvalue()) / 1024, 1),
+                'single_row_p50_ms': round(single_p50, 3),
+                'single_row_p99_ms': round(single_p99, 3),
+                'batch_1000_ms': round(batch_p50, 3),
+                'engine': type(engine).__name__,
+            })
+
+        budget = options['latency_budget_ms']
+        eligible = [r for r in results if r['single_row_p99_ms'] <= budget]
+        if not eligible:
+            self.write_report(results, None, budget)
+            raise CommandError(f"No candidate meets the {budget} ms single-row latency budget.")
+        winner = max(eligible, key=lambda r: (r['cv_accuracy'], -r['size_kb'], -r['single_row_p99_ms']))
+        report_path = self.write_report(results, winner, budget)
+        self.stdout.write(f"Report written to {report_path}")
+
+        if options['no_publish']:
+            return
+
+        # Fit on the training split only, so the held-out 20% stays usable for export_compact_model
+        model = build_estimator(winner['family'], winner['params']).fit(X_train, y_train)
+        version = registry.publish(model, label_encoder, FEATURES, metrics=winner)
+        self.stdout.write(self.style.SUCCESS(
+            f"Published {winner['family']} {winner['params']} as version {version} "
+            f"(cv accuracy {winner['cv_accuracy']}, p99 {winner['single_row_p99_ms']} ms)."
+        ))
+
+    def write_report(self, results, winner, budget):
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(REPORTS_DIR, f'train-{stamp}.json')
+        with open(path, 'w') as f:
+            json.dump({'latency_budget_ms': budget, 'winner': winner, 'candidates': results}, f, indent=2)
+
+        header = f"{'model':<24}{'params':<36}{'cv acc':>8}{'test':>8}{'KB':>10}{'p50 ms':>9}{'p99 ms':>9}{'1000 rows ms':>14}"
+        self.stdout.write(header)
+        for r in sorted(results, key=lambda r: -r['cv_accuracy']):
+            marker = ' *' if r is winner else ''
+            params = ', '.join(f'{k}={v}' for k, v in r['params'].items())
+            self.stdout.write(
+                f"{r['family']:<24}{params:<36}{r['cv_accuracy']:>8}{r['test_accuracy']:>8}{r['size_kb']:>10}"
+                f"{r['single_row_p50_ms']:>9}{r['single_row_p99_ms']:>9}{r['batch_1000_ms']:>14}{marker}"
+            )
+        return path
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 02:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_remove_agronomist_language_remove_farmer_language'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CropRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('top_crop', models.CharField(max_length=50)),
+                ('crops', models.JSONField(help_text='Ranked [crop, confidence %] pairs')),
+                ('inputs', models.JSONField(help_text='Soil and weather values the prediction used')),
+                ('model_version', models.CharField(max_length=64)),
+                ('computed_at', models.DateTimeField()),
+                ('farmer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='crop_recommendation', to='core.farmer')),
+                ('soil_test', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.soiltest')),
+            ],
+            options={
+                'verbose_name': 'Crop Recommendation',
+                'verbose_name_plural': 'Crop Recommendations',
+            },
+        ),
+    ]
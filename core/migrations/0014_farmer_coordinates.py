@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_croprecommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farmer',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmer',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
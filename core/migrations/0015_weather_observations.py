@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_farmer_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=255)),
+                ('observed_at', models.DateTimeField()),
+                ('temperature', models.FloatField()),
+                ('humidity', models.FloatField()),
+                ('wind_speed', models.FloatField()),
+                ('rainfall', models.FloatField(help_text='mm in the hour before the reading')),
+                ('description', models.CharField(blank=True, max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Weather Observation',
+                'verbose_name_plural': 'Weather Observations',
+                'indexes': [models.Index(fields=['location', 'observed_at'], name='weather_obs_location_time')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WeatherRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=255)),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('temperature', models.FloatField(help_text='Mean')),
+                ('temperature_min', models.FloatField()),
+                ('temperature_max', models.FloatField()),
+                ('humidity', models.FloatField(help_text='Mean')),
+                ('rainfall', models.FloatField(help_text='Estimated mm over the period')),
+                ('samples', models.PositiveIntegerField(help_text='Observations behind the row')),
+            ],
+            options={
+                'verbose_name': 'Weather Rollup',
+                'verbose_name_plural': 'Weather Rollups',
+                'constraints': [models.UniqueConstraint(fields=('location', 'period', 'period_start'), name='weather_rollup_unique_period')],
+            },
+        ),
+    ]
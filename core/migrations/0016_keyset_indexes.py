@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 02:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_weather_observations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='farmer',
+            index=models.Index(fields=['created_at', 'id'], name='farmer_created_id_idx'),
+        ),
+    ]
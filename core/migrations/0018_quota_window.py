@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_outbox_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('window_start', models.BigIntegerField(help_text='Unix time the window starts at')),
+                ('used', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Quota Window',
+                'verbose_name_plural': 'Quota Windows',
+                'constraints': [models.UniqueConstraint(fields=('name', 'window_start'), name='quota_window_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,292 @@
+# core/model_registry.py
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import signal
+import threading
+import time
+
+import joblib
+from django.conf import settings
+
+from .forest import CompiledForest, is_compilable
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, 'ml_models')
+
+MANIFEST_NAME = 'manifest.json'
+CURRENT_NAME = 'CURRENT'  # Text file holding the active version name
+LEGACY_VERSION = 'legacy'  # Flat crop_recommendation_model.pkl / label_encoder.pkl layout
+
+# Column order the model was trained on (see data/Crop_recommendation.csv)
+FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LoadedModel:
+    """
+    One published model version: the label encoder, the compiled forest (if
+    the model is a tree ensemble) and, loaded on first use, the sklearn model.
+    Predictions come from the compiled forest whenever the version ships one:
+    its arrays are memory-mapped, so every worker shares the same pages,
+    where an unpickled sklearn forest is a private copy in each worker.
+    Instances are never mutated after loading, so requests holding one keep
+    working while the registry swaps in a newer version.
+    """
+
+    def __init__(self, version, manifest, directory):
+        self.version = version
+        self.manifest = manifest
+        self.directory = directory
+        self.features = manifest['features']
+
+        self.label_encoder = joblib.load(self.path('label_encoder'))
+        self._model = None
+        self._model_lock = threading.Lock()
+
+        self.compiled = None
+        if manifest.get('forest'):
+            self.compiled = CompiledForest.load(self.path('forest'), mmap_mode='r')
+        elif settings.CROP_MODEL_ENGINE == 'compiled' and is_compilable(self.model):
+            self.compiled = CompiledForest.from_sklearn(self.model)
+
+        classes = self.compiled.classes_ if self.compiled is not None else self.model.classes_
+        # Crop name for each predict_proba column
+        self.crop_labels = self.label_encoder.inverse_transform(classes)
+
+    def path(self, key):
+        return os.path.join(self.directory, self.manifest[key])
+
+    @property
+    def has_sklearn_model(self):
+        return 'model' in self.manifest
+
+    @property
+    def model(self):
+        if not self.has_sklearn_model:
+            raise ValueError(f"Model version {self.version} is a compact export with no sklearn model.")
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    # Not shared between workers: sklearn trees copy their node arrays when unpickled
+                    self._model = joblib.load(self.path('model'))
+        return self._model
+
+    def predict_proba(self, matrix):
+        if self.compiled is not None:
+            return self.compiled.predict_proba(matrix)
+        return self.model.predict_proba(matrix)
+
+
+class ModelRegistry:
+    """
+    Versioned crop models under core/ml_models/<version>/, each with a manifest.
+
+    The active version is named in core/ml_models/CURRENT. Models load lazily
+    on first use; after that the registry re-checks CURRENT every
+    CROP_MODEL_WATCH_INTERVAL seconds (or straight away after the reload
+    signal) and swaps in the new version once it has fully loaded. Requests
+    already running keep the version they started with.
+    """
+
+    def __init__(self, root=MODELS_DIR):
+        self.root = root
+        self._current = None
+        self._current_marker = None
+        self._load_lock = threading.Lock()
+        self._last_check = 0.0
+        self._reload_requested = False
+
+    # -- reading -------------------------------------------------------
+
+    def get(self):
+        current = self._current
+        if current is None:
+            with self._load_lock:
+                if self._current is None:
+                    self._reload_requested = False  # The first load reads CURRENT anyway
+                    self._swap(*self._read_active())
+                return self._current
+
+        if self._reload_requested or time.monotonic() - self._last_check >= settings.CROP_MODEL_WATCH_INTERVAL:
+            self._maybe_reload()
+        return self._current
+
+    def request_reload(self, *args):
+        """
+        Signal-safe: only flags the registry, the next get() does the work.
+        """
+        self._reload_requested = True
+
+    def _marker(self):
+        path = os.path.join(self.root, CURRENT_NAME)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _read_active(self):
+        marker = self._marker()
+        if marker is not None:
+            with open(os.path.join(self.root, CURRENT_NAME)) as f:
+                version = f.read().strip()
+            return self._load_version(version), marker
+        return self._load_legacy(), marker
+
+    def _maybe_reload(self):
+        # Only one thread reloads; everyone else carries on with the current model
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = time.monotonic()
+            forced, self._reload_requested = self._reload_requested, False
+            marker = self._marker()
+            if not forced and marker == self._current_marker:
+                return
+            try:
+                self._swap(*self._read_active())
+            except Exception:
+                logger.exception("Failed to load crop model, keeping version %s", self._current.version)
+                self._current_marker = marker  # Don't retry a broken publish on every request
+        finally:
+            self._load_lock.release()
+
+    def _swap(self, loaded, marker):
+        if self._current is None or loaded.version != self._current.version:
+            logger.info("Crop model version %s is now active", loaded.version)
+        self._current = loaded
+        self._current_marker = marker
+        self._last_check = time.monotonic()
+
+    def _load_version(self, version):
+        directory = os.path.join(self.root, version)
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+
+        for name, expected in manifest.get('sha256', {}).items():
+            if file_sha256(os.path.join(directory, name)) != expected:
+                raise ValueError(f"Checksum mismatch for {name} in model version {version}.")
+        return LoadedModel(version, manifest, directory)
+
+    def _load_legacy(self):
+        manifest = {
+            'version': LEGACY_VERSION,
+            'features': FEATURES,
+            'model': 'crop_recommendation_model.pkl',
+            'label_encoder': 'label_encoder.pkl',
+        }
+        return LoadedModel(LEGACY_VERSION, manifest, self.root)
+
+    def versions(self):
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isfile(os.path.join(self.root, name, MANIFEST_NAME))
+        )
+
+    # -- publishing ----------------------------------------------------
+
+    def publish(self, model, label_encoder, features, version=None, metrics=None, activate=True):
+        """
+        Publishes a fitted sklearn model. Tree ensembles also get their
+        CompiledForest arrays written alongside the pickle.
+        """
+        def write(staging, manifest):
+            manifest['format'] = 'sklearn'
+            manifest['estimator'] = type(model).__name__
+            manifest['model'] = 'model.joblib'
+            joblib.dump(model, os.path.join(staging, manifest['model']), compress=0)
+            if is_compilable(model):
+                CompiledForest.from_sklearn(model).save(os.path.join(staging, 'forest'))
+                manifest['forest'] = 'forest'
+
+        return self._publish(write, label_encoder, features, version, metrics, activate)
+
+    def publish_forest(self, forest, label_encoder, features, version=None, metrics=None, activate=True):
+        """
+        Publishes a CompiledForest on its own (e.g. a compact export), with no sklearn pickle.
+        """
+        def write(staging, manifest):
+            manifest['format'] = 'compact'
+            manifest['forest'] = 'forest'
+            forest.save(os.path.join(staging, 'forest'))
+
+        return self._publish(write, label_encoder, features, version, metrics, activate)
+
+    def _publish(self, write, label_encoder, features, version, metrics, activate):
+        """
+        Writes a new version directory and, if activate is set, points CURRENT at it.
+        The directory is built under a temporary name and renamed into place, and
+        CURRENT is replaced atomically, so readers never see a half-written version.
+        """
+        version = version or datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d-%H%M%S')
+        directory = os.path.join(self.root, version)
+        if os.path.exists(directory):
+            raise ValueError(f"Model version {version} already exists.")
+
+        staging = os.path.join(self.root, f'.{version}.tmp')
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        manifest = {
+            'version': version,
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'features': list(features),
+            'label_encoder': 'label_encoder.joblib',
+            'metrics': metrics or {},
+        }
+        joblib.dump(label_encoder, os.path.join(staging, manifest['label_encoder']), compress=0)
+        write(staging, manifest)
+
+        manifest['sha256'] = {}
+        for dirpath, _, filenames in os.walk(staging):
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                manifest['sha256'][os.path.relpath(path, staging)] = file_sha256(path)
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(staging, directory)
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version):
+        if not os.path.isfile(os.path.join(self.root, version, MANIFEST_NAME)):
+            raise ValueError(f"Unknown model version {version}.")
+        tmp_path = os.path.join(self.root, f'.{CURRENT_NAME}.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(version + '\n')
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_NAME))
+        self.request_reload()
+
+
+registry = ModelRegistry()
+
+
+def install_reload_signal():
+    """
+    Reload the active model when the process receives CROP_MODEL_RELOAD_SIGNAL,
+    e.g. `kill -USR2 <worker pid>`.
+    """
+    name = settings.CROP_MODEL_RELOAD_SIGNAL
+    if not name or not hasattr(signal, name):
+        return
+    try:
+        signal.signal(getattr(signal, name), registry.request_reload)
+    except ValueError:
+        # Not the main thread (e.g. some dev servers); file watching still works
+        pass
@@ -1,9 +1,11 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from PIL import Image
 from django.core.exceptions import ValidationError
 import os
 from accounts.models import CustomUser
+from .geocode import geocode, stored_place
 
 
 def user_profile_picture_path(instance, filename):
@@ -53,6 +55,9 @@ class ProfileImageMixin(models.Model):
 class Farmer(ProfileImageMixin):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     location = models.CharField(max_length=255, blank=True)
+    # Resolved from `location` with the local gazetteer on save; null if it couldn't be resolved
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
     farm_size = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     # language = models.CharField(max_length=5, choices=LANGUAGE_CHOICES, default='en')
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
@@ -60,10 +65,31 @@ class Farmer(ProfileImageMixin):
     class Meta:
         verbose_name = "Farmer"
         verbose_name_plural = "Farmers"
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='farmer_created_id_idx'),  # Keyset pages
+        ]
 
     def __str__(self):
         return f"Farmer: {self.user.get_full_name() or self.user.email}"
 
+    def geocode(self):
+        place = geocode(self.location)
+        self.latitude, self.longitude = (place.latitude, place.longitude) if place else (None, None)
+        return place
+
+    def weather_location(self):
+        """
+        What to look this farmer's weather up by: the stored coordinates if the location resolved.
+        """
+        return stored_place(self.location, self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        self.geocode()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'location' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'latitude', 'longitude'}
+        super().save(*args, **kwargs)
+
 
 class Agronomist(ProfileImageMixin):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -90,3 +116,131 @@ class SoilTest(models.Model):
 
     def __str__(self):
         return f"SoilTest by {self.user.email} on {self.test_date}"
+
+
+class CropRecommendation(models.Model):
+    """
+    A farmer's current crop recommendation, precomputed in bulk by the
+    refresh_recommendations command so the API can serve it with one lookup.
+    """
+    farmer = models.OneToOneField(Farmer, on_delete=models.CASCADE, related_name='crop_recommendation')
+    soil_test = models.ForeignKey(SoilTest, on_delete=models.SET_NULL, null=True, blank=True)
+    top_crop = models.CharField(max_length=50)
+    crops = models.JSONField(help_text="Ranked [crop, confidence %] pairs")
+    inputs = models.JSONField(help_text="Soil and weather values the prediction used")
+    model_version = models.CharField(max_length=64)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Crop Recommendation"
+        verbose_name_plural = "Crop Recommendations"
+
+    def __str__(self):
+        return f"{self.top_crop} for {self.farmer}"
+
+
+class WeatherObservation(models.Model):
+    """
+    One current-weather reading as fetched from OpenWeather, appended in
+    bulk by core.observations. `location` is the weather cache's place key
+    (grid cell or hash of the normalized name), so every farmer sharing a
+    cache entry shares its history. Kept WEATHER_OBSERVATION_RETENTION_DAYS, after which
+    only the daily rollups remain.
+    """
+    location = models.CharField(max_length=255)
+    observed_at = models.DateTimeField()
+    temperature = models.FloatField()
+    humidity = models.FloatField()
+    wind_speed = models.FloatField()
+    rainfall = models.FloatField(help_text="mm in the hour before the reading")
+    description = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        verbose_name = "Weather Observation"
+        verbose_name_plural = "Weather Observations"
+        indexes = [models.Index(fields=['location', 'observed_at'], name='weather_obs_location_time')]
+
+    def __str__(self):
+        return f"{self.location} at {self.observed_at:%Y-%m-%d %H:%M}"
+
+
+class WeatherRollup(models.Model):
+    """
+    Observations downsampled to one row per location and day or month by
+    the rollup_weather command.
+    """
+    DAY = 'day'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(DAY, 'Day'), (MONTH, 'Month')]
+
+    location = models.CharField(max_length=255)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    temperature = models.FloatField(help_text="Mean")
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    humidity = models.FloatField(help_text="Mean")
+    rainfall = models.FloatField(help_text="Estimated mm over the period")
+    samples = models.PositiveIntegerField(help_text="Observations behind the row")
+
+    class Meta:
+        verbose_name = "Weather Rollup"
+        verbose_name_plural = "Weather Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'period', 'period_start'], name='weather_rollup_unique_period'),
+        ]
+
+    def __str__(self):
+        return f"{self.location} {self.period} {self.period_start}"
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be sent by the send_outbox worker. Written in the
+    same transaction as whatever caused it (core.outbox.enqueue_email), so
+    a rolled-back request sends nothing and a committed one is never lost
+    to a slow or failing SMTP server.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENDING, 'Sending'), (SENT, 'Sent'), (DEAD, 'Dead')]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, help_text="Blank for DEFAULT_FROM_EMAIL")
+    to = models.JSONField(help_text="List of recipient addresses")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text="Not tried again before this")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outbox Email"
+        verbose_name_plural = "Outbox Emails"
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_due_idx')]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
+
+
+class QuotaWindow(models.Model):
+    """
+    Calls spent in one window of a core.quota.QuotaBudget, when budgets are
+    counted in the database (WEATHER_QUOTA_DATABASE). A budget deletes its
+    older windows as each new one starts.
+    """
+    name = models.CharField(max_length=50)
+    window_start = models.BigIntegerField(help_text="Unix time the window starts at")
+    used = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Quota Window"
+        verbose_name_plural = "Quota Windows"
+        constraints = [models.UniqueConstraint(fields=['name', 'window_start'], name='quota_window_unique')]
+
+    def __str__(self):
+        return f"{self.name} from {self.window_start}: {self.used} calls"
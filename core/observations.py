@@ -0,0 +1,237 @@
+# core/observations.py
+
+import atexit
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Avg, Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import WeatherObservation, WeatherRollup
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FIELDS = ['temperature', 'temperature_min', 'temperature_max', 'humidity', 'rainfall', 'samples']
+
+
+class ObservationBuffer:
+    """
+    Collects current-weather readings in memory and appends them with one
+    bulk_create per WEATHER_OBSERVATION_BATCH rows, or once the oldest has
+    waited WEATHER_OBSERVATION_FLUSH_SECONDS. Writes happen on a background
+    thread, so neither a request nor an event loop waits on the insert.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = []
+        self._oldest = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='weather-observations')
+
+    def record(self, location, weather):
+        row = WeatherObservation(
+            location=location,
+            observed_at=timezone.now(),
+            temperature=weather['temperature'],
+            humidity=weather['humidity'],
+            wind_speed=weather['wind_speed'],
+            rainfall=weather['rainfall'],
+            description=weather['description'][:100],
+        )
+        with self._lock:
+            self._rows.append(row)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = (len(self._rows) >= settings.WEATHER_OBSERVATION_BATCH
+                   or time.monotonic() - self._oldest >= settings.WEATHER_OBSERVATION_FLUSH_SECONDS)
+        if due:
+            self._writer.submit(self._flush_in_background)
+
+    def _flush_in_background(self):
+        # The writer thread's connection outlives every request, so recycle it the way a request would
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def flush(self):
+        """
+        Writes everything buffered so far; returns the number of rows.
+        """
+        with self._lock:
+            rows, self._rows, self._oldest = self._rows, [], None
+        if not rows:
+            return 0
+        try:
+            WeatherObservation.objects.bulk_create(rows)
+        except DatabaseError:
+            logger.exception("Dropped %s weather observations", len(rows))
+            return 0
+        return len(rows)
+
+    def flush_at_exit(self):
+        # At interpreter exit the database may be gone or never configured; log instead of a traceback on stderr
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not write weather observations at exit")
+
+    def pending(self):
+        with self._lock:
+            return len(self._rows)
+
+
+observations = ObservationBuffer()
+atexit.register(observations.flush_at_exit)
+
+
+def daily_from_observations(queryset):
+    """
+    Per (location, day) aggregates of raw observations. Readings carry the
+    last hour's rain, so a day's rainfall is their mean times 24.
+    """
+    rows = (
+        queryset.annotate(day=TruncDate('observed_at')).values('location', 'day')
+        .annotate(
+            mean_temperature=Avg('temperature'), low=Min('temperature'), high=Max('temperature'),
+            mean_humidity=Avg('humidity'), rain_per_hour=Avg('rainfall'), count=Count('id'),
+        )
+        .order_by('location', 'day')
+    )
+    for row in rows:
+        yield {
+            'location': row['location'], 'day': row['day'],
+            'temperature': row['mean_temperature'], 'temperature_min': row['low'], 'temperature_max': row['high'],
+            'humidity': row['mean_humidity'], 'rainfall': row['rain_per_hour'] * 24, 'samples': row['count'],
+        }
+
+
+def _upsert(rollups):
+    WeatherRollup.objects.bulk_create(
+        rollups, update_conflicts=True,
+        unique_fields=['location', 'period', 'period_start'], update_fields=ROLLUP_FIELDS,
+    )
+
+
+def raw_cutoff():
+    """
+    Start of the oldest day raw observations are kept for.
+    """
+    today = timezone.localdate()
+    start = today - datetime.timedelta(days=settings.WEATHER_OBSERVATION_RETENTION_DAYS)
+    return timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))
+
+
+def rollup_days(since, batch_size=1000):
+    """
+    (Re)computes the daily rollups of every day from `since` (a date) on
+    from the raw observations. Returns the earliest day written, or None.
+    """
+    since = max(since, timezone.localdate(raw_cutoff()))  # Older days have no complete raw data left
+    start = timezone.make_aware(datetime.datetime.combine(since, datetime.time.min))
+    earliest, batch = None, []
+    for row in daily_from_observations(WeatherObservation.objects.filter(observed_at__gte=start)):
+        earliest = min(earliest or row['day'], row['day'])
+        batch.append(WeatherRollup(
+            location=row['location'], period=WeatherRollup.DAY, period_start=row['day'],
+            **{field: row[field] for field in ROLLUP_FIELDS},
+        ))
+        if len(batch) >= batch_size:
+            _upsert(batch)
+            batch = []
+    if batch:
+        _upsert(batch)
+    return earliest
+
+
+def rollup_months(since):
+    """
+    (Re)computes the monthly rollups from the daily ones, for every month
+    from the one containing `since` on. Means are weighted by sample count.
+    """
+    rows = (
+        WeatherRollup.objects.filter(period=WeatherRollup.DAY, period_start__gte=since.replace(day=1))
+        .annotate(month=TruncMonth('period_start')).values('location', 'month')
+        .annotate(
+            weighted_temperature=Sum(F('temperature') * F('samples')), low=Min('temperature_min'),
+            high=Max('temperature_max'), weighted_humidity=Sum(F('humidity') * F('samples')),
+            total_rainfall=Sum('rainfall'), count=Sum('samples'),
+        )
+        .order_by()
+    )
+    rollups = [
+        WeatherRollup(
+            location=row['location'], period=WeatherRollup.MONTH, period_start=row['month'],
+            temperature=row['weighted_temperature'] / row['count'],
+            temperature_min=row['low'], temperature_max=row['high'],
+            humidity=row['weighted_humidity'] / row['count'],
+            rainfall=row['total_rainfall'], samples=row['count'],
+        )
+        for row in rows
+    ]
+    _upsert(rollups)
+    return len(rollups)
+
+
+def prune():
+    """
+    Deletes raw observations past WEATHER_OBSERVATION_RETENTION_DAYS and
+    daily rollups past WEATHER_DAILY_ROLLUP_RETENTION_DAYS. Monthly rollups
+    are kept. Returns (raw, daily) rows deleted.
+    """
+    daily_cutoff = timezone.localdate() - datetime.timedelta(days=settings.WEATHER_DAILY_ROLLUP_RETENTION_DAYS)
+    with transaction.atomic():
+        raw, _ = WeatherObservation.objects.filter(observed_at__lt=raw_cutoff()).delete()
+        daily, _ = WeatherRollup.objects.filter(period=WeatherRollup.DAY, period_start__lt=daily_cutoff).delete()
+    return raw, daily
+
+
+def weather_history(location, days=30):
+    """
+    Daily weather for a place key over the last `days` days (today
+    included), answered from the database only: raw observations for the
+    days still kept, daily rollups for the older ones.
+    """
+    start = timezone.localdate() - datetime.timedelta(days=days - 1)
+    cutoff = raw_cutoff()
+
+    daily = {
+        rollup.period_start: {field: getattr(rollup, field) for field in ROLLUP_FIELDS}
+        for rollup in WeatherRollup.objects.filter(
+            location=location, period=WeatherRollup.DAY,
+            period_start__gte=start, period_start__lt=timezone.localdate(cutoff),
+        )
+    }
+    raw = WeatherObservation.objects.filter(
+        location=location,
+        observed_at__gte=max(cutoff, timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))),
+    )
+    for row in daily_from_observations(raw):
+        daily[row['day']] = {field: row[field] for field in ROLLUP_FIELDS}
+
+    samples = sum(day['samples'] for day in daily.values())
+    return {
+        "days": len(daily),
+        "temperature": sum(d['temperature'] * d['samples'] for d in daily.values()) / samples if samples else None,
+        "humidity": sum(d['humidity'] * d['samples'] for d in daily.values()) / samples if samples else None,
+        "rainfall": sum(d['rainfall'] for d in daily.values()),
+        "daily": [
+            {
+                "date": day.isoformat(),
+                "temperature": round(values['temperature'], 1),
+                "temperature_min": values['temperature_min'],
+                "temperature_max": values['temperature_max'],
+                "humidity": round(values['humidity'], 1),
+                "rainfall": round(values['rainfall'], 1),
+                "samples": values['samples'],
+            }
+            for day, values in sorted(daily.items())
+        ],
+    }
@@ -0,0 +1,304 @@
+# core/openweather.py
+
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .quota import QuotaBudget
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Transport failures worth retrying on the async client (httpx 0.13 raises httpcore exceptions for these)
+ASYNC_RETRY_ERRORS = (
+    httpx.NetworkError, httpx.ProtocolError, httpx.ConnectTimeout, httpx.ReadTimeout,
+    httpx.WriteTimeout, httpx.PoolTimeout, httpx.HTTPError,
+)
+
+
+class WeatherUnavailable(requests.RequestException):
+    """
+    OpenWeather could not be reached, kept failing, or the circuit breaker is open.
+    """
+    retry_after = None
+
+
+class QuotaExhausted(WeatherUnavailable):
+    """
+    This minute's OpenWeather call budget (for the caller's priority) is used up.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and then rejects
+    calls for `cooldown` seconds. After that one trial call is let through
+    (half-open): success closes the breaker, failure opens it again. A
+    trial that ends with neither must call release_trial().
+    """
+    TRIAL = 'trial'  # What allow() returns to the half-open trial call (also true)
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.short_circuited = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return self.TRIAL
+            self.short_circuited += 1
+            return False
+
+    def release_trial(self):
+        """
+        The trial call ended without reaching OpenWeather (over quota,
+        cancelled); the next call may try instead.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("OpenWeather circuit breaker opened after %s failures", self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class OpenWeatherClient:
+    """
+    Shared HTTP client for OpenWeather: one pooled keep-alive Session per
+    process, (connect, read) timeouts, a few retries with jittered
+    exponential backoff, and a circuit breaker so a failing upstream costs
+    callers nothing until it has had time to recover. Settings are read on
+    every call unless given here.
+
+    `aget` is the asyncio equivalent on a pooled httpx.AsyncClient (one per
+    event loop). Both share the breaker and counters.
+
+    Every attempt, retries included, is charged to the shared per-minute
+    QuotaBudget at the caller's priority (see core.quota.quota_priority);
+    when it is used up the call fails fast with QuotaExhausted.
+    """
+
+    def __init__(self, base_url=None, timeout=None, max_retries=None, backoff=None, breaker=None, quota=None):
+        self._base_url = base_url
+        self._timeout = timeout
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=settings.WEATHER_BREAKER_FAILURES,
+            cooldown=settings.WEATHER_BREAKER_COOLDOWN,
+        )
+        self.quota = quota or QuotaBudget('openweather')
+        self._session = None
+        self._pid = None
+        self._session_lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+        self._over_quota = 0
+
+    @property
+    def session(self):
+        # Sockets must not be shared with a parent process, so each forked worker gets its own pool
+        if self._session is None or self._pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.WEATHER_POOL_SIZE)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session, self._pid = session, os.getpid()
+        return self._session
+
+    @property
+    def async_client(self):
+        # httpx connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            connect, read = self._setting(self._timeout, 'WEATHER_TIMEOUT')
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect_timeout=connect),
+                pool_limits=httpx.PoolLimits(
+                    max_keepalive=settings.WEATHER_POOL_SIZE,
+                    max_connections=settings.WEATHER_ASYNC_MAX_CONNECTIONS,
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def _setting(self, value, name):
+        return value if value is not None else getattr(settings, name)
+
+    def _prepare(self, path, params):
+        url = f"{self._setting(self._base_url, 'OPENWEATHER_BASE_URL').rstrip('/')}/{path}"
+        return url, dict(params, appid=settings.OPENWEATHER_API_KEY)
+
+    @contextlib.contextmanager
+    def _through_breaker(self):
+        """
+        Lets a call through the circuit breaker, or raises WeatherUnavailable.
+        A half-open trial that leaves without recording a success or failure
+        (QuotaExhausted, cancellation) is handed back, or the breaker would
+        wait for it forever.
+        """
+        allowed = self.breaker.allow()
+        if not allowed:
+            raise WeatherUnavailable("OpenWeather is unavailable (circuit open).")
+        try:
+            yield
+        finally:
+            if allowed == CircuitBreaker.TRIAL and self.breaker.state == 'half_open':
+                self.breaker.release_trial()
+
+    def _schedule(self):
+        """
+        Yields (attempt, delay before it): full jitter, so workers that failed together don't retry together.
+        """
+        max_retries = self._setting(self._max_retries, 'WEATHER_MAX_RETRIES')
+        backoff = self._setting(self._backoff, 'WEATHER_RETRY_BACKOFF')
+        for attempt in range(max_retries + 1):
+            yield attempt, random.uniform(0, backoff * 2 ** (attempt - 1)) if attempt else 0
+
+    def _charge(self, attempt, granted):
+        if not granted:
+            with self._stats_lock:
+                self._over_quota += 1
+            raise QuotaExhausted("OpenWeather call budget is used up.", self.quota.retry_after())
+        with self._stats_lock:
+            self._requests += 1
+            self._retries += bool(attempt)
+
+    def _attempts(self):
+        """
+        _schedule(), with each attempt charged to the quota first.
+        """
+        for attempt, delay in self._schedule():
+            self._charge(attempt, self.quota.acquire())
+            yield attempt, delay
+
+    async def _aattempts(self):
+        for attempt, delay in self._schedule():
+            self._charge(attempt, await self.quota.aacquire())
+            yield attempt, delay
+
+    def _give_up(self, attempts, error):
+        with self._stats_lock:
+            self._failures += 1
+        self.breaker.record_failure()
+        return WeatherUnavailable(f"OpenWeather request failed after {attempts} attempts: {error}")
+
+    def get(self, path, params):
+        """
+        GET {base_url}/{path} with the API key added. Returns the response
+        (including 4xx ones, which aren't retried) or raises WeatherUnavailable.
+        """
+        url, params = self._prepare(path, params)
+        timeout = self._setting(self._timeout, 'WEATHER_TIMEOUT')
+
+        with self._through_breaker():
+            for attempt, delay in self._attempts():
+                if delay:
+                    time.sleep(delay)
+                try:
+                    response = self.session.get(url, params=params, timeout=timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                    continue
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                if response.status_code == 429:
+                    self.quota.exhaust()
+                error = requests.HTTPError(f"OpenWeather returned {response.status_code}", response=response)
+
+            raise self._give_up(attempt + 1, error)
+
+    async def aget(self, path, params):
+        """
+        Async version of get(); the response is an httpx.Response.
+        """
+        url, params = self._prepare(path, params)
+
+        with self._through_breaker():
+            async for attempt, delay in self._aattempts():
+                if delay:
+                    await asyncio.sleep(delay)
+                try:
+                    response = await self.async_client.get(url, params=params)
+                except ASYNC_RETRY_ERRORS as e:
+                    error = e
+                    continue
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                if response.status_code == 429:
+                    await self.quota.aexhaust()
+                error = f"OpenWeather returned {response.status_code}"
+
+            raise self._give_up(attempt + 1, error)
+
+    def stats(self):
+        quota = self.quota.stats()
+        with self._stats_lock:
+            return {
+                'requests': self._requests,
+                'retries': self._retries,
+                'failures': self._failures,
+                'over_quota': self._over_quota,
+                'breaker': self.breaker.state,
+                'short_circuited': self.breaker.short_circuited,
+                'quota': quota,
+            }
+
+
+weather_client = OpenWeatherClient()
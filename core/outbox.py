@@ -0,0 +1,154 @@
+# core/outbox.py
+
+import datetime
+import logging
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(subject, body, to, from_email=None):
+    """
+    Queues an email for the send_outbox worker instead of sending it now.
+    Call it inside the transaction that makes the email true (the new
+    user, the new message) so the two commit or roll back together.
+    """
+    return OutboxEmail.objects.create(subject=subject, body=body, to=list(to), from_email=from_email or '')
+
+
+def retry_delay(attempts):
+    """
+    Seconds before another try after `attempts` failed ones: doubling from
+    EMAIL_OUTBOX_RETRY_SECONDS, capped at EMAIL_OUTBOX_MAX_RETRY_SECONDS.
+    """
+    return min(settings.EMAIL_OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_MAX_RETRY_SECONDS)
+
+
+def claim(batch_size):
+    """
+    Takes up to `batch_size` due emails for this worker and counts the
+    attempt. The claim lasts EMAIL_OUTBOX_LEASE_SECONDS: if the worker dies
+    mid-batch its emails fall due again. Rows another worker has locked are
+    skipped (Postgres; SQLite has a single writer anyway).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[OutboxEmail.PENDING, OutboxEmail.SENDING], next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        OutboxEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            status=OutboxEmail.SENDING, attempts=F('attempts') + 1,
+            next_attempt_at=now + datetime.timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS),
+        )
+    for email in emails:
+        email.attempts += 1
+    return emails
+
+
+def is_permanent(exc):
+    """
+    Whether a send failure will fail the same way on every retry: the server
+    answered 5xx (for every recipient, when it refused them). Anything else
+    (a 4xx, a dropped connection) may pass later.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in exc.recipients.values()]
+        return bool(codes) and all(500 <= code < 600 for code in codes)
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 500 <= exc.smtp_code < 600
+    return False
+
+
+def _send(connection, emails):
+    """
+    Sends each email over the open `connection`; returns {id: (error, permanent)} for those that failed.
+    """
+    failures = {}
+    for email in emails:
+        message = EmailMessage(email.subject, email.body, email.from_email or None, email.to, connection=connection)
+        try:
+            connection.send_messages([message])
+        except Exception as exc:
+            failures[email.id] = (f"{type(exc).__name__}: {exc}", is_permanent(exc))
+            if isinstance(exc, smtplib.SMTPRecipientsRefused):
+                continue  # Refused at RCPT; the session is still good
+            # The server may have dropped us; start the rest of the batch on a fresh connection
+            connection.close()
+            try:
+                connection.open()
+            except Exception:
+                logger.warning("Could not reopen the email connection", exc_info=True)
+    return failures
+
+
+def _record(emails, failures):
+    now = timezone.now()
+    for email in emails:
+        if email.id not in failures:
+            email.status, email.sent_at, email.last_error = OutboxEmail.SENT, now, ''
+            continue
+        email.last_error, permanent = failures[email.id]
+        if permanent or email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            email.status = OutboxEmail.DEAD
+            logger.error("Gave up on outbox email %s after %s attempts: %s", email.id, email.attempts, email.last_error)
+        else:
+            email.status = OutboxEmail.PENDING
+            email.next_attempt_at = now + datetime.timedelta(seconds=retry_delay(email.attempts))
+    OutboxEmail.objects.bulk_update(emails, ['status', 'sent_at', 'last_error', 'next_attempt_at'])
+
+
+def drain(batch_size=None, max_batches=None):
+    """
+    Sends due emails, a batch at a time, over one SMTP connection for the
+    whole run, until none are due (or `max_batches`). Failures are retried
+    with backoff and dead-lettered after EMAIL_OUTBOX_MAX_ATTEMPTS, or at
+    once when the server rejects the email for good (a 5xx answer).
+    Returns counts of sent, retrying and dead emails.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH
+    counts = {'sent': 0, 'retrying': 0, 'dead': 0}
+    connection, batches = None, 0
+    try:
+        while max_batches is None or batches < max_batches:
+            emails = claim(batch_size)
+            if not emails:
+                break
+            batches += 1
+            connection = connection or get_connection()
+            try:
+                connection.open()  # A no-op while the connection is up
+            except Exception as exc:
+                unreachable = f"{type(exc).__name__}: {exc}"
+                failures = {email.id: (unreachable, False) for email in emails}
+            else:
+                unreachable, failures = None, _send(connection, emails)
+            _record(emails, failures)
+            for email in emails:
+                key = {OutboxEmail.SENT: 'sent', OutboxEmail.DEAD: 'dead'}.get(email.status, 'retrying')
+                counts[key] += 1
+            if unreachable:
+                logger.warning("Email server unreachable, stopping: %s", unreachable)
+                break
+    finally:
+        if connection is not None:
+            connection.close()
+    return counts
+
+
+def purge_sent():
+    """
+    Deletes sent emails older than EMAIL_OUTBOX_KEEP_SENT_DAYS. Dead ones are kept for inspection.
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=settings.EMAIL_OUTBOX_KEEP_SENT_DAYS)
+    deleted, _ = OutboxEmail.objects.filter(status=OutboxEmail.SENT, sent_at__lt=cutoff).delete()
+    return deleted
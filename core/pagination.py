@@ -1,6 +1,154 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
 
-class FarmerPagination(PageNumberPagination):
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on (ordering field, id): a page is read as "the
+    next page_size rows after the last one seen", which an index on
+    (field, id) answers with one range scan however deep the page is, and
+    without the COUNT(*) of numbered pages. DRF's CursorPagination keys on
+    the field alone plus an offset for ties; the id makes every position
+    unique instead.
+
+    Rows with a NULL ordering field come last.
+    """
+    ordering = '-created_at'  # One field; id breaks ties in the same direction
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.field = queryset.model._meta.get_field(self.ordering.lstrip('-'))
+        self.reverse, position = self.decode_cursor(request)
+
+        rows = list(self._after(queryset, position)[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+        return self.page
+
+    def _after(self, queryset, position):
+        """
+        queryset in scan order (display order, or its opposite for a
+        previous page), starting after `position`.
+        """
+        name = self.field.name
+        descending = self.ordering.startswith('-') != self.reverse
+        nulls_first = self.reverse  # NULLs are last in display order
+        if self.field.null:
+            nulls = {'nulls_first': True} if nulls_first else {'nulls_last': True}
+            key = F(name).desc(**nulls) if descending else F(name).asc(**nulls)
+        else:
+            key = f"-{name}" if descending else name
+        queryset = queryset.order_by(key, '-pk' if descending else 'pk')
+        if position is None:
+            return queryset
+
+        value, pk = position
+        beyond = 'lt' if descending else 'gt'
+        if value is None:
+            condition = Q(**{f'{name}__isnull': True, f'pk__{beyond}': pk})
+            if nulls_first:
+                condition |= Q(**{f'{name}__isnull': False})
+        else:
+            # The redundant leading bound is what lets the database seek the index instead of scanning it
+            condition = Q(**{f'{name}__{beyond}e': value}) & (
+                Q(**{f'{name}__{beyond}': value}) | Q(**{f'pk__{beyond}': pk})
+            )
+            if self.field.null and not nulls_first:
+                condition |= Q(**{f'{name}__isnull': True})
+        return queryset.filter(condition)
+
+    def decode_cursor(self, request):
+        """
+        (reverse, (value, pk) or None) from the request's cursor.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None
+        try:
+            reverse, value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return bool(reverse), (self.field.to_python(value), int(pk))
+        except (TypeError, ValueError, UnicodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, reverse, row):
+        position = [int(reverse), self.field.value_to_string(row) or None, row.pk]
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+
+class KeysetOrPageNumberPagination(KeysetPagination):
+    """
+    Keyset pages by default; ?page=N switches to numbered pages with a
+    count, for the web admin's page links.
+    """
+    page_query_param = 'page'
+
+    def use_page_numbers(self, request):
+        return self.page_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.numbered = None
+        if not self.use_page_numbers(request):
+            return super().paginate_queryset(queryset, request, view)
+        self.numbered = PageNumberPagination()
+        self.numbered.page_size = self.page_size
+        self.numbered.page_size_query_param = self.page_size_query_param
+        self.numbered.max_page_size = self.max_page_size
+        if not queryset.ordered:
+            queryset = queryset.order_by(self.ordering, '-pk' if self.ordering.startswith('-') else 'pk')
+        return self.numbered.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.numbered:
+            return self.numbered.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.numbered:
+            return self.numbered.get_html_context()
+        return super().get_html_context()
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [{
+            'name': self.page_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Page number; switches to numbered pages with a total count',
+            'schema': {'type': 'integer'},
+        }]
+
+
+class FarmerPagination(KeysetOrPageNumberPagination):
     page_size = 10  # Adjust based on frontend layout (e.g., 8 or 12 for card grids)
     page_size_query_param = 'page_size'
     max_page_size = 100
@@ -1,31 +1,157 @@
 # core/predict.py
 
 import numpy as np
-import joblib
-import os
 from django.conf import settings
+from .model_registry import FEATURES, registry
+from .prediction_cache import PredictionCache
+from .batching import MicroBatcher
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, 'ml_models', 'crop_recommendation_model.pkl')
-ENCODER_PATH = os.path.join(BASE_DIR, 'ml_models', 'label_encoder.pkl')
+# Repeat soil profiles skip the forest; see CROP_PREDICTION_CACHE_* settings
+prediction_cache = PredictionCache(
+    max_size=settings.CROP_PREDICTION_CACHE_SIZE,
+    ttl=settings.CROP_PREDICTION_CACHE_TTL,
+    precision=settings.CROP_PREDICTION_CACHE_PRECISION,
+)
+
+
+def get_model():
+    """
+    The active model version. Hold on to the returned object for the whole
+    request so probabilities and labels come from the same version.
+    """
+    return registry.get()
+
+
+def build_feature_matrix(rows):
+    """
+    Turns a list of feature dicts into an N x 7 float matrix in FEATURES order.
+    Raises ValueError naming the first bad row, including NaN or infinite
+    values, which the forest would otherwise fail on (or silently misroute).
+    """
+    matrix = np.empty((len(rows), len(FEATURES)), dtype=np.float64)
+    for i, row in enumerate(rows):
+        try:
+            matrix[i] = [float(row[field]) for field in FEATURES]
+        except KeyError as e:
+            raise ValueError(f"Row {i}: missing field {e.args[0]}.")
+        except (TypeError, ValueError):
+            raise ValueError(f"Row {i}: all of {', '.join(FEATURES)} must be numbers.")
+    finite = np.isfinite(matrix).all(axis=1)
+    if not finite.all():
+        raise ValueError(f"Row {int(np.argmin(finite))}: all of {', '.join(FEATURES)} must be finite numbers.")
+    return matrix
+
+
+def top_n_indices(probabilities, top_n):
+    """
+    Class indices of the top_n probabilities of every row, best first.
+    Uses argpartition over the whole matrix so only top_n columns get sorted.
+    """
+    top_n = min(top_n, probabilities.shape[1])
+    candidates = np.argpartition(probabilities, -top_n, axis=1)[:, -top_n:]
+    candidate_probs = np.take_along_axis(probabilities, candidates, axis=1)
+    order = np.argsort(-candidate_probs, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def format_recommendations(probabilities, crop_labels, top_n=3):
+    """
+    Yields one [(crop, prob), ...] list per row of a predict_proba matrix.
+    """
+    top_indices = top_n_indices(probabilities, top_n)
+    top_probs = np.round(np.take_along_axis(probabilities, top_indices, axis=1) * 100, 2)
+    top_crops = crop_labels[top_indices]
+
+    for crops, probs in zip(top_crops, top_probs):
+        yield list(zip(crops.tolist(), probs.tolist()))
+
+
+def iter_crop_recommendations(matrix, top_n=3, loaded=None):
+    """
+    Scores an N x 7 matrix with a single predict_proba call and yields
+    one [(crop, prob), ...] list per row, in input order.
+    """
+    if len(matrix) == 0:
+        return
+    loaded = loaded or get_model()
+    yield from format_recommendations(loaded.predict_proba(matrix), loaded.crop_labels, top_n)
+
+
+def recommend_crops_batch(rows, top_n=3):
+    return list(iter_crop_recommendations(build_feature_matrix(rows), top_n))
+
+
+SWEEP_AXES = ('temperature', 'humidity', 'rainfall')
+
+
+def build_sweep_matrix(fixed, axes):
+    """
+    Builds the full grid over SWEEP_AXES as one matrix in FEATURES order.
+    `fixed` holds N, P, K and ph; `axes` maps each sweep axis to a
+    (start, stop, steps) triple. Rows run in C order over SWEEP_AXES, so the
+    last axis (rainfall) varies fastest. Returns (matrix, {axis: values}).
+    """
+    values = {name: np.linspace(*axes[name]) for name in SWEEP_AXES}
+    grid = np.meshgrid(*values.values(), indexing='ij')
+
+    matrix = np.empty((grid[0].size, len(FEATURES)), dtype=np.float64)
+    for column, field in enumerate(FEATURES):
+        if field in values:
+            matrix[:, column] = grid[SWEEP_AXES.index(field)].ravel()
+        else:
+            matrix[:, column] = float(fixed[field])
+    return matrix, values
+
+
+def sweep_crops(fixed, axes):
+    """
+    Scores a whole what-if grid with one predict_proba call. Returns
+    (loaded model, {axis: values}, top class index per cell, top probability
+    per cell in percent).
+    """
+    matrix, values = build_sweep_matrix(fixed, axes)
+    loaded = get_model()
+    probabilities = loaded.predict_proba(matrix)
+    # Same ranking as recommend_crop, so each cell's crop matches its top single prediction
+    top = top_n_indices(probabilities, 1)[:, 0]
+    confidence = np.round(probabilities[np.arange(len(top)), top] * 100, 2)
+    return loaded, values, top, confidence
+
+
+def _score_batch(matrix):
+    loaded = get_model()
+    return loaded, loaded.predict_proba(matrix)
+
+
+# Concurrent single-row callers share one predict_proba call; see CROP_MICRO_BATCH_* settings
+micro_batcher = MicroBatcher(
+    _score_batch,
+    max_batch_size=settings.CROP_MICRO_BATCH_MAX_SIZE,
+    max_wait=settings.CROP_MICRO_BATCH_MAX_WAIT_MS / 1000,
+)
+
+
+def _score_one(matrix, top_n):
+    if settings.CROP_MICRO_BATCH_ENABLED:
+        loaded, probabilities = micro_batcher.submit(matrix[0])
+        return loaded, next(format_recommendations(probabilities[None, :], loaded.crop_labels, top_n))
+    loaded = get_model()
+    return loaded, next(iter_crop_recommendations(matrix, top_n, loaded))
 
-model = joblib.load(MODEL_PATH)
-label_encoder = joblib.load(ENCODER_PATH)
 
 def recommend_crop(data, top_n=3):
-    input_array = np.array([[ 
-        data['N'], data['P'], data['K'], 
-        data['temperature'], data['humidity'], 
-        data['ph'], data['rainfall']
-    ]])
-    
-    probabilities = model.predict_proba(input_array)[0]
-    top_indices = probabilities.argsort()[-top_n:][::-1]
-    
-    top_crops = label_encoder.inverse_transform(top_indices)
-    top_probs = [round(probabilities[i] * 100, 2) for i in top_indices]
-    
-    return list(zip(top_crops, top_probs))  # Returns list of tuples: [(crop1, prob1), ...]
+    matrix = build_feature_matrix([data])
+    if not prediction_cache.enabled:
+        return _score_one(matrix, top_n)[1]
+
+    key = prediction_cache.make_key(matrix[0], FEATURES, top_n)
+    cached = prediction_cache.get(get_model().version, key)
+    if cached is not None:
+        return list(cached)
+
+    loaded, result = _score_one(matrix, top_n)
+    prediction_cache.set(loaded.version, key, tuple(result))
+    return result  # Returns list of tuples: [(crop1, prob1), ...]
 
 
 # def recommend_crop(data):
@@ -36,4 +162,4 @@ def recommend_crop(data, top_n=3):
 #     ]])
 #     prediction = model.predict(input_array)
 #     crop_label = label_encoder.inverse_transform(prediction)[0]
-#     return crop_label
\ No newline at end of file
+#     return crop_label
@@ -0,0 +1,83 @@
+# core/prediction_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    In-process LRU cache of crop recommendations with a TTL.
+
+    Keys are the input features rounded to `precision` decimals (an int for
+    all features, or a dict per feature), so re-submitted lab values hit the
+    cache even when they differ in insignificant digits. The cache empties
+    itself when it sees a new model version.
+    """
+
+    def __init__(self, max_size=4096, ttl=3600, precision=1):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def make_key(self, values, features, top_n):
+        if isinstance(self.precision, dict):
+            digits = [self.precision.get(f, 1) for f in features]
+        else:
+            digits = [self.precision] * len(features)
+        # + 0.0 folds -0.0 into 0.0
+        return tuple(round(float(v), d) + 0.0 for v, d in zip(values, digits)) + (top_n,)
+
+    def get(self, version, key):
+        now = time.monotonic()
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, version, key, value):
+        with self._lock:
+            if version != self._version:
+                # Computed with a model that has since been replaced
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'model_version': self._version,
+            }
@@ -0,0 +1,84 @@
+# core/prediction_request.py
+
+"""
+The body of a single crop prediction, shared by CropPredictionView and its
+async twin in core.async_views: they differ only in how they look up the
+farmer and fetch the weather.
+"""
+
+from django.utils.translation import gettext as _
+
+SOIL_FIELDS = ['N', 'P', 'K', 'ph']
+WEATHER_FIELDS = ['temperature', 'humidity', 'rainfall']
+
+
+class PredictionInputError(ValueError):
+    """
+    The body can't be used; the message is the 400 response's error.
+    """
+
+
+def missing_city_error():
+    return {"error": _("Weather info missing and no city provided or found in profile.")}
+
+
+class PredictionRequest:
+    """
+    A /predict-crop/ body, validated: `data` holds the soil values (and the
+    weather values, if the body brings all three), `weather_source` is
+    'manual' or what get_prediction_weather should use for `city`. `city`
+    is None when the body names none; the view falls back to the farmer's.
+    """
+
+    def __init__(self, request_data):
+        if not hasattr(request_data, 'get'):
+            raise PredictionInputError(_("Expected a JSON object."))
+        missing_fields = [field for field in SOIL_FIELDS if field not in request_data]
+        if missing_fields:
+            raise PredictionInputError(_(f"Missing required fields: {', '.join(missing_fields)}."))
+
+        weather = [request_data.get(field) for field in WEATHER_FIELDS]
+        try:
+            self.data = {field: float(request_data[field]) for field in SOIL_FIELDS}
+            if all(weather):
+                self.data.update(zip(WEATHER_FIELDS, map(float, weather)))
+        except (TypeError, ValueError):
+            raise PredictionInputError(_("Soil and weather values must be numbers."))
+
+        self.use_forecast = str(request_data.get('forecast', 'false')).lower() == 'true'
+        if all(weather):
+            self.weather_source, self.city = 'manual', None
+        else:
+            # 'climatology' answers from the bundled normals without calling OpenWeather
+            self.weather_source = request_data.get('weather_source', 'live')
+            self.city = request_data.get('city') or None
+
+    @property
+    def needs_weather(self):
+        return self.weather_source != 'manual'
+
+    def set_weather(self, weather_data, weather_source):
+        """
+        Takes get_prediction_weather()'s (inputs, source). Returns None, or
+        (error body, status, headers) for the view to answer with.
+        """
+        self.weather_source = weather_source
+        if weather_source is None:
+            if "retry_after" in weather_data:
+                # Over the OpenWeather call budget and nothing cached for this place
+                return {"error": weather_data["error"]}, 503, {"Retry-After": str(weather_data["retry_after"])}
+            return {"error": weather_data["error"]}, 500, None
+        for field in WEATHER_FIELDS:
+            self.data[field] = weather_data[field]
+        return None
+
+    def response(self, recommend):
+        return {
+            "recommended_crops": [
+                {"crop": _(crop), _("confidence"): f"{confidence}%"}
+                for crop, confidence in recommend
+            ],
+            "used_data": self.data,
+            "forecast_used": self.use_forecast and self.weather_source not in ('manual', 'climatology'),
+            "weather_source": self.weather_source,
+        }
@@ -0,0 +1,203 @@
+# core/quota.py
+
+import contextlib
+import contextvars
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .models import QuotaWindow
+
+# Who an upstream call is for: 'request' (a user is waiting) or 'background' (prefetch, stale refresh)
+PRIORITIES = ('request', 'background')
+
+_priority = contextvars.ContextVar('quota_priority', default='request')
+
+
+@contextlib.contextmanager
+def quota_priority(priority):
+    """
+    Upstream calls made inside the block are charged at `priority`.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class QuotaBudget:
+    """
+    A calls-per-window budget shared by every worker through a counter per
+    window. A 'request' call may use the whole window; a 'background' call
+    only the first `background_share` of it, so prefetching can never
+    starve users. Limits and where the counter lives are read from settings
+    on every call unless given here; a limit of 0 disables the budget.
+
+    With WEATHER_QUOTA_DATABASE the counter is a QuotaWindow row, taken
+    with one conditional UPDATE: atomic, and shared by every process on
+    the database. Otherwise it is a WEATHER_QUOTA_CACHE key, only shared
+    across workers when the cache is (Redis, Memcached); with locmem each
+    worker gets the full budget, and DatabaseCache can't count atomically.
+    """
+
+    def __init__(self, name, limit=None, window=60, background_share=None, cache_alias=None, database=None):
+        self.name = name
+        self.window = window
+        self._limit = limit
+        self._background_share = background_share
+        self._cache_alias = cache_alias
+        self._database = database
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def cache(self):
+        return caches[self._cache_alias or settings.WEATHER_QUOTA_CACHE]
+
+    @property
+    def in_database(self):
+        return self._database if self._database is not None else settings.WEATHER_QUOTA_DATABASE
+
+    @property
+    def limit(self):
+        return self._limit if self._limit is not None else settings.WEATHER_QUOTA_PER_MINUTE
+
+    def limit_for(self, priority):
+        if priority == 'request':
+            return self.limit
+        share = self._background_share if self._background_share is not None else settings.WEATHER_QUOTA_BACKGROUND_SHARE
+        return int(self.limit * share)
+
+    def _window(self, now=None):
+        start = int((now or time.time()) // self.window * self.window)
+        return start, f"quota:{self.name}:{start}"
+
+    def retry_after(self):
+        """
+        Seconds until the current window ends and the budget refills.
+        """
+        now = time.time()
+        return self._window(now)[0] + self.window - now
+
+    def acquire(self, priority=None):
+        """
+        Takes one call from the current window's budget. Returns False, and
+        takes nothing, if `priority`'s share of it is used up.
+        """
+        priority = priority or current_priority()
+        if not self.limit:
+            return True
+
+        start, key = self._window()
+        limit = self.limit_for(priority)
+        granted = self._take_row(start, limit) if self.in_database else self._take_key(key, limit)
+        return self._count(priority, granted)
+
+    async def aacquire(self, priority=None):
+        """
+        acquire() for coroutines, through the cache's async methods (or a
+        worker thread for the database) so the event loop never waits on
+        the counter.
+        """
+        priority = priority or current_priority()
+        if not self.limit:
+            return True
+
+        start, key = self._window()
+        limit = self.limit_for(priority)
+        if self.in_database:
+            granted = await sync_to_async(self._take_row)(start, limit)
+        else:
+            granted = await self._atake_key(key, limit)
+        return self._count(priority, granted)
+
+    def _take_key(self, key, limit):
+        cache = self.cache
+        cache.add(key, 0, self.window * 2)
+        try:
+            used = cache.incr(key)
+        except ValueError:  # The window's key expired between add() and incr()
+            cache.add(key, 0, self.window * 2)
+            used = cache.incr(key)
+        if used > limit:
+            cache.decr(key)
+            return False
+        return True
+
+    async def _atake_key(self, key, limit):
+        cache = self.cache
+        await cache.aadd(key, 0, self.window * 2)
+        try:
+            used = await cache.aincr(key)
+        except ValueError:
+            await cache.aadd(key, 0, self.window * 2)
+            used = await cache.aincr(key)
+        if used > limit:
+            await cache.adecr(key)
+            return False
+        return True
+
+    def _take_row(self, start, limit):
+        row, created = QuotaWindow.objects.get_or_create(name=self.name, window_start=start)
+        if created:
+            QuotaWindow.objects.filter(name=self.name, window_start__lt=start).delete()
+        return QuotaWindow.objects.filter(pk=row.pk, used__lt=limit).update(used=F('used') + 1) == 1
+
+    def _count(self, priority, granted):
+        with self._stats_lock:
+            (self._granted if granted else self._denied)[priority] += 1
+        return granted
+
+    def exhaust(self):
+        """
+        Marks the rest of the window as used, e.g. after upstream answered
+        429, so no worker spends calls that would be rejected anyway.
+        """
+        start, key = self._window()
+        if self.in_database:
+            QuotaWindow.objects.update_or_create(name=self.name, window_start=start, defaults={'used': self.limit})
+        else:
+            self.cache.set(key, self.limit, self.window * 2)
+
+    async def aexhaust(self):
+        if self.in_database:
+            await sync_to_async(self.exhaust)()
+        else:
+            await self.cache.aset(self._window()[1], self.limit, self.window * 2)
+
+    def used(self):
+        start, key = self._window()
+        if self.in_database:
+            row = QuotaWindow.objects.filter(name=self.name, window_start=start).values_list('used', flat=True)
+            return row.first() or 0
+        return self.cache.get(key, 0)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._granted = dict.fromkeys(PRIORITIES, 0)
+            self._denied = dict.fromkeys(PRIORITIES, 0)
+
+    def stats(self):
+        """
+        This window's consumption across workers, and this worker's granted/denied calls by priority.
+        """
+        used = self.used()
+        with self._stats_lock:
+            return {
+                'limit': self.limit,
+                'window_seconds': self.window,
+                'used': used,
+                'remaining': max(self.limit - used, 0),
+                'background_limit': self.limit_for('background'),
+                'granted': dict(self._granted),
+                'denied': dict(self._denied),
+            }
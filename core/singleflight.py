@@ -0,0 +1,119 @@
+# core/singleflight.py
+
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Per-process request coalescing. While `do(key, fn)` is running for a key,
+    other threads calling it with the same key don't run their own `fn`; they
+    wait for the first call and get its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.reset_stats()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._executions += 1
+            else:
+                call.waiters += 1
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self._max_waiters = max(self._max_waiters, call.waiters)
+            call.done.set()
+
+    def reset_stats(self):
+        with self._lock:
+            self._executions = 0
+            self._coalesced = 0
+            self._max_waiters = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executions': self._executions,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._calls),
+                'max_waiters': self._max_waiters,
+            }
+
+
+class AsyncSingleFlight:
+    """
+    asyncio version of SingleFlight: coroutines awaiting `do(key, fn)` with
+    the same key on the same event loop share one run of the coroutine
+    function `fn`.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.reset_stats()
+
+    async def do(self, key, fn):
+        loop = asyncio.get_running_loop()
+        future = self._calls.get((loop, key))
+        if future is not None:
+            self._coalesced += 1
+            # Shielded so a waiter giving up doesn't cancel the shared call
+            return await asyncio.shield(future)
+
+        future = self._calls[(loop, key)] = loop.create_future()
+        self._executions += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved, so asyncio doesn't log it when nobody was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[(loop, key)]
+
+    def reset_stats(self):
+        self._executions = 0
+        self._coalesced = 0
+
+    def stats(self):
+        return {
+            'executions': self._executions,
+            'coalesced': self._coalesced,
+            'in_flight': len(self._calls),
+        }
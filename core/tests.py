@@ -1,3 +1,1269 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import gzip
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import CustomUser
+from . import predict
+from .batching import MicroBatcher
+from .bundle import build_bundle, bundle_bytes, bundle_predict_proba, bundle_recommend
+from .climatology import Climatology
+from .compact import compact_forest
+from .forecast import ForecastRecord
+from .forest import CompiledForest
+from .geocode import geocode
+from .model_registry import MODELS_DIR, ModelRegistry
+from .models import CropRecommendation, Farmer, OutboxEmail, QuotaWindow, SoilTest, WeatherObservation, WeatherRollup
+from .observations import ObservationBuffer, observations, weather_history
+from .outbox import drain, enqueue_email
+from .openweather import CircuitBreaker, OpenWeatherClient, QuotaExhausted, WeatherUnavailable, weather_client
+from .predict import FEATURES, get_model, recommend_crop
+from .prediction_cache import PredictionCache
+from .quota import QuotaBudget, quota_priority
+from .singleflight import SingleFlight
+from .text import normalize_text
+from .weather import (
+    cached_weather, get_cached_weather_by_city, get_weather_by_city, get_weather_history_by_city,
+    prefetch_weather, weather_cache_key, weather_place_key,
+)
+
+
+def random_samples(n, seed=42):
+    rng = np.random.default_rng(seed)
+    low = np.array([0, 5, 5, 8, 14, 3.5, 20])
+    high = np.array([140, 145, 205, 44, 100, 9.9, 300])
+    return rng.uniform(low, high, size=(n, len(FEATURES)))
+
+
+class CompiledForestTests(TestCase):
+    def test_matches_sklearn_predict_proba(self):
+        X = random_samples(500)
+        model = get_model().model
+        compiled = CompiledForest.from_sklearn(model)
+
+        np.testing.assert_array_equal(compiled.predict_proba(X), model.predict_proba(X))
+        np.testing.assert_array_equal(compiled.classes_, model.classes_)
+
+    def test_compact_forest_keeps_every_split(self):
+        X = random_samples(500)
+        full = CompiledForest.from_sklearn(get_model().model)
+        compact = compact_forest(full)
+
+        self.assertLess(compact.n_nodes, full.n_nodes)
+        self.assertEqual(compact.threshold.dtype, np.float32)
+        self.assertEqual(compact.value.dtype, np.uint16)
+        # float32 thresholds are rounded down, so every row reaches an equivalent leaf
+        np.testing.assert_allclose(compact.predict_proba(X), full.predict_proba(X), atol=1 / 65535)
+
+
+class ModelBundleTests(TestCase):
+    def test_reference_evaluator_matches_recommend_crop(self):
+        loaded = get_model()
+        bundle = json.loads(bundle_bytes(build_bundle(loaded)))
+        X = random_samples(200, seed=7)
+        expected = loaded.predict_proba(X)
+
+        for row, probabilities in zip(X, expected):
+            self.assertEqual(bundle_predict_proba(bundle, row.tolist()), probabilities.tolist())
+
+            data = dict(zip(FEATURES, row.tolist()))
+            served = recommend_crop(data)
+            offline = bundle_recommend(bundle, data)
+            self.assertEqual([p for _, p in offline], [p for _, p in served])
+            # Crops can only differ in order among classes with equal probability
+            confidences = np.round(probabilities * 100, 2)
+            for (crop, p), (served_crop, _) in zip(offline, served):
+                if np.count_nonzero(confidences == p) == 1:
+                    self.assertEqual(crop, served_crop)
+
+    def test_each_encoding_has_its_own_etag(self):
+        token = AccessToken.for_user(CustomUser.objects.create_user(email="bundle@example.com"))
+        auth = {'HTTP_AUTHORIZATION': f"Bearer {token}"}
+
+        def get(accept_encoding, **extra):
+            return self.client.get('/api/core/predict-crop/model/', HTTP_ACCEPT_ENCODING=accept_encoding, **auth, **extra)
+
+        plain, gzipped = get('identity'), get('gzip, deflate')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzipped['ETag'], plain['ETag'][:-1] + '-gz"')
+        self.assertIn('Accept-Encoding', gzipped['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(gzipped.content)), json.loads(plain.content))
+
+        self.assertNotIn('Content-Encoding', get('gzip;q=0, identity'))
+        self.assertNotIn('Content-Encoding', get('*;q=0.5, gzip;q=0'))
+        self.assertEqual(get('*')['Content-Encoding'], 'gzip')
+        self.assertEqual(get('gzip', HTTP_IF_NONE_MATCH=gzipped['ETag']).status_code, 304)
+        self.assertEqual(get('identity', HTTP_IF_NONE_MATCH=gzipped['ETag']).status_code, 200)
+
+    def test_compact_bundle_matches_compact_forest(self):
+        compact = compact_forest(CompiledForest.from_sklearn(get_model().model))
+        loaded = SimpleNamespace(
+            version='compact', compiled=compact, features=FEATURES,
+            crop_labels=get_model().crop_labels,
+        )
+        bundle = json.loads(bundle_bytes(build_bundle(loaded)))
+        X = random_samples(100, seed=3)
+
+        expected = compact.predict_proba(X)
+        for row, probabilities in zip(X, expected):
+            self.assertEqual(bundle_predict_proba(bundle, row.tolist()), probabilities.tolist())
+
+
+class ModelRegistryTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.registry = ModelRegistry(self.root)
+        X = random_samples(60, seed=5)
+        self.labels = LabelEncoder().fit(['maize', 'rice', 'yam'])
+        y = self.labels.transform(np.array(['maize', 'rice', 'yam'])[np.arange(60) % 3])
+        self.model = RandomForestClassifier(n_estimators=3, max_depth=3, random_state=0).fit(X, y)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def publish(self, version, **kwargs):
+        return self.registry.publish(self.model, self.labels, FEATURES, version=version, **kwargs)
+
+    def write_current(self, text):
+        with open(os.path.join(self.root, 'CURRENT'), 'w') as f:
+            f.write(text)
+
+    def test_publish_activates_and_checksums(self):
+        self.assertEqual(self.publish('v1'), 'v1')
+        self.assertEqual(self.registry.versions(), ['v1'])
+        loaded = self.registry.get()
+        self.assertEqual(loaded.version, 'v1')
+        self.assertEqual(list(loaded.crop_labels), ['maize', 'rice', 'yam'])
+        self.assertIn('model.joblib', loaded.manifest['sha256'])
+        self.assertFalse([name for name in os.listdir(self.root) if name.endswith('.tmp')])
+        with self.assertRaises(ValueError):
+            self.publish('v1')
+
+    def test_predictions_come_from_the_mapped_forest(self):
+        self.publish('v1')
+        loaded = self.registry.get()
+        self.assertIsInstance(loaded.compiled.value, np.memmap)
+        X = random_samples(20, seed=6)
+        np.testing.assert_array_equal(loaded.predict_proba(X), self.model.predict_proba(X))
+        self.assertIsNone(loaded._model)  # The sklearn pickle is never unpickled to serve
+
+    def test_activate_swaps_on_next_get(self):
+        self.publish('v1')
+        self.publish('v2', activate=False)
+        self.assertEqual(self.registry.get().version, 'v1')
+        held = self.registry.get()
+
+        self.registry.activate('v2')
+        self.assertEqual(self.registry.get().version, 'v2')
+        self.assertEqual(held.version, 'v1')  # A request holding the old version keeps it
+        with self.assertRaises(ValueError):
+            self.registry.activate('missing')
+
+    def test_reload_picks_up_current_written_by_another_process(self):
+        self.publish('v1')
+        self.publish('v2', activate=False)
+        self.assertEqual(self.registry.get().version, 'v1')
+        self.write_current('v2\n')
+        with override_settings(CROP_MODEL_WATCH_INTERVAL=3600):
+            self.assertEqual(self.registry.get().version, 'v1')  # Not re-checked yet
+            self.registry.request_reload()
+            self.assertEqual(self.registry.get().version, 'v2')
+
+    def test_missing_current_falls_back_to_legacy_files(self):
+        self.assertEqual(ModelRegistry(MODELS_DIR).get().version, get_model().version)
+        with self.assertRaises(FileNotFoundError):
+            self.registry.get()  # No CURRENT and no legacy pickles either
+
+    def test_corrupt_current_keeps_serving_the_loaded_version(self):
+        self.publish('v1')
+        self.assertEqual(self.registry.get().version, 'v1')
+        for broken in ('no-such-version\n', ''):
+            self.write_current(broken)
+            self.registry.request_reload()
+            with self.assertLogs('core.model_registry', 'ERROR'):
+                self.assertEqual(self.registry.get().version, 'v1')
+            self.assertEqual(self.registry.get().version, 'v1')  # Not retried until CURRENT changes again
+
+        self.publish('v2')
+        with open(os.path.join(self.root, 'v2', 'model.joblib'), 'ab') as f:
+            f.write(b'tampered')
+        self.registry.request_reload()
+        with self.assertLogs('core.model_registry', 'ERROR'):
+            self.assertEqual(self.registry.get().version, 'v1')
+
+
+class TrainCropModelTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.registry = ModelRegistry(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_small_grid_publishes_the_winner(self):
+        grid = [('random_forest', {'n_estimators': 5, 'max_depth': 6}), ('knn', {'n_neighbors': 3})]
+        command = 'core.management.commands.train_crop_model'
+        out = StringIO()
+        with mock.patch(f'{command}.CANDIDATES', grid), mock.patch(f'{command}.registry', self.registry), \
+                mock.patch(f'{command}.REPORTS_DIR', os.path.join(self.root, 'reports')):
+            call_command('train_crop_model', folds=2, jobs=1, latency_budget_ms=1000, stdout=out)
+
+        [version] = self.registry.versions()
+        loaded = self.registry.get()
+        self.assertEqual(loaded.version, version)
+        self.assertIn(loaded.manifest['metrics']['family'], ('random_forest', 'knn'))
+        self.assertGreater(loaded.manifest['metrics']['cv_accuracy'], 0.5)
+        self.assertEqual(len(loaded.crop_labels), len(get_model().crop_labels))
+
+        [report] = os.listdir(os.path.join(self.root, 'reports'))
+        with open(os.path.join(self.root, 'reports', report)) as f:
+            self.assertEqual(len(json.load(f)['candidates']), 2)
+        self.assertIn(f"as version {version}", out.getvalue())
+
+class PredictionCacheTests(TestCase):
+    def setUp(self):
+        self.cache = PredictionCache(max_size=2, ttl=60, precision=settings.CROP_PREDICTION_CACHE_PRECISION)
+
+    def key(self, values, top_n=3):
+        return self.cache.make_key(values, FEATURES, top_n)
+
+    def test_keys_collide_within_rounding_only(self):
+        base = [90, 42, 43, 20.84, 82.2, 6.52, 202.9]
+        self.assertEqual(self.key(base), self.key([90.2, 41.6, 43, 20.8, 81.9, 6.5, 203.4]))
+        self.assertNotEqual(self.key(base), self.key([90, 42, 43, 20.94, 82.2, 6.52, 202.9]))  # temperature 20.9
+        self.assertNotEqual(self.key(base), self.key(base, top_n=5))
+        self.assertEqual(self.key([0, 0, 0, -0.01, 0, 0, 0]), self.key([0, 0, 0, 0.01, 0, 0, 0]))  # -0.0 is 0.0
+
+    def test_ttl_and_lru_eviction(self):
+        with mock.patch('core.prediction_cache.time.monotonic', return_value=100.0) as clock:
+            self.cache.set('v1', 'a', 'A')  # Before the first get() the cache has no version yet
+            self.assertIsNone(self.cache.get('v1', 'a'))
+            self.cache.set('v1', 'a', 'A')
+            self.assertEqual(self.cache.get('v1', 'a'), 'A')
+            clock.return_value = 160.0
+            self.assertIsNone(self.cache.get('v1', 'a'))
+            self.assertEqual(self.cache.stats()['size'], 0)
+
+        for key in 'abc':
+            self.cache.set('v1', key, key.upper())
+        self.assertIsNone(self.cache.get('v1', 'a'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_model_swap_empties_the_cache(self):
+        self.cache.get('v1', 'a')
+        self.cache.set('v1', 'a', 'A')
+        self.assertIsNone(self.cache.get('v2', 'a'))
+        self.cache.set('v1', 'a', 'stale')  # Finished scoring with the replaced model
+        self.assertIsNone(self.cache.get('v2', 'a'))
+        self.assertEqual(self.cache.stats()['model_version'], 'v2')
+
+    def test_recommend_crop_uses_and_bypasses_the_cache(self):
+        data = dict(zip(FEATURES, random_samples(1, seed=9)[0].tolist()))
+        with mock.patch('core.predict.prediction_cache', PredictionCache(precision=2)) as cache:
+            first = recommend_crop(data)
+            self.assertEqual(recommend_crop(data), first)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+        with mock.patch('core.predict.prediction_cache', PredictionCache(max_size=0)) as cache:
+            self.assertEqual(recommend_crop(data), first)
+            self.assertEqual((cache.hits, cache.misses, cache.stats()['size']), (0, 0, 0))
+
+class MicroBatcherTests(TestCase):
+    def concurrently(self, batcher, rows):
+        results = [None] * len(rows)
+        start = threading.Barrier(len(rows))
+
+        def call(i):
+            start.wait()
+            try:
+                results[i] = batcher.submit(rows[i])
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(rows))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_callers_share_batches_and_get_their_own_rows(self):
+        calls = []
+
+        def score(matrix):
+            calls.append(len(matrix))
+            return len(calls), matrix * 2
+
+        batcher = MicroBatcher(score, max_batch_size=4, max_wait=0.2)
+        rows = [np.array([float(i), -float(i)]) for i in range(10)]
+        results = self.concurrently(batcher, rows)
+
+        for row, (context, doubled) in zip(rows, results):
+            self.assertEqual(doubled.tolist(), (row * 2).tolist())
+            self.assertIn(context, range(1, len(calls) + 1))
+        self.assertEqual(sum(calls), 10)
+        self.assertLessEqual(max(calls), 4)
+        self.assertLess(len(calls), 10)
+        stats = batcher.stats()
+        self.assertEqual((stats['rows'], stats['batches'], stats['max_batch_size']), (10, len(calls), max(calls)))
+
+    def test_bad_row_only_fails_its_own_caller(self):
+        def score(matrix):
+            if (matrix < 0).any():
+                raise ValueError("negative")
+            return 'v1', matrix + 1
+
+        batcher = MicroBatcher(score, max_batch_size=8, max_wait=0.2)
+        rows = [np.array([1.0]), np.array([-1.0]), np.array([2.0]), np.array([3.0])]
+        results = self.concurrently(batcher, rows)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual([r[1].tolist() for i, r in enumerate(results) if i != 1], [[2.0], [3.0], [4.0]])
+
+    def test_batched_recommendations_match_unbatched(self):
+        samples = [dict(zip(FEATURES, row.tolist())) for row in random_samples(6, seed=21)]
+        expected = [recommend_crop(data) for data in samples]
+        batcher = MicroBatcher(predict._score_batch, max_batch_size=6, max_wait=0.2)
+        with override_settings(CROP_MICRO_BATCH_ENABLED=True), \
+                mock.patch('core.predict.micro_batcher', batcher), \
+                mock.patch('core.predict.prediction_cache', PredictionCache(max_size=0)):
+            results = self.concurrently(SimpleNamespace(submit=recommend_crop), samples)
+        self.assertEqual(results, expected)
+        self.assertGreater(batcher.stats()['max_batch_size'], 1)
+
+class CropBatchPredictionTests(TestCase):
+    def setUp(self):
+        token = AccessToken.for_user(CustomUser.objects.create_user(email="batch@example.com"))
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {token}"}
+
+    def post(self, body, **extra):
+        return self.client.post('/api/core/predict-crop/batch/', body, content_type='application/json',
+                                **self.auth, **extra)
+
+    def test_streams_one_result_per_sample_in_order(self):
+        X = random_samples(5, seed=11)
+        response = self.post({"samples": [dict(zip(FEATURES, row.tolist())) for row in X], "top_n": 2})
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(b''.join(response.streaming_content))['results']
+        self.assertEqual(len(results), 5)
+        for row, result in zip(X, results):
+            expected = recommend_crop(dict(zip(FEATURES, row.tolist())), top_n=2)
+            self.assertEqual([r['crop'] for r in result], [crop for crop, _ in expected])
+
+    def test_stream_uses_one_model(self):
+        X = random_samples(3, seed=12)
+        with mock.patch('core.views.get_model', wraps=get_model) as loads, \
+                mock.patch('core.predict.get_model', side_effect=AssertionError("model loaded twice")):
+            response = self.post({"samples": [dict(zip(FEATURES, row.tolist())) for row in X]})
+            results = json.loads(b''.join(response.streaming_content))['results']
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual(len(results), 3)
+
+    def test_csv_upload(self):
+        rows = "N,P,K,temperature,humidity,ph,rainfall\n90,42,43,20.8,82,6.5,202.9\n20,67,20,25.1,21,5.6,98.1\n"
+        upload = StringIO(rows)
+        upload.name = 'samples.csv'
+        response = self.client.post('/api/core/predict-crop/batch/', {'file': upload}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))['results']), 2)
+
+    def test_bad_input_is_a_400_before_streaming(self):
+        sample = {"N": 90, "P": 42, "K": 43, "temperature": 20.8, "humidity": 82, "ph": 6.5, "rainfall": 202.9}
+        bad_bodies = [
+            [sample],  # Top-level list
+            {"samples": [sample], "top_n": None},
+            {"samples": [sample], "top_n": 0},
+            {"samples": []},
+            {"samples": [sample, dict(sample, rainfall="nan")]},
+            {"samples": [dict(sample, N="inf")]},
+            {"samples": [dict(sample, humidity="abc")]},
+            {"samples": [{"N": 1}]},
+        ]
+        for body in bad_bodies:
+            with self.subTest(body=body):
+                response = self.post(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+    @override_settings(CROP_BATCH_MAX_ROWS=3)
+    def test_row_limit(self):
+        sample = {"N": 90, "P": 42, "K": 43, "temperature": 20.8, "humidity": 82, "ph": 6.5, "rainfall": 202.9}
+        self.assertEqual(self.post({"samples": [sample] * 4}).status_code, 400)
+        self.assertEqual(self.post({"samples": [sample] * 3}).status_code, 200)
+
+class CropSweepTests(TestCase):
+    def setUp(self):
+        token = AccessToken.for_user(CustomUser.objects.create_user(email="sweep@example.com"))
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {token}"}
+        self.body = {
+            "N": 90, "P": 42, "K": 43, "ph": 6.5,
+            "temperature": {"min": 15, "max": 35, "steps": 3},
+            "humidity": 80,
+            "rainfall": {"min": 50, "max": 250, "steps": 4},
+        }
+
+    def post(self, **changes):
+        return self.client.post('/api/core/predict-crop/sweep/', {**self.body, **changes},
+                                content_type='application/json', **self.auth)
+
+    def test_grid_shape_and_cells_match_single_predictions(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual(data['shape'], [3, 1, 4])
+        self.assertEqual(data['axes']['temperature'], [15.0, 25.0, 35.0])
+        self.assertEqual(data['axes']['humidity'], [80.0])
+        self.assertEqual(len(data['top_crop']), 12)
+        # Rainfall varies fastest: cell 5 is temperature 25, rainfall 50 + 200 / 3
+        cell = {"N": 90, "P": 42, "K": 43, "ph": 6.5, "temperature": 25.0, "humidity": 80.0,
+                "rainfall": data['axes']['rainfall'][1]}
+        [(crop, confidence)] = recommend_crop(cell, top_n=1)
+        self.assertEqual(data['crops'][data['top_crop'][5]], crop)
+        self.assertEqual(data['confidence'][5], confidence)
+
+    def test_cell_cap(self):
+        with override_settings(CROP_SWEEP_MAX_CELLS=12):
+            self.assertEqual(self.post().status_code, 200)
+            self.assertEqual(self.post(humidity={"min": 10, "max": 90, "steps": 2}).status_code, 400)
+        # 2**22 steps per axis multiply to 2**66 cells, which np.prod wraps around to 0
+        huge = {"min": 0, "max": 1, "steps": 2 ** 22}
+        response = self.post(temperature=huge, humidity=huge, rainfall=huge)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Too many grid cells", response.data['error'])
+
+    def test_rejects_bad_values(self):
+        for changes in [
+            {"N": "nan"},
+            {"ph": "inf"},
+            {"N": "lots"},
+            {"temperature": {"min": "-inf", "max": 30}},
+            {"rainfall": {"min": 0, "max": "nan", "steps": 3}},
+            {"rainfall": {"min": 0, "max": 100, "steps": 0}},
+            {"humidity": {"max": 90}},
+        ]:
+            with self.subTest(changes=changes):
+                self.assertEqual(self.post(**changes).status_code, 400)
+        body = dict(self.body)
+        del body['rainfall']
+        response = self.client.post('/api/core/predict-crop/sweep/', body, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+class WeatherCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def fetch(self, city):
+        self.calls.append(city)
+        return {"city": city, "temperature": 20 + len(self.calls)}
+
+    def test_city_names_share_a_normalized_key(self):
+        self.assertEqual(normalize_text("  São   Paulo "), "sao paulo")
+        cached_weather('current', "São Paulo", self.fetch)
+        cached_weather('current', "sao  PAULO", self.fetch)
+        self.assertEqual(self.calls, ["São Paulo"])
+
+    def test_expired_entry_is_served_while_refreshing(self):
+        first = cached_weather('current', "Nairobi", self.fetch)
+        key = weather_cache_key('current', "Nairobi")
+        value, _ = cache.get(key)
+        cache.set(key, (value, time.time() - 1))
+        # A refresh is already in flight elsewhere, so the stale value comes back without a fetch
+        cache.add(f"{key}:fetching", True)
+
+        self.assertEqual(cached_weather('current', "Nairobi", self.fetch), first)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_errors_are_not_cached(self):
+        cached_weather('current', "Atlantis", lambda city: {"error": "city not found"})
+        self.assertIsNone(get_cached_weather_by_city("Atlantis"))
+
+    def test_concurrent_misses_share_one_fetch(self):
+        release = threading.Event()
+
+        def slow_fetch(city):
+            release.wait(5)
+            return self.fetch(city)
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cached_weather('current', "Kisumu", slow_fetch)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result == results[0] for result in results))
+
+
+class RefreshRecommendationsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            CustomUser.objects.create_user(email=f"farmer{i}@example.com", first_name="Farmer", last_name=str(i))
+            for i in range(3)
+        ]
+        self.farmers = [
+            Farmer.objects.create(user=user, location=location)
+            for user, location in zip(self.users, ["Ibadan", "Nakuru", "Atlantis"])
+        ]
+        for user in self.users[:2]:
+            SoilTest.objects.create(user=user, nitrogen=90, phosphorus=42, potassium=43, ph=6.5)
+        cached_weather('current', "Ibadan", lambda city: {"temperature": 27.0, "humidity": 80, "rainfall": 180.0})
+
+    def refresh(self, *args):
+        out = StringIO()
+        call_command('refresh_recommendations', *args, stdout=out)
+        return out.getvalue()
+
+    def test_scores_farmers_with_cached_weather_only(self):
+        self.assertIn("1 created, 0 updated, 1 skipped", self.refresh())
+        recommendation = CropRecommendation.objects.get()
+        self.assertEqual(recommendation.farmer, self.farmers[0])
+        self.assertEqual(recommendation.soil_test, SoilTest.objects.get(user=self.users[0]))
+        self.assertEqual(recommendation.model_version, get_model().version)
+        self.assertEqual(recommendation.inputs['rainfall'], 180.0)
+        expected = recommend_crop(recommendation.inputs)
+        self.assertEqual([tuple(pair) for pair in recommendation.crops], expected)
+        self.assertEqual(recommendation.top_crop, expected[0][0])
+        self.assertEqual(str(recommendation), f"{expected[0][0]} for Farmer: Farmer 0")
+
+    def test_rerun_updates_in_place_and_follows_the_latest_soil_test(self):
+        self.refresh()
+        newer = SoilTest.objects.create(user=self.users[0], nitrogen=20, phosphorus=67, potassium=20, ph=5.6)
+        self.assertIn("0 created, 1 updated", self.refresh())
+        self.assertEqual(CropRecommendation.objects.get().soil_test, newer)
+
+    def test_fetch_missing_weather(self):
+        fetched = []
+
+        def fetch(city):
+            fetched.append(city)
+            return {"temperature": 21.0, "humidity": 60, "rainfall": 90.0}
+
+        with mock.patch('core.weather.get_weather_by_city', fetch):
+            self.assertIn("2 created, 0 updated, 0 skipped", self.refresh('--fetch-missing-weather'))
+        # Farmers' stored coordinates, under their own spelling
+        self.assertEqual([(place.name, place.latitude) for place in fetched], [("Ibadan", 7.3775), ("Nakuru", -0.3031)])
+
+    def build_normals(self):
+        # Ibadan only: 24 °C, 75 % and 100 mm of rain every month
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        csv_path = os.path.join(directory, "normals.csv")
+        with open(csv_path, "w") as f:
+            f.write("\n".join(["latitude,longitude,month,temperature,humidity,rainfall"]
+                              + [f"7.3775,3.947,{month},24,75,100" for month in range(1, 13)]))
+        output = os.path.join(directory, "table")
+        call_command('build_climatology', csv=[csv_path], grid=0.5, output=output, stdout=StringIO())
+        return output
+
+    def test_inputs_match_the_prediction_endpoint(self):
+        with override_settings(CLIMATOLOGY_DIR=self.build_normals(), CLIMATOLOGY_SEASON_MONTHS=3):
+            self.assertIn("1 created, 0 updated, 1 skipped", self.refresh())
+            stored = CropRecommendation.objects.get().inputs
+            # Cached temperature and humidity, with the season's total rainfall instead of the live reading
+            self.assertEqual((stored['temperature'], stored['humidity'], stored['rainfall']), (27.0, 80, 300.0))
+            response = self.client.post("/api/core/predict-crop/", {"N": 90, "P": 42, "K": 43, "ph": 6.5},
+                                        HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.users[0])}")
+            self.assertEqual(response.data["weather_source"], "live+climatology")
+            self.assertEqual(response.data["used_data"], stored)
+
+            cache.clear()  # Climatology needs no weather at all
+            self.assertIn("0 created, 1 updated, 1 skipped", self.refresh('--weather-source', 'climatology'))
+            stored = CropRecommendation.objects.get().inputs
+            self.assertEqual((stored['temperature'], stored['humidity'], stored['rainfall']), (24.0, 75.0, 300.0))
+
+    def test_recommendation_endpoint(self):
+        auth = {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(self.users[0])}"}
+        self.assertEqual(self.client.get('/api/core/recommendation/', **auth).status_code, 404)
+        self.refresh()
+        response = self.client.get('/api/core/recommendation/', **auth)
+        self.assertEqual(response.status_code, 200)
+        recommendation = CropRecommendation.objects.get()
+        self.assertEqual([r['crop'] for r in response.data['recommended_crops']],
+                         [crop for crop, _ in recommendation.crops])
+        self.assertEqual(response.data['used_data'], recommendation.inputs)
+        self.assertEqual(response.data['model_version'], recommendation.model_version)
+        self.assertEqual(self.client.get('/api/core/recommendation/').status_code, 401)
+
+class SingleFlightTests(TestCase):
+    def test_waiters_get_the_leader_error(self):
+        flights = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError("upstream down")
+
+        def call():
+            try:
+                flights.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(flights.stats()['executions'], 1)
+        self.assertEqual(flights.stats()['coalesced'], 1)
+
+
+class StubOpenWeather(BaseHTTPRequestHandler):
+    """
+    Answers each request with the next (status, body, delay) in `server.replies`.
+    """
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        status, body, delay = self.server.replies.pop(0) if self.server.replies else (200, {}, 0)
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except ConnectionError:
+            pass  # The client timed out and hung up
+
+    def log_message(self, *args):
+        pass
+
+
+CURRENT_WEATHER = {
+    "name": "Nakuru", "sys": {"country": "KE"},
+    "main": {"temp": 22.5, "feels_like": 22.0, "humidity": 64},
+    "weather": [{"description": "light rain", "icon": "10d"}],
+    "wind": {"speed": 3.1}, "rain": {"1h": 0.4},
+}
+
+
+class StubOpenWeatherTestCase(TestCase):
+    """
+    Runs a StubOpenWeather server for each test, with an empty weather cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenWeather)
+        self.server.replies, self.server.paths = [], []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        observations.flush()
+
+    def make_client(self, **kwargs):
+        options = dict(base_url=self.base_url, timeout=(0.5, 0.2), max_retries=2, backoff=0.01)
+        options.update(kwargs)
+        return OpenWeatherClient(**options)
+
+
+class OpenWeatherClientTests(StubOpenWeatherTestCase):
+    def test_retries_server_errors(self):
+        self.server.replies = [(503, {}, 0), (502, {}, 0), (200, {"ok": True}, 0)]
+        client = self.make_client()
+
+        response = client.get("weather", {"q": "Nakuru"})
+        self.assertEqual(response.json(), {"ok": True})
+        self.assertEqual(client.stats()['retries'], 2)
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_client_errors_are_returned_without_retry(self):
+        self.server.replies = [(404, {"message": "city not found"}, 0)]
+        client = self.make_client()
+
+        self.assertEqual(client.get("weather", {"q": "Atlantis"}).status_code, 404)
+        self.assertEqual(len(self.server.paths), 1)
+
+    def test_breaker_opens_on_timeouts_and_fails_fast(self):
+        self.server.replies = [(200, {}, 0.5)] * 2
+        client = self.make_client(max_retries=1, breaker=CircuitBreaker(failure_threshold=1, cooldown=60))
+
+        with self.assertRaises(WeatherUnavailable):
+            client.get("weather", {"q": "Nakuru"})
+        self.assertEqual(client.breaker.state, 'open')
+
+        started = time.monotonic()
+        with self.assertRaises(WeatherUnavailable):
+            client.get("weather", {"q": "Nakuru"})
+        self.assertLess(time.monotonic() - started, 0.05)
+        self.assertEqual(len(self.server.paths), 2)
+
+    def test_quota_keeps_background_calls_from_starving_requests(self):
+        self.server.replies = [(200, {}, 0)] * 4
+        client = self.make_client(quota=QuotaBudget('test', limit=4, background_share=0.5))
+
+        with quota_priority('background'):
+            client.get("weather", {"q": "Nakuru"})
+            client.get("weather", {"q": "Nakuru"})
+            with self.assertRaises(QuotaExhausted):
+                client.get("weather", {"q": "Nakuru"})
+        client.get("weather", {"q": "Nakuru"})
+        client.get("weather", {"q": "Nakuru"})
+        with self.assertRaises(QuotaExhausted) as raised:
+            client.get("weather", {"q": "Nakuru"})
+
+        self.assertLessEqual(raised.exception.retry_after, 60)
+        self.assertEqual(len(self.server.paths), 4)
+        stats = client.stats()['quota']
+        self.assertEqual((stats['used'], stats['remaining']), (4, 0))
+        self.assertEqual(stats['denied'], {'request': 1, 'background': 1})
+
+    def test_upstream_429_spends_the_rest_of_the_window(self):
+        self.server.replies = [(429, {}, 0)]
+        client = self.make_client(quota=QuotaBudget('test', limit=10))
+
+        with self.assertRaises(QuotaExhausted):
+            client.get("weather", {"q": "Nakuru"})
+        self.assertEqual(len(self.server.paths), 1)
+        self.assertEqual(client.quota.used(), 10)
+
+    def test_get_weather_by_city_uses_the_shared_client(self):
+        self.server.replies = [(200, CURRENT_WEATHER, 0)]
+        with override_settings(OPENWEATHER_BASE_URL=self.base_url):
+            weather = get_weather_by_city("Nakuru")
+            self.assertEqual(get_weather_by_city(" nakuru, Kenya"), weather)
+
+        self.assertEqual(weather["temperature"], 22.5)
+        self.assertEqual(weather["rainfall"], 0.4)
+        self.assertEqual(len(self.server.paths), 1)
+        self.assertTrue(self.server.paths[0].startswith("/weather?lat=-0.325&lon=36.075"))
+        self.assertEqual(observations.flush(), 1)
+
+    def test_farmer_weather_uses_stored_coordinates(self):
+        user = CustomUser.objects.create_user(email="stored@example.com")
+        Farmer.objects.create(user=user, location="Ibadan")
+        # As if the gazetteer had since changed: the farmer's saved position wins over a fresh lookup
+        Farmer.objects.filter(user=user).update(latitude=-0.3031, longitude=36.08)
+        self.server.replies = [(200, CURRENT_WEATHER, 0)]
+
+        with override_settings(OPENWEATHER_BASE_URL=self.base_url):
+            response = self.client.get("/api/core/weather/", HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+            history = self.client.get("/api/core/weather/history/",
+                                      HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["city"], response.data["country"]), ("Ibadan", "KE"))
+        self.assertTrue(self.server.paths[0].startswith("/weather?lat=-0.325&lon=36.075"))
+        self.assertEqual(history.data["city"], "Ibadan")
+
+class QuotaBudgetTests(StubOpenWeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        weather_client.quota.reset_stats()
+
+    def test_prediction_answers_503_when_over_quota_and_uncached(self):
+        user = CustomUser.objects.create_user(email="quota@example.com")
+        self.server.replies = [(200, {}, 0)]
+        token = str(AccessToken.for_user(user))
+
+        with override_settings(OPENWEATHER_BASE_URL=self.base_url, WEATHER_QUOTA_PER_MINUTE=1):
+            weather_client.quota.exhaust()
+            response = self.client.post(
+                "/api/core/predict-crop/", {"N": 90, "P": 42, "K": 43, "ph": 6.5, "city": "Nakuru"},
+                HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(self.server.paths, [])
+
+    def test_database_counter(self):
+        quota = QuotaBudget('test', limit=3, background_share=0.34, database=True)
+        self.assertTrue(quota.acquire('background'))
+        self.assertFalse(quota.acquire('background'))
+        self.assertTrue(quota.acquire())
+        self.assertTrue(quota.acquire())
+        self.assertFalse(quota.acquire())
+        self.assertEqual(quota.used(), 3)
+        self.assertEqual(QuotaWindow.objects.get().used, 3)
+
+        # A new window starts from zero and drops the finished ones
+        with mock.patch('core.quota.time.time', return_value=time.time() + 60):
+            self.assertEqual(quota.used(), 0)
+            self.assertTrue(quota.acquire())
+            quota.exhaust()
+            self.assertFalse(quota.acquire())
+        self.assertEqual(list(QuotaWindow.objects.values_list('used', flat=True)), [3])
+
+    async def test_async_database_counter(self):
+        quota = QuotaBudget('test', limit=1, database=True)
+        self.assertTrue(await quota.aacquire())
+        self.assertFalse(await quota.aacquire())
+        await quota.aexhaust()
+        self.assertEqual(await sync_to_async(quota.used)(), 1)
+
+    def test_quota_refusal_hands_back_the_breaker_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+        breaker.record_failure()
+        quota = QuotaBudget('test', limit=1)
+        quota.exhaust()
+        client = self.make_client(breaker=breaker, quota=quota)
+
+        with self.assertRaises(QuotaExhausted):
+            client.get("weather", {"q": "Nakuru"})
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertEqual(breaker.allow(), CircuitBreaker.TRIAL)  # Not stuck waiting for the refused call
+
+    async def test_cancelled_call_hands_back_the_breaker_trial(self):
+        self.server.replies = [(200, {}, 0.5)]
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+        breaker.record_failure()
+        client = self.make_client(breaker=breaker, timeout=(0.5, 2))
+
+        task = asyncio.create_task(client.aget("weather", {"q": "Nakuru"}))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(breaker.allow(), CircuitBreaker.TRIAL)
+
+class PrefetchWeatherTests(StubOpenWeatherTestCase):
+    def test_prefetch_weather_refreshes_busiest_locations_first(self):
+        for i, location in enumerate(["Nakuru", " nakuru county", "Nakuru", "Eldoret", "eldoret, Kenya", "Kisumu"]):
+            user = CustomUser.objects.create_user(email=f"farmer{i}@example.com")
+            Farmer.objects.create(user=user, location=location)
+        self.server.replies = [(200, CURRENT_WEATHER, 0)] * 3
+
+        with override_settings(OPENWEATHER_BASE_URL=self.base_url):
+            errors = StringIO()
+            call_command('prefetch_weather', kind=['current'], concurrency=1, rate=6000, max_calls=2,
+                         stdout=StringIO(), stderr=errors)
+            self.assertEqual([path.split('&')[0] for path in self.server.paths],
+                             ["/weather?lat=-0.325", "/weather?lat=0.525"])
+            self.assertIsNotNone(get_cached_weather_by_city("nakuru"))
+            self.assertIsNone(get_cached_weather_by_city("Kisumu"))
+
+            # Fresh entries are left alone; only the one left out last time is fetched
+            call_command('prefetch_weather', kind=['current'], rate=6000, ahead=0, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(len(self.server.paths), 3)
+        self.assertTrue(self.server.paths[2].startswith("/weather?lat=-0.075&lon=34.775"))
+        # Tests run on the per-process cache, which the command warns can't reach other processes
+        self.assertIn("in-process (locmem)", errors.getvalue())
+
+    def test_shared_database_cache(self):
+        self.server.replies = [(200, CURRENT_WEATHER, 0)]
+        shared = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "test_weather_cache"}}
+
+        with override_settings(OPENWEATHER_BASE_URL=self.base_url, CACHES=shared):
+            call_command('createcachetable', verbosity=0)
+            self.assertEqual(prefetch_weather('current', "Nakuru")["temperature"], 22.5)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT cache_key FROM test_weather_cache ORDER BY cache_key")
+                keys = [row[0].split(':', 2)[2] for row in cursor.fetchall()]
+            # The entry and this minute's call count; the fetch lock is gone
+            self.assertEqual(len(keys), 2)
+            self.assertTrue(keys[0].startswith("quota:openweather:"))
+            self.assertEqual(keys[1], weather_cache_key('current', "Nakuru"))
+
+            # Another process (here, the cron command) finds the entry fresh and doesn't warn
+            Farmer.objects.create(user=CustomUser.objects.create_user(email="farmer@example.com"), location="Nakuru")
+            out, errors = StringIO(), StringIO()
+            call_command('prefetch_weather', kind=['current'], ahead=0, stdout=out, stderr=errors)
+        self.assertIn("0 entries refreshed", out.getvalue())
+        self.assertIn("1 still fresh", out.getvalue())
+        self.assertEqual(errors.getvalue(), "")
+        self.assertEqual(len(self.server.paths), 1)
+
+class AsyncViewTests(StubOpenWeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        weather_client.quota.reset_stats()
+        self.user = CustomUser.objects.create_user(email="async@example.com", password="pass12345")
+        self.auth = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    async def test_async_weather_view(self):
+        self.server.replies = [(200, CURRENT_WEATHER, 0)]
+
+        with override_settings(OPENWEATHER_BASE_URL=self.base_url):
+            response = await self.async_client.get(
+                "/api/core/weather/async/", {"city": "Nakuru"}, headers=self.auth)
+            unauthenticated = await self.async_client.get("/api/core/weather/async/", {"city": "Nakuru"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["temperature"], 22.5)
+        self.assertEqual(unauthenticated.status_code, 401)
+
+    async def test_async_prediction_matches_sync(self):
+        body = {"N": 90, "P": 42, "K": 43, "ph": 6.5, "temperature": 20.8, "humidity": 82, "rainfall": 202.9}
+        response = await self.async_client.post("/api/core/predict-crop/async/", body,
+                                                content_type="application/json", headers=self.auth)
+        expected = await sync_to_async(self.client.post)("/api/core/predict-crop/", body, content_type="application/json",
+                                                         HTTP_AUTHORIZATION=self.auth["Authorization"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), json.loads(json.dumps(expected.data)))
+        self.assertEqual(response.json()["weather_source"], "manual")
+
+        for bad in ({"N": 90}, {**body, "P": "lots"}, [body], "{not json"):
+            with self.subTest(body=bad):
+                data = bad if isinstance(bad, str) else json.dumps(bad)
+                response = await self.async_client.post("/api/core/predict-crop/async/", data,
+                                                        content_type="application/json", headers=self.auth)
+                self.assertEqual(response.status_code, 400)
+
+    async def test_async_prediction_answers_503_when_over_quota(self):
+        with override_settings(OPENWEATHER_BASE_URL=self.base_url, WEATHER_QUOTA_PER_MINUTE=1):
+            self.assertTrue(await weather_client.quota.aacquire())
+            self.assertFalse(await weather_client.quota.aacquire())
+            response = await self.async_client.post(
+                "/api/core/predict-crop/async/", {"N": 90, "P": 42, "K": 43, "ph": 6.5, "city": "Nakuru"},
+                content_type="application/json", headers=self.auth)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(self.server.paths, [])
+        self.assertEqual(weather_client.quota.stats()['denied']['request'], 2)
+
+class GeocodeTests(TestCase):
+    def test_spellings_resolve_to_one_place(self):
+        for text in ["Ibadan", "ibadan, oyo", "Ibadan Nigeria", "IBADAN, Oyo State", "Oyo, Ibadan"]:
+            self.assertEqual(geocode(text).name, "Ibadan", text)
+        self.assertEqual(geocode("Oyo").name, "Oyo")
+        self.assertEqual(geocode("Port-Harcourt").name, "Port Harcourt")
+        self.assertIsNone(geocode("Atlantis"))
+        self.assertEqual(geocode("7.38, 3.95")[4:6], (7.38, 3.95))
+
+    def test_nearby_places_share_a_weather_key(self):
+        self.assertEqual(weather_cache_key('current', "Ibadan Nigeria"), weather_cache_key('current', "7.39, 3.93"))
+        self.assertNotEqual(weather_cache_key('current', "Ibadan"), weather_cache_key('current', "Oyo"))
+        self.assertEqual(weather_cache_key('current', "Atlantis "), weather_cache_key('current', "ATLANTIS"))
+        key = weather_cache_key('current', "A very long place name " * 20)
+        self.assertRegex(key, r'^weather:current:name:[0-9a-f]{40}$')
+        self.assertEqual(weather_place_key("  "), '')  # Farmers without a location are skipped, not fetched
+
+    def test_farmer_coordinates_follow_location(self):
+        farmer = Farmer.objects.create(user=CustomUser.objects.create_user(email="geo@example.com"), location="Ibadan, Oyo")
+        self.assertEqual((farmer.latitude, farmer.longitude), (7.3775, 3.947))
+
+        farmer.location = "Atlantis"
+        farmer.save(update_fields=['location'])
+        farmer.refresh_from_db()
+        self.assertIsNone(farmer.latitude)
+
+
+class WeatherObservationTests(TestCase):
+    def observe(self, location, days_ago, hour, temperature, rainfall=0.0):
+        day = timezone.localdate() - datetime.timedelta(days=days_ago)
+        return WeatherObservation(
+            location=location, temperature=temperature, humidity=60, wind_speed=2.0, rainfall=rainfall,
+            observed_at=timezone.make_aware(datetime.datetime.combine(day, datetime.time(hour))),
+        )
+
+    def test_readings_are_appended_in_bulk(self):
+        reading = {"temperature": 20.0, "humidity": 60, "wind_speed": 2.0, "rainfall": 0.5, "description": "light rain"}
+        with override_settings(WEATHER_OBSERVATION_BATCH=1000):
+            observations.record(weather_place_key("Nakuru"), reading)
+            observations.record(weather_place_key("nakuru county"), dict(reading, temperature=24.0))
+        self.assertEqual(WeatherObservation.objects.count(), 0)
+        self.assertEqual(observations.flush(), 2)
+
+        history = get_weather_history_by_city("Nakuru", days=1)
+        self.assertEqual((history["days"], history["temperature"], history["rainfall"]), (1, 22.0, 12.0))
+
+    def test_background_writes_recycle_their_connection(self):
+        buffer = ObservationBuffer()
+        reading = {"temperature": 20.0, "humidity": 60, "wind_speed": 2.0, "rainfall": 0.5, "description": "rain"}
+        with override_settings(WEATHER_OBSERVATION_BATCH=1000):
+            buffer.record("cell:1:1", reading)
+
+        with mock.patch('core.observations.close_old_connections') as close_old:
+            close_old.side_effect = lambda: self.assertEqual(WeatherObservation.objects.count(), close_old.call_count - 1)
+            buffer._flush_in_background()  # What the writer thread runs
+        self.assertEqual(close_old.call_count, 2)  # Before and after the insert
+        self.assertEqual(WeatherObservation.objects.count(), 1)
+
+    def test_exit_flush_logs_any_failure(self):
+        buffer = ObservationBuffer()
+        reading = {"temperature": 20.0, "humidity": 60, "wind_speed": 2.0, "rainfall": 0.5, "description": "rain"}
+        with override_settings(WEATHER_OBSERVATION_BATCH=1000):
+            buffer.record("cell:1:1", reading)
+
+        with mock.patch.object(WeatherObservation.objects, 'bulk_create', side_effect=ImproperlyConfigured), \
+                self.assertLogs('core.observations', 'ERROR'):
+            buffer.flush_at_exit()
+        self.assertEqual(buffer.pending(), 0)
+
+    def test_rollup_downsamples_and_prunes(self):
+        retention = settings.WEATHER_OBSERVATION_RETENTION_DAYS
+        WeatherObservation.objects.bulk_create([
+            self.observe("cell:1:1", 1, 6, 18.0, rainfall=1.0),
+            self.observe("cell:1:1", 1, 12, 26.0, rainfall=0.0),
+            self.observe("cell:1:1", 0, 6, 20.0),
+            self.observe("cell:1:1", retention + 1, 12, 30.0),
+        ])
+        call_command('rollup_weather', full=True, stdout=StringIO())
+
+        yesterday = WeatherRollup.objects.get(period='day', period_start=timezone.localdate() - datetime.timedelta(days=1))
+        self.assertEqual((yesterday.temperature, yesterday.temperature_min, yesterday.temperature_max), (22.0, 18.0, 26.0))
+        self.assertEqual((yesterday.rainfall, yesterday.samples), (12.0, 2))
+        month = WeatherRollup.objects.get(period='month', period_start=timezone.localdate().replace(day=1))
+        self.assertEqual(month.samples, sum(r.samples for r in WeatherRollup.objects.filter(
+            period='day', period_start__gte=month.period_start)))
+        # Past retention, the raw row is gone and was never rolled up (it predates the window)
+        self.assertEqual(WeatherObservation.objects.count(), 3)
+
+        history = weather_history("cell:1:1", days=2)
+        self.assertEqual([day["samples"] for day in history["daily"]], [2, 1])
+        self.assertAlmostEqual(history["temperature"], (18 + 26 + 20) / 3)
+
+
+class ClimatologyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # Nakuru (-0.30, 36.08): 20 °C with 60 mm of rain a month, wetter from March to May
+        rows = ["latitude,longitude,month,temperature,humidity,rainfall"]
+        for month in range(1, 13):
+            rain = 120 if month in (3, 4, 5) else 60
+            rows += [f"-0.30,36.08,{month},20,70,{rain}", f"-0.40,36.20,{month},22,66,{rain}"]
+        rows.append("5.0,5.0,1,30,50,")
+        self.csv = os.path.join(self.directory, "normals.csv")
+        with open(self.csv, "w") as f:
+            f.write("\n".join(rows))
+
+    def build(self):
+        output = os.path.join(self.directory, "table")
+        call_command('build_climatology', csv=[self.csv], grid=0.5, output=output, stdout=StringIO())
+        return output
+
+    def test_lookup_from_memory_mapped_table(self):
+        table = Climatology.load(self.build())
+        self.assertIsInstance(table.normals, np.memmap)
+
+        # Both points fall in the same 0.5° cell and are averaged
+        self.assertEqual(table.season(-0.3031, 36.08, month=3), {"temperature": 21.0, "humidity": 68.0, "rainfall": 120.0})
+        self.assertEqual(table.season(-0.3, 36.08, month=12, months=3)["rainfall"], 180.0)  # Dec, Jan, Feb
+        self.assertEqual(table.season(-0.3, 36.08, month=2, months=3)["temperature"], 21.0)
+        self.assertEqual(table.season(-0.3, 36.08, month=2, months=3)["rainfall"], 300.0)
+        self.assertIsNone(table.season(5.1, 5.1, month=1))  # Known temperature, but no rainfall
+        self.assertIsNone(table.season(10.0, 10.0, month=1))
+
+    def test_prediction_falls_back_to_normals(self):
+        token = str(AccessToken.for_user(CustomUser.objects.create_user(email="normals@example.com")))
+        soil = {"N": 90, "P": 42, "K": 43, "ph": 6.5, "city": "Nakuru"}
+
+        with override_settings(CLIMATOLOGY_DIR=self.build(), CLIMATOLOGY_SEASON_MONTHS=1,
+                               OPENWEATHER_BASE_URL="http://127.0.0.1:9", WEATHER_MAX_RETRIES=0):
+            offline = self.client.post("/api/core/predict-crop/", dict(soil, weather_source="climatology"),
+                                       HTTP_AUTHORIZATION=f"Bearer {token}")
+            with self.assertLogs('core.weather', 'WARNING'):
+                fallback = self.client.post("/api/core/predict-crop/", soil, HTTP_AUTHORIZATION=f"Bearer {token}")
+            weather_client.breaker.record_success()
+
+        self.assertEqual(offline.status_code, 200)
+        self.assertEqual(offline.data["weather_source"], "climatology")
+        self.assertEqual(offline.data["used_data"]["temperature"], 21.0)
+        self.assertEqual(fallback.status_code, 200)
+        self.assertEqual(fallback.data["weather_source"], "climatology")
+        self.assertEqual(fallback.data["used_data"], offline.data["used_data"])
+
+    def test_climatology_only_without_normals_is_an_error(self):
+        token = str(AccessToken.for_user(CustomUser.objects.create_user(email="nonormals@example.com")))
+        soil = {"N": 90, "P": 42, "K": 43, "ph": 6.5, "city": "Nakuru", "weather_source": "climatology"}
+
+        with mock.patch('core.weather.get_weather_by_city') as live:
+            with override_settings(CLIMATOLOGY_DIR=os.path.join(self.directory, "missing")):
+                unbuilt = self.client.post("/api/core/predict-crop/", soil, HTTP_AUTHORIZATION=f"Bearer {token}")
+            with override_settings(CLIMATOLOGY_DIR=self.build()):
+                uncovered = self.client.post("/api/core/predict-crop/", dict(soil, city="Oslo"),
+                                             HTTP_AUTHORIZATION=f"Bearer {token}")
+        live.assert_not_called()
+        self.assertEqual(unbuilt.status_code, 500)
+        self.assertIn("No climate normals", unbuilt.data["error"])
+        self.assertEqual(uncovered.status_code, 500)
+
+
+def forecast_entry(dt, temp, humidity, description, rain=None):
+    entry = {
+        "dt": dt, "main": {"temp": temp, "humidity": humidity},
+        "weather": [{"description": description, "icon": description[:3]}], "wind": {"speed": 2.0},
+    }
+    if rain is not None:
+        entry["rain"] = {"3h": rain}
+    return entry
+
+
+class ForecastRecordTests(TestCase):
+    def setUp(self):
+        day = 86400 * 20000  # 2024-10-04 00:00 UTC
+        self.record = ForecastRecord.from_api([
+            forecast_entry(day + 0 * 10800, 18.0, 80, "light rain", 1.5),
+            forecast_entry(day + 1 * 10800, 20.0, 70, "clear sky"),
+            forecast_entry(day + 2 * 10800, 22.0, 60, "light rain", 0.5),
+            forecast_entry(day + 8 * 10800, 25.0, 50, "clear sky"),
+        ])
+
+    def test_daily_summary(self):
+        self.assertEqual(self.record.daily(), [
+            {"date": "2024-10-04", "average_temperature": 20.0, "average_humidity": 70.0,
+             "total_rainfall": 2.0, "description": "light rain", "icon": "lig"},
+            {"date": "2024-10-05", "average_temperature": 25.0, "average_humidity": 50.0,
+             "total_rainfall": 0.0, "description": "clear sky", "icon": "cle"},
+        ])
+
+    def test_averages_and_entries(self):
+        self.assertEqual(self.record.averages(), {"temperature": 21.25, "humidity": 65.0, "rainfall": 2.0})
+        entries = self.record.entries()
+        self.assertEqual(entries[1]["time"], "2024-10-04 03:00:00")
+        self.assertEqual(entries[3]["description"], "clear sky")
+
+
+class FarmerPaginationTests(TestCase):
+    def test_keyset_pages_put_undated_farmers_last(self):
+        farmers = [Farmer.objects.create(user=CustomUser.objects.create_user(email=f"f{i}@example.com")) for i in range(5)]
+        Farmer.objects.filter(pk__in=[farmers[1].pk, farmers[3].pk]).update(created_at=None)  # Rows from before created_at
+        token = str(AccessToken.for_user(farmers[0].user))
+
+        seen, url, params = [], "/api/core/farmers/", {"page_size": 2}
+        while url:
+            response = self.client.get(url, params, HTTP_AUTHORIZATION=f"Bearer {token}")
+            seen += [row['id'] for row in response.data['results']]
+            url, params = response.data['next'], {}
+        self.assertEqual(seen, [farmers[4].pk, farmers[2].pk, farmers[0].pk, farmers[3].pk, farmers[1].pk])
+
+        numbered = self.client.get("/api/core/farmers/", {"page": 1}, HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(numbered.data['count'], 5)
+
+
+class RecordingEmailBackend(LocmemEmailBackend):
+    """
+    locmem backend that counts the connections made, bounces mail to
+    *@bounce.example and answers SMTP errors for *@smtp<code>.example.
+    """
+    connections = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        RecordingEmailBackend.connections += 1
+
+    def send_messages(self, messages):
+        if any(to.endswith('@bounce.example') for message in messages for to in message.to):
+            raise ConnectionRefusedError("550 mailbox unavailable")
+        for to in (to for message in messages for to in message.to):
+            domain = to.partition('@')[2]
+            if domain.startswith('smtp'):
+                code = int(domain[4:7])
+                if domain.endswith('.rcpt.example'):
+                    raise smtplib.SMTPRecipientsRefused({to: (code, b"No such user")})
+                raise smtplib.SMTPDataError(code, b"Message rejected")
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='core.tests.RecordingEmailBackend', EMAIL_OUTBOX_RETRY_SECONDS=60,
+                   EMAIL_OUTBOX_MAX_ATTEMPTS=3)
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        RecordingEmailBackend.connections = 0
+
+    def test_requests_enqueue_instead_of_sending(self):
+        response = self.client.post('/api/register/', {
+            'email': 'new@example.com', 'first_name': 'Ngozi', 'last_name': 'Eze', 'password': 'secret123',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.client.post('/api/request-reset-email/', {'email': 'new@example.com'})
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(
+            list(OutboxEmail.objects.order_by('id').values_list('subject', 'status')),
+            [('Verify your email', 'pending'), ('Reset Your Password', 'pending')],
+        )
+
+        self.assertEqual(drain(), {'sent': 2, 'retrying': 0, 'dead': 0})
+        self.assertEqual([m.to for m in mail.outbox], [['new@example.com'], ['new@example.com']])
+        self.assertIn('verify-email', mail.outbox[0].body)
+        self.assertEqual(drain(), {'sent': 0, 'retrying': 0, 'dead': 0})  # Nothing is sent twice
+
+    def test_batches_share_one_connection(self):
+        for i in range(7):
+            enqueue_email(f"Hello {i}", "Body", [f"user{i}@example.com"])
+        self.assertEqual(drain(batch_size=3), {'sent': 7, 'retrying': 0, 'dead': 0})
+        self.assertEqual(len(mail.outbox), 7)
+        self.assertEqual(RecordingEmailBackend.connections, 1)
+
+    def test_failures_back_off_then_dead_letter(self):
+        enqueue_email("Good", "Body", ["ok@example.com"])
+        bad = enqueue_email("Bad", "Body", ["gone@bounce.example"])
+
+        self.assertEqual(drain(), {'sent': 1, 'retrying': 1, 'dead': 0})
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutboxEmail.PENDING, 1))
+        self.assertIn("550 mailbox unavailable", bad.last_error)
+        self.assertAlmostEqual((bad.next_attempt_at - timezone.now()).total_seconds(), 60, delta=5)
+        self.assertEqual(drain(), {'sent': 0, 'retrying': 0, 'dead': 0})  # Not due yet
+
+        OutboxEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        drain()
+        bad.refresh_from_db()
+        self.assertAlmostEqual((bad.next_attempt_at - timezone.now()).total_seconds(), 120, delta=5)
+
+        OutboxEmail.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(drain(), {'sent': 0, 'retrying': 0, 'dead': 1})
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (OutboxEmail.DEAD, 3))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_permanent_rejections_dead_letter_at_once(self):
+        refused = enqueue_email("Refused", "Body", ["nobody@smtp550.rcpt.example"])
+        rejected = enqueue_email("Rejected", "Body", ["spam@smtp554.example"])
+        greylisted = enqueue_email("Later", "Body", ["busy@smtp450.rcpt.example"])
+        enqueue_email("Good", "Body", ["ok@example.com"])
+
+        self.assertEqual(drain(), {'sent': 1, 'retrying': 1, 'dead': 2})
+        for email in (refused, rejected, greylisted):
+            email.refresh_from_db()
+        self.assertEqual((refused.status, refused.attempts), (OutboxEmail.DEAD, 1))
+        self.assertIn("SMTPRecipientsRefused", refused.last_error)
+        self.assertEqual(rejected.status, OutboxEmail.DEAD)
+        self.assertEqual(greylisted.status, OutboxEmail.PENDING)
+        self.assertEqual(RecordingEmailBackend.connections, 1)
+
+    def test_rolled_back_request_sends_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            enqueue_email("Never", "Body", ["a@example.com"])
+            raise RuntimeError
+        self.assertFalse(OutboxEmail.objects.exists())
@@ -0,0 +1,21 @@
+# core/text.py
+
+import re
+import unicodedata
+
+
+def normalize_text(text):
+    """
+    Matching form of free text: accents stripped, case folded and
+    whitespace collapsed, so "São Paulo " and "sao  paulo" compare equal.
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+
+def split_words(text):
+    """
+    The words of normalized text, punctuation dropped: "Ibadan, Oyo." is ['ibadan', 'oyo'].
+    """
+    return re.sub(r'[^\w]+', ' ', normalize_text(text)).split()
@@ -0,0 +1,29 @@
+# core/training.py
+
+import os
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from sklearn.model_selection import train_test_split
+
+from .model_registry import FEATURES
+
+DATA_PATH = os.path.join(settings.BASE_DIR, 'data', 'Crop_recommendation.csv')
+
+
+def load_dataset(path=DATA_PATH):
+    """
+    Feature matrix (FEATURES order) and crop label strings from the training CSV.
+    """
+    df = pd.read_csv(path)
+    return df[FEATURES].to_numpy(dtype=np.float64), df['label'].to_numpy()
+
+
+def train_validation_split(X, y):
+    """
+    The 80/20 split the shipped models are trained on. The 20% is never
+    fitted on, so later steps (e.g. pruning in export_compact_model) can use
+    it as validation data.
+    """
+    return train_test_split(X, y, test_size=0.2, random_state=42)
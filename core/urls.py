@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import CropPredictionView, CustomTokenObtainPairView, FarmerListView, FarmerRegisterView, AgronomistRegisterView, ManualSoilTestView, MeView, SoilImageAnalysisView, WeatherForecastView, WeatherView, create_superuser
+from .views import CropBatchPredictionView, CropModelBundleView, CropPredictionStatsView, CropPredictionView, CropRecommendationView, CropSweepView, CustomTokenObtainPairView, FarmerListView, FarmerRegisterView, AgronomistRegisterView, ManualSoilTestView, MeView, SoilImageAnalysisView, WeatherForecastView, WeatherHistoryView, WeatherView, create_superuser
 from rest_framework_simplejwt.views import TokenObtainPairView
+from .async_views import AsyncCropPredictionView, AsyncWeatherForecastView, AsyncWeatherView
 
 urlpatterns = [
     path('create-superuser/', create_superuser),
@@ -12,7 +13,16 @@ urlpatterns = [
     path('me/', MeView.as_view(), name='me-view'),
     path('weather/', WeatherView.as_view(), name='weather'),
     path("weather/forecast/", WeatherForecastView.as_view(), name="weather-forecast"),
+    path('weather/history/', WeatherHistoryView.as_view(), name='weather-history'),
+    path('weather/async/', AsyncWeatherView.as_view(), name='weather-async'),
+    path("weather/forecast/async/", AsyncWeatherForecastView.as_view(), name="weather-forecast-async"),
     path('predict-crop/', CropPredictionView.as_view(), name='predict-crop'),
+    path('predict-crop/async/', AsyncCropPredictionView.as_view(), name='predict-crop-async'),
+    path('predict-crop/batch/', CropBatchPredictionView.as_view(), name='predict-crop-batch'),
+    path('predict-crop/sweep/', CropSweepView.as_view(), name='predict-crop-sweep'),
+    path('predict-crop/model/', CropModelBundleView.as_view(), name='predict-crop-model'),
+    path('predict-crop/stats/', CropPredictionStatsView.as_view(), name='predict-crop-stats'),
+    path('recommendation/', CropRecommendationView.as_view(), name='crop-recommendation'),
     path('soil-test/manual/', ManualSoilTestView.as_view(), name='manual-soil-test'),
     path('soil-test/image/', SoilImageAnalysisView.as_view(), name='soil-image-analysis'),
 ]
@@ -3,17 +3,19 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 
 from .serializers import CustomTokenObtainPairSerializer, FarmerListSerializer, FarmerRegisterSerializer, AgronomistRegisterSerializer, SoilTestSerializer
-from .models import Agronomist, Farmer, SoilTest
+from .models import Agronomist, CropRecommendation, Farmer, SoilTest
 from .filters import FarmerFilter
 from .pagination import FarmerPagination
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .weather import get_forecast_average_by_city, get_forecast_by_city, get_weather_by_city
-from .predict import recommend_crop
+from .weather import get_forecast_by_city, get_forecast_entries_by_city, get_prediction_weather, get_weather_by_city, get_weather_history_by_city, weather_stats
+from .prediction_request import PredictionInputError, PredictionRequest, missing_city_error
+from .predict import SWEEP_AXES, build_feature_matrix, get_model, iter_crop_recommendations, micro_batcher, prediction_cache, recommend_crop, sweep_crops
 from .serializers import SoilImageUploadSerializer
 from .soil_analysis import analyze_soil_image
+from .bundle import bundle_cache
 from django.utils.translation import gettext as _
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample, OpenApiResponse
 
@@ -23,7 +25,14 @@ from django.views import View
 
 # core/views.py (or accounts/views.py)
 from django.contrib.auth import get_user_model
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.conf import settings
+import csv
+import io
+import json
+import math
+import numpy as np
 from django.views.decorators.csrf import csrf_exempt
 
 @csrf_exempt
@@ -172,8 +181,7 @@ class WeatherView(APIView):
 
         if not city:
             try:
-                farmer = Farmer.objects.get(user=request.user)
-                city = farmer.location
+                city = Farmer.objects.get(user=request.user).weather_location()
             except Farmer.DoesNotExist:
                 return Response({"error": _("City not provided and no location found for user.")}, status=400)
 
@@ -182,7 +190,10 @@ class WeatherView(APIView):
     
 
 @extend_schema(
-    parameters=[OpenApiParameter(name="city", required=False, description="City name (optional if user is a farmer)")],
+    parameters=[
+        OpenApiParameter(name="city", required=False, description="City name (optional if user is a farmer)"),
+        OpenApiParameter(name="view", required=False, enum=["daily", "3h"], description="Daily summary (default) or the raw 3-hourly entries"),
+    ],
     description="Get 5-day weather forecast for a city or the farmer's location."
 )
 class WeatherForecastView(APIView):
@@ -193,13 +204,47 @@ class WeatherForecastView(APIView):
 
         if not city:
             try:
-                farmer = Farmer.objects.get(user=request.user)
-                city = farmer.location
+                city = Farmer.objects.get(user=request.user).weather_location()
             except Farmer.DoesNotExist:
                 return Response({"error": _("City not provided and no location found for user.")}, status=400)
 
-        forecast_data = get_forecast_by_city(city)
+        if request.query_params.get("view") == "3h":
+            forecast_data = get_forecast_entries_by_city(city)
+        else:
+            forecast_data = get_forecast_by_city(city)
         return Response(forecast_data)
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(name="city", required=False, description="City name (optional if user is a farmer)"),
+        OpenApiParameter(name="days", required=False, type=int, description="How many days back, today included (1-365, default 30)"),
+    ],
+    description=(
+        "Daily temperature, humidity and rainfall over the past days for a city or the farmer's location, "
+        "from stored observations. Days without observations are left out."
+    )
+)
+class WeatherHistoryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        city = request.query_params.get("city")
+
+        if not city:
+            try:
+                city = Farmer.objects.get(user=request.user).weather_location()
+            except Farmer.DoesNotExist:
+                return Response({"error": _("City not provided and no location found for user.")}, status=400)
+
+        try:
+            days = int(request.query_params.get("days", 30))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= 365:
+            return Response({"error": _("days must be a whole number from 1 to 365.")}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(get_weather_history_by_city(city, days))
     
 
 @extend_schema(
@@ -208,10 +253,14 @@ class WeatherForecastView(APIView):
         value={
             "N": 90, "P": 42, "K": 43, "ph": 6.5,
             "temperature": 28, "humidity": 60, "rainfall": 150,
-            "forecast": "false", "city": "Nairobi"
+            "forecast": "false", "city": "Nairobi", "weather_source": "live"
         }
     ),
-    description="Predict suitable crops using soil and optional weather data.",
+    description=(
+        "Predict suitable crops using soil and optional weather data. Without weather values, weather_source "
+        "'live' (default) uses current weather (or the forecast) with seasonal rainfall from the climate normals, "
+        "falling back to the normals if OpenWeather fails; 'climatology' uses the normals only."
+    ),
     responses={200: OpenApiExample(
         'Prediction Result',
         value={"recommended_crops": [{"crop": "maize", "confidence": "95%"}]}
@@ -221,62 +270,287 @@ class CropPredictionView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        base_fields = ['N', 'P', 'K', 'ph']
-        missing_fields = [field for field in base_fields if field not in request.data]
+        try:
+            prediction = PredictionRequest(request.data)
+        except PredictionInputError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if prediction.needs_weather:
+                city = prediction.city
+                if city is None:
+                    farmer = Farmer.objects.filter(user=request.user).first()
+                    if farmer is None:
+                        return Response(missing_city_error(), status=status.HTTP_400_BAD_REQUEST)
+                    city = farmer.weather_location()
+
+                weather = get_prediction_weather(city, prediction.use_forecast, prediction.weather_source)
+                error = prediction.set_weather(*weather)
+                if error:
+                    body, code, headers = error
+                    return Response(body, status=code, headers=headers)
+
+            return Response(prediction.response(recommend_crop(prediction.data)))
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+
+@extend_schema(
+    request=OpenApiExample(
+        'Batch prediction input',
+        value={
+            "top_n": 3,
+            "samples": [
+                {"N": 90, "P": 42, "K": 43, "temperature": 20.8, "humidity": 82, "ph": 6.5, "rainfall": 202.9},
+                {"N": 20, "P": 67, "K": 20, "temperature": 25.1, "humidity": 21, "ph": 5.6, "rainfall": 98.1}
+            ]
+        }
+    ),
+    description=(
+        "Predict suitable crops for many soil samples in one call. Send either a JSON list of "
+        "`samples` or a CSV `file` with columns N, P, K, temperature, humidity, ph, rainfall. "
+        "Results are streamed back in input order."
+    ),
+    responses={200: OpenApiExample(
+        'Batch Prediction Result',
+        value={"results": [[{"crop": "rice", "confidence": "95.0%"}], [{"crop": "mango", "confidence": "88.0%"}]]}
+    )}
+)
+class CropBatchPredictionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_samples(self, request):
+        if not isinstance(request.data, dict):
+            raise ValueError("The request body must be an object.")
+        upload = request.FILES.get('file')
+        if upload:
+            return list(csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig')))
+        samples = request.data.get('samples')
+        if isinstance(samples, str):
+            samples = json.loads(samples)
+        return samples
+
+    def post(self, request):
+        try:
+            samples = self.get_samples(request)
+            top_n = int(request.data.get('top_n', 3))
+        except (TypeError, ValueError, UnicodeDecodeError):
+            return Response({"error": _("Could not read the uploaded samples.")}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not isinstance(samples, list) or not samples:
+            return Response({"error": _("Provide a non-empty list of samples or a CSV file.")}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_rows = settings.CROP_BATCH_MAX_ROWS
+        if len(samples) > max_rows:
+            return Response({"error": _("Too many samples. The limit is %(limit)s per request.") % {"limit": max_rows}}, status=status.HTTP_400_BAD_REQUEST)
+
+        if top_n < 1:
+            return Response({"error": _("top_n must be at least 1.")}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            matrix = build_feature_matrix([s if isinstance(s, dict) else {} for s in samples])
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Translate up front: the body is generated after the view returns
+        confidence_key = _("confidence")
+        # One model for the whole stream, so a hot swap mid-response can't change the labels
+        loaded = get_model()
+        crop_names = {crop: _(crop) for crop in loaded.crop_labels}
+
+        def stream():
+            yield '{"results": ['
+            for i, recommend in enumerate(iter_crop_recommendations(matrix, top_n, loaded)):
+                row = [{"crop": crop_names[crop], confidence_key: f"{confidence}%"} for crop, confidence in recommend]
+                yield (',' if i else '') + json.dumps(row)
+            yield ']}'
+
+        return StreamingHttpResponse(stream(), content_type='application/json')
+
+
+@extend_schema(
+    request=OpenApiExample(
+        'Sweep input',
+        value={
+            "N": 90, "P": 42, "K": 43, "ph": 6.5,
+            "temperature": {"min": 15, "max": 35, "steps": 5},
+            "humidity": 70,
+            "rainfall": {"min": 50, "max": 250, "steps": 3}
+        }
+    ),
+    description=(
+        "What-if sweep: score a grid of weather conditions for fixed soil values in one call. Each of "
+        "temperature, humidity and rainfall is either a number or a range `{min, max, steps}`. "
+        "`top_crop` and `confidence` are flat lists over the grid in row-major order of `shape` "
+        "(rainfall varies fastest); `top_crop` holds indices into `crops`."
+    ),
+    responses={200: OpenApiExample(
+        'Sweep Result',
+        value={
+            "axes": {"temperature": [15.0, 25.0, 35.0], "humidity": [70.0], "rainfall": [50.0, 250.0]},
+            "shape": [3, 1, 2],
+            "crops": ["maize", "rice"],
+            "top_crop": [0, 1, 0, 1, 0, 0],
+            "confidence": [61.0, 72.0, 55.0, 80.0, 49.0, 52.0],
+            "model_version": "legacy"
+        }
+    )}
+)
+class CropSweepView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def parse_axis(self, value):
+        if isinstance(value, dict):
+            start, stop, steps = float(value['min']), float(value['max']), int(value.get('steps', 10))
+        else:
+            start = stop = float(value)
+            steps = 1
+        if steps < 1 or not (math.isfinite(start) and math.isfinite(stop)):
+            raise ValueError
+        return start, stop, steps
+
+    def post(self, request):
+        soil_fields = ['N', 'P', 'K', 'ph']
+        missing_fields = [field for field in soil_fields + list(SWEEP_AXES) if field not in request.data]
         if missing_fields:
             return Response({"error": _(f"Missing required fields: {', '.join(missing_fields)}.")}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            data = {field: float(request.data[field]) for field in base_fields}
+            fixed = {field: float(request.data[field]) for field in soil_fields}
+            axes = {name: self.parse_axis(request.data[name]) for name in SWEEP_AXES}
+            if not all(math.isfinite(value) for value in fixed.values()):
+                raise ValueError
+        except (KeyError, TypeError, ValueError):
+            return Response({"error": _("Soil values must be numbers and each weather axis a number or {min, max, steps}.")}, status=status.HTTP_400_BAD_REQUEST)
+
+        shape = [steps for _start, _stop, steps in axes.values()]
+        max_cells = settings.CROP_SWEEP_MAX_CELLS
+        # math.prod, unlike np.prod, can't overflow into a small or negative count
+        if math.prod(shape) > max_cells:
+            return Response({"error": _("Too many grid cells. The limit is %(limit)s per request.") % {"limit": max_cells}}, status=status.HTTP_400_BAD_REQUEST)
+
+        loaded, values, top, confidence = sweep_crops(fixed, axes)
+        # Only crops that win somewhere go in the palette; cells refer to them by index
+        classes, top_crop = np.unique(top, return_inverse=True)
+        return Response({
+            "axes": {name: np.round(v, 4).tolist() for name, v in values.items()},
+            "shape": shape,
+            "crops": [_(crop) for crop in loaded.crop_labels[classes].tolist()],
+            "top_crop": top_crop.tolist(),
+            "confidence": confidence.tolist(),
+            "model_version": loaded.version,
+        })
 
-            # Weather data (manual input or fetched)
-            temperature = request.data.get('temperature')
-            humidity = request.data.get('humidity')
-            rainfall = request.data.get('rainfall')
 
-            use_forecast = request.data.get('forecast', 'false').lower() == 'true'
+@extend_schema(
+    description=(
+        "The active crop model as a portable JSON bundle (flat node arrays and crop labels) for running "
+        "recommendations offline, gzipped if Accept-Encoding allows. The ETag is the SHA-256 of the bundle "
+        "(with a -gz suffix for the gzipped body); send it back in If-None-Match to get 304 Not Modified until "
+        "a new model version is published. See core/bundle.py for the format."
+    ),
+    responses={200: OpenApiResponse(description="Model bundle"), 304: OpenApiResponse(description="Bundle unchanged")}
+)
+class CropModelBundleView(APIView):
+    permission_classes = [IsAuthenticated]
 
-            if temperature and humidity and rainfall:
-                data['temperature'] = float(temperature)
-                data['humidity'] = float(humidity)
-                data['rainfall'] = float(rainfall)
-                forecast_used = False
-            else:
-                city = request.data.get('city')
-                if not city:
+    @staticmethod
+    def accepts_gzip(accept_encoding):
+        """
+        Whether an Accept-Encoding header allows gzip: listed (or covered by
+        "*") with a q-value above 0.
+        """
+        weights = {}
+        for part in accept_encoding.split(','):
+            coding, *params = [piece.strip() for piece in part.split(';')]
+            q = 1.0
+            for param in params:
+                name, _sep, value = param.partition('=')
+                if name.strip().lower() == 'q':
                     try:
-                        farmer = Farmer.objects.get(user=request.user)
-                        city = farmer.location
-                    except Farmer.DoesNotExist:
-                        return Response({"error": _("Weather info missing and no city provided or found in profile.")}, status=400)
-
-                if use_forecast:
-                    weather_data = get_forecast_average_by_city(city)
-                    forecast_used = True
-                else:
-                    weather_data = get_weather_by_city(city)
-                    forecast_used = False
-
-                if weather_data.get("error"):
-                    return Response({"error": weather_data["error"]}, status=500)
-
-                data['temperature'] = weather_data['temperature']
-                data['humidity'] = weather_data['humidity']
-                data['rainfall'] = weather_data['rainfall']
-
-            recommend = recommend_crop(data)
-            return Response({
-                "recommended_crops": [
-                    {"crop": _(crop), _("confidence"): f"{confidence}%"}
-                    for crop, confidence in recommend
-                ],
-                "used_data": data,
-                "forecast_used": forecast_used
-            })
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            if coding:
+                weights[coding.lower()] = q
+        return weights.get('gzip', weights.get('x-gzip', weights.get('*', 0.0))) > 0
+
+    def get(self, request):
+        loaded = get_model()
+        try:
+            data, gzipped, checksum = bundle_cache.get(loaded)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        # Each encoding is a different representation, so each gets its own ETag
+        use_gzip = self.accepts_gzip(request.headers.get('Accept-Encoding', ''))
+        etag = f'"{checksum}-gz"' if use_gzip else f'"{checksum}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            if use_gzip:
+                response = HttpResponse(gzipped, content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(data, content_type='application/json')
+        response['ETag'] = etag
+        response['X-Model-Version'] = loaded.version
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+
+@extend_schema(
+    description=(
+        "Metrics for this worker: model version, prediction cache and micro-batcher counters, and weather "
+        "upstream fetches vs. coalesced lookups. Staff only."
+    )
+)
+class CropPredictionStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "model_version": get_model().version,
+            "cache": prediction_cache.stats(),
+            "micro_batching": dict(micro_batcher.stats(), enabled=settings.CROP_MICRO_BATCH_ENABLED),
+            "weather": weather_stats(),
+        })
+
+
+@extend_schema(
+    description=(
+        "The logged-in farmer's precomputed crop recommendation, based on their latest soil test and "
+        "the weather at their location. Refreshed in bulk by the refresh_recommendations command."
+    ),
+    responses={200: OpenApiExample(
+        'Stored Recommendation',
+        value={
+            "recommended_crops": [{"crop": "maize", "confidence": "95.0%"}],
+            "used_data": {"N": 90, "P": 42, "K": 43, "temperature": 28, "humidity": 60, "ph": 6.5, "rainfall": 150},
+            "model_version": "20250101-000000",
+            "computed_at": "2025-01-01T04:00:00Z"
+        }
+    )}
+)
+class CropRecommendationView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        recommendation = CropRecommendation.objects.filter(farmer__user=request.user).first()
+        if recommendation is None:
+            return Response({"error": _("No recommendation yet.")}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "recommended_crops": [
+                {"crop": _(crop), _("confidence"): f"{confidence}%"}
+                for crop, confidence in recommendation.crops
+            ],
+            "used_data": recommendation.inputs,
+            "model_version": recommendation.model_version,
+            "computed_at": recommendation.computed_at,
+        })
 
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
 
 @extend_schema(
     request=SoilTestSerializer,
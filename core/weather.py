@@ -1,26 +1,239 @@
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from django.conf import settings
 from django.core.cache import cache
-from collections import defaultdict
-from datetime import datetime
 
-def get_weather_by_city(city):
-    cache_key = f"weather_{city.lower()}"
-    cached_data = cache.get(cache_key)
-
-    if cached_data:
-        return cached_data  # Return cached weather
-    
-    api_key = settings.OPENWEATHER_API_KEY
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
-
-    params = {
-        "q": city,
-        "appid": api_key,
-        "units": "metric"
-    }
+from .climatology import climate_normals
+from .forecast import ForecastRecord
+from .geocode import cell_center, geocode, grid_cell
+from .text import normalize_text
+from .observations import observations, weather_history
+from .openweather import weather_client
+from .quota import quota_priority
+from .singleflight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Background refreshes of stale entries, so the request that finds them doesn't wait on OpenWeather
+_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='weather-refresh')
+
+# One upstream fetch per cache key at a time in this worker; see cached_weather()
+_flights = SingleFlight()
+_async_flights = AsyncSingleFlight()
+_refresh_tasks = set()  # Strong references, so pending refresh tasks aren't garbage collected
+_stats_lock = threading.Lock()
+_stats = {'upstream_fetches': 0, 'coalesced_across_workers': 0, 'lock_wait_timeouts': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def weather_stats():
+    """
+    Upstream and deduplication counters for this worker. `coalesced` calls
+    waited on another thread's fetch; `coalesced_across_workers` calls got
+    the value another worker fetched.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    return dict(
+        _flights.stats(), **stats, async_flights=_async_flights.stats(), upstream=weather_client.stats(),
+        observations_pending=observations.pending(),
+    )
+
+
+def weather_place_key(city):
+    """
+    What a city's weather is cached under: the grid cell of its gazetteer
+    coordinates, so every spelling of a place and every place within the
+    same few kilometres share one entry. Names the gazetteer doesn't know
+    fall back to the SHA-1 of their normalized text, which keeps keys short
+    and free of spaces however long the name is. A blank location has no
+    key ('').
+    """
+    place = geocode(city)
+    if place is None:
+        name = normalize_text(city)
+        return f"name:{hashlib.sha1(name.encode()).hexdigest()}" if name else ''
+    row, column = grid_cell(place.latitude, place.longitude)
+    return f"cell:{row}:{column}"
+
+
+def weather_cache_key(kind, city):
+    return f"weather:{kind}:{weather_place_key(city)}"
+
+
+def is_error(result):
+    return isinstance(result, dict) and 'error' in result
+
+
+def unavailable(error):
+    """
+    The error payload for a failed upstream call; `retry_after` (seconds) is
+    set when the call budget is used up, so views can answer 503 with Retry-After.
+    """
+    result = {"error": "Weather service is unavailable, please try again later."}
+    if getattr(error, 'retry_after', None) is not None:
+        result["retry_after"] = math.ceil(error.retry_after)
+    return result
+
+
+def _store(key, value, ttl):
+    # Entries are (value, fresh_until) and outlive their TTL by WEATHER_CACHE_STALE_TTL so they can be served stale
+    cache.set(key, (value, time.time() + ttl), ttl + settings.WEATHER_CACHE_STALE_TTL)
+
+
+def _lock_key(key):
+    return f"{key}:fetching"
+
+
+def _fetch(key, ttl, fetch, city):
+    _count('upstream_fetches')
+    try:
+        value = fetch(city)
+    except requests.RequestException as e:
+        # Includes WeatherUnavailable: the client gave up, its circuit breaker is open or the quota is used up
+        logger.warning("Weather fetch for %r failed: %s", city, e)
+        return unavailable(e)
+    if not is_error(value):
+        _store(key, value, ttl)
+    return value
+
+
+def _refresh(key, ttl, fetch, city):
+    try:
+        with quota_priority('background'):
+            value = _flights.do(key, lambda: _fetch(key, ttl, fetch, city))
+        if is_error(value):
+            logger.warning("Weather refresh for %r failed, serving stale data: %s", city, value['error'])
+    finally:
+        cache.delete(_lock_key(key))
 
-    response = requests.get(base_url, params=params)
+
+def _fetch_once(key, ttl, fetch, city):
+    """
+    Cache miss path. The shared-cache lock makes one worker fetch while the
+    others poll the cache for its result, for up to WEATHER_COALESCE_WAIT
+    seconds; if the lock holder fails or takes longer they fetch themselves.
+    """
+    lock_key = _lock_key(key)
+    if not cache.add(lock_key, True, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+        deadline = time.monotonic() + settings.WEATHER_COALESCE_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                _count('coalesced_across_workers')
+                return entry[0]
+            if cache.get(lock_key) is None:
+                break
+        else:
+            _count('lock_wait_timeouts')
+        return _fetch(key, ttl, fetch, city)
+
+    try:
+        return _fetch(key, ttl, fetch, city)
+    finally:
+        cache.delete(lock_key)
+
+
+def cached_weather(kind, city, fetch):
+    """
+    fetch(city) through the shared cache, kept WEATHER_CACHE_TTL[kind]
+    seconds. An expired entry is still returned while one background
+    refresh replaces it, and keeps being returned if that refresh fails.
+    On a miss, concurrent callers for the same city share one upstream
+    fetch: threads of this worker through SingleFlight, other workers
+    through a lock in the cache. Errors are never cached.
+    """
+    key = weather_cache_key(kind, city)
+    ttl = settings.WEATHER_CACHE_TTL[kind]
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() >= fresh_until and cache.add(_lock_key(key), True, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+            _refresher.submit(_refresh, key, ttl, fetch, city)
+        return value
+
+    return _flights.do(key, lambda: _fetch_once(key, ttl, fetch, city))
+
+
+async def _afetch(key, ttl, afetch, city):
+    _count('upstream_fetches')
+    try:
+        value = await afetch(city)
+    except requests.RequestException as e:
+        logger.warning("Weather fetch for %r failed: %s", city, e)
+        return unavailable(e)
+    if not is_error(value):
+        await cache.aset(key, (value, time.time() + ttl), ttl + settings.WEATHER_CACHE_STALE_TTL)
+    return value
+
+
+async def _arefresh(key, ttl, afetch, city):
+    try:
+        with quota_priority('background'):
+            value = await _async_flights.do(key, lambda: _afetch(key, ttl, afetch, city))
+        if is_error(value):
+            logger.warning("Weather refresh for %r failed, serving stale data: %s", city, value['error'])
+    finally:
+        await cache.adelete(_lock_key(key))
+
+
+async def _afetch_once(key, ttl, afetch, city):
+    lock_key = _lock_key(key)
+    if not await cache.aadd(lock_key, True, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+        deadline = time.monotonic() + settings.WEATHER_COALESCE_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await cache.aget(key)
+            if entry is not None:
+                _count('coalesced_across_workers')
+                return entry[0]
+            if await cache.aget(lock_key) is None:
+                break
+        else:
+            _count('lock_wait_timeouts')
+        return await _afetch(key, ttl, afetch, city)
+
+    try:
+        return await _afetch(key, ttl, afetch, city)
+    finally:
+        await cache.adelete(lock_key)
+
+
+async def acached_weather(kind, city, afetch):
+    """
+    Async version of cached_weather() for the coroutine function afetch:
+    same cache entries, locks and stale-while-revalidate behaviour, with
+    refreshes run as tasks on the current event loop.
+    """
+    key = weather_cache_key(kind, city)
+    ttl = settings.WEATHER_CACHE_TTL[kind]
+
+    entry = await cache.aget(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() >= fresh_until and await cache.aadd(_lock_key(key), True, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+            task = asyncio.create_task(_arefresh(key, ttl, afetch, city))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return value
+
+    return await _async_flights.do(key, lambda: _afetch_once(key, ttl, afetch, city))
+
+
+def _current_weather(response):
     if response.status_code == 200:
         data = response.json()
         return {
@@ -38,83 +251,211 @@ def get_weather_by_city(city):
         return {"error": response.json().get("message", "Failed to fetch weather")}
 
 
-def get_forecast_by_city(city):
-    api_key = settings.OPENWEATHER_API_KEY
-    base_url = "https://api.openweathermap.org/data/2.5/forecast"
+def _forecast(response):
+    """
+    The 5 day / 3 hour forecast for a city as a ForecastRecord.
+    """
+    if response.status_code != 200:
+        return {"error": response.json().get("message")}
+    return ForecastRecord.from_api(response.json()["list"])
 
-    params = {
-        "q": city,
-        "appid": api_key,
+
+def _params(city):
+    place = geocode(city)
+    if place is None:
+        return {
+            "q": city,
+            "units": "metric"
+        }
+    # The cell's centre, so the entry is the same whichever place in the cell fetched it
+    latitude, longitude = cell_center(grid_cell(place.latitude, place.longitude))
+    return {
+        "lat": latitude,
+        "lon": longitude,
         "units": "metric"
     }
 
-    response = requests.get(base_url, params=params)
-    if response.status_code != 200:
-        return {"error": response.json().get("message", "Failed to fetch forecast")}
-
-    data = response.json()
-    forecast_by_day = defaultdict(list)
-
-    for entry in data["list"]:
-        date = entry["dt_txt"].split(" ")[0]
-        forecast_by_day[date].append({
-            "time": entry["dt_txt"],
-            "temp": entry["main"]["temp"],
-            "description": entry["weather"][0]["description"],
-            "humidity": entry["main"]["humidity"],
-            "wind_speed": entry["wind"]["speed"],
-            "rainfall": entry.get("rain", {}).get("3h", 0.0),
-            "icon": entry["weather"][0]["icon"],
-        })
-
-
-    # Aggregate daily forecasts
-    summarized_forecast = []
-    for date, forecasts in forecast_by_day.items():
-        avg_temp = sum(f["temp"] for f in forecasts) / len(forecasts)
-        avg_humidity = sum(f["humidity"] for f in forecasts) / len(forecasts)
-        total_rainfall = sum(f["rainfall"] for f in forecasts)
-        common_description = max(set(f["description"] for f in forecasts), key=lambda x: [f["description"] for f in forecasts].count(x))
-        summarized_forecast.append({
-            "date": date,
-            "average_temperature": round(avg_temp, 1),
-            "average_humidity": round(avg_humidity, 1),
-            "total_rainfall": round(total_rainfall, 1),
-            "description": common_description,
-            "icon": forecasts[0]["icon"]
-        })
-
-    return summarized_forecast
+
+def _observe(city, weather):
+    # Every successful reading is kept (in bulk, off the request) for weather history
+    if not is_error(weather):
+        observations.record(weather_place_key(city), weather)
+    return weather
+
+
+def _fetch_current_weather(city):
+    return _observe(city, _current_weather(weather_client.get("weather", _params(city))))
+
+
+def _fetch_forecast(city):
+    return _forecast(weather_client.get("forecast", _params(city)))
+
+
+async def _afetch_current_weather(city):
+    return _observe(city, _current_weather(await weather_client.aget("weather", _params(city))))
+
+
+async def _afetch_forecast(city):
+    return _forecast(await weather_client.aget("forecast", _params(city)))
+
+
+def _forecast_view(record, view, default_error):
+    if is_error(record):
+        return {"error": record["error"] or default_error}
+    return view(record)
+
+
+_FETCHERS = {'current': _fetch_current_weather, 'forecast': _fetch_forecast}
+
+
+def weather_expires_in(kind, city):
+    """
+    Seconds until the cached entry for city stops being fresh (negative once
+    it is stale), or None if nothing is cached.
+    """
+    entry = cache.get(weather_cache_key(kind, city))
+    return None if entry is None else entry[1] - time.time()
+
+
+def prefetch_weather(kind, city):
+    """
+    Fetches kind ('current' or 'forecast') for city into the cache now,
+    however fresh the cached entry still is. Returns None without calling
+    OpenWeather if another worker is already fetching it, otherwise what
+    the fetch returned (possibly an error dict, which is not cached).
+    """
+    key = weather_cache_key(kind, city)
+    lock_key = _lock_key(key)
+    if not cache.add(lock_key, True, settings.WEATHER_FETCH_LOCK_TIMEOUT):
+        return None
+    try:
+        with quota_priority('background'):
+            return _fetch(key, settings.WEATHER_CACHE_TTL[kind], _FETCHERS[kind], city)
+    finally:
+        cache.delete(lock_key)
+
+
+def _named(weather, city):
+    # A cell's entry carries whatever name OpenWeather gave its centre; report the place that was asked for.
+    # A stored farmer Place has no country code, so OpenWeather's stays
+    place = geocode(city)
+    if place is None or weather is None or is_error(weather):
+        return weather
+    return dict(weather, city=place.name or weather.get('city'), country=place.country_code or weather.get('country'))
+
+
+def get_cached_weather_by_city(city):
+    """
+    Current weather for a city if it is already cached (even if stale), without calling OpenWeather.
+    """
+    entry = cache.get(weather_cache_key('current', city))
+    return _named(entry[0], city) if entry is not None else None
+
+
+def get_weather_by_city(city):
+    return _named(cached_weather('current', city, _fetch_current_weather), city)
+
+
+def get_forecast_by_city(city):
+    record = cached_weather('forecast', city, _fetch_forecast)
+    return _forecast_view(record, ForecastRecord.daily, "Failed to fetch forecast")
+
+
+def get_forecast_entries_by_city(city):
+    """
+    Returns the raw 3-hourly forecast entries for the next 5 days.
+    """
+    record = cached_weather('forecast', city, _fetch_forecast)
+    return _forecast_view(record, ForecastRecord.entries, "Failed to fetch forecast")
 
 
 def get_forecast_average_by_city(city):
     """
     Returns average temperature, humidity, and total rainfall for the next 5 days (every 3 hours).
     """
-    api_key = settings.OPENWEATHER_API_KEY
-    base_url = "https://api.openweathermap.org/data/2.5/forecast"
-    
-    params = {
-        "q": city,
-        "appid": api_key,
-        "units": "metric"
-    }
+    record = cached_weather('forecast', city, _fetch_forecast)
+    return _forecast_view(record, ForecastRecord.averages, "Forecast data not found")
 
-    response = requests.get(base_url, params=params)
-    if response.status_code != 200:
-        return {"error": response.json().get("message", "Forecast data not found")}
 
-    data = response.json()
-    temps, humidities, rainfalls = [], [], []
+def get_weather_history_by_city(city, days=30):
+    """
+    Daily temperature, humidity and rainfall over the last `days` days from
+    the stored observations; never calls OpenWeather. Days nobody fetched
+    weather for are missing.
+    """
+    return dict(weather_history(weather_place_key(city), days), city=getattr(city, 'name', city))
 
-    for entry in data["list"]:
-        temps.append(entry["main"]["temp"])
-        humidities.append(entry["main"]["humidity"])
-        rainfalls.append(entry.get("rain", {}).get("3h", 0.0))
 
-    return {
-        "temperature": sum(temps) / len(temps),
-        "humidity": sum(humidities) / len(humidities),
-        "rainfall": sum(rainfalls)  # Total over 5 days
-    }
+def _climate_normals(city):
+    place = geocode(city)
+    return climate_normals(place.latitude, place.longitude) if place else None
+
+
+def _no_normals(city):
+    return {"error": f"No climate normals for {getattr(city, 'name', city)}."}, None
+
+
+def _prediction_inputs(live, normals):
+    if is_error(live):
+        return (normals, 'climatology') if normals is not None else (live, None)
+    if normals is None:
+        return {field: live[field] for field in ('temperature', 'humidity', 'rainfall')}, 'live'
+    # The model was trained on seasonal rainfall, not the last hour's (or the next 5 days'), so that comes from the normals
+    return {"temperature": live["temperature"], "humidity": live["humidity"], "rainfall": normals["rainfall"]}, 'live+climatology'
+
+
+def get_prediction_weather(city, use_forecast=False, source='live', cached_only=False):
+    """
+    Temperature, humidity and rainfall to feed the crop model for a city,
+    and where they came from, as (inputs, source):
+
+    - source='climatology': the place's climate normals for the coming
+      season, without any network call; (error dict, None) if the table
+      doesn't cover the place (or hasn't been built).
+    - source='live': current weather (or the forecast average) adjusts
+      temperature and humidity; rainfall comes from the normals when the
+      table covers the place. If OpenWeather fails the normals are used
+      as they are.
+
+    Without normals for the place it is live weather only, and a failed
+    live call returns (error dict, None). With `cached_only` the live
+    reading is current weather already in the cache, never a call; a place
+    with nothing cached is treated like a failed call.
+    """
+    normals = _climate_normals(city)
+    if source == 'climatology':
+        return (normals, 'climatology') if normals is not None else _no_normals(city)
+    if cached_only:
+        live = get_cached_weather_by_city(city) or {"error": "No cached weather."}
+    else:
+        live = get_forecast_average_by_city(city) if use_forecast else get_weather_by_city(city)
+    return _prediction_inputs(live, normals)
+
+
+# Async versions for the ASGI views in core.async_views; they share cache entries with the sync ones
+
+async def aget_weather_by_city(city):
+    return _named(await acached_weather('current', city, _afetch_current_weather), city)
+
+
+async def aget_forecast_by_city(city):
+    record = await acached_weather('forecast', city, _afetch_forecast)
+    return _forecast_view(record, ForecastRecord.daily, "Failed to fetch forecast")
+
+
+async def aget_forecast_entries_by_city(city):
+    record = await acached_weather('forecast', city, _afetch_forecast)
+    return _forecast_view(record, ForecastRecord.entries, "Failed to fetch forecast")
+
+
+async def aget_forecast_average_by_city(city):
+    record = await acached_weather('forecast', city, _afetch_forecast)
+    return _forecast_view(record, ForecastRecord.averages, "Forecast data not found")
+
 
+async def aget_prediction_weather(city, use_forecast=False, source='live'):
+    normals = _climate_normals(city)
+    if source == 'climatology':
+        return (normals, 'climatology') if normals is not None else _no_normals(city)
+    live = await (aget_forecast_average_by_city(city) if use_forecast else aget_weather_by_city(city))
+    return _prediction_inputs(live, normals)
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 02:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_thread_roots(apps, schema_editor):
+    Message = apps.get_model('marketplace', 'Message')
+    parents = dict(Message.objects.values_list('id', 'parent_id'))
+    roots = {}
+
+    def root_of(message_id):
+        chain = []
+        while parents.get(message_id) is not None and message_id not in roots:
+            chain.append(message_id)
+            message_id = parents[message_id]
+        root = roots.get(message_id, message_id)
+        for link in chain:
+            roots[link] = root
+        return root
+
+    by_root = {}
+    for message_id, parent_id in parents.items():
+        if parent_id is not None:
+            by_root.setdefault(root_of(message_id), []).append(message_id)
+    for root, ids in by_root.items():
+        Message.objects.filter(id__in=ids).update(thread_root=root)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0004_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='thread_root',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_messages', to='marketplace.message'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread_root', 'timestamp'], name='message_thread_time_idx'),
+        ),
+        migrations.RunPython(set_thread_roots, migrations.RunPython.noop),
+    ]
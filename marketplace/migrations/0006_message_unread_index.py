@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 02:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0005_message_thread_root'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'is_deleted', 'is_read', 'timestamp'], name='message_receiver_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 03:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0006_message_unread_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_product_time_idx',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 03:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0007_drop_order_product_time_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'is_deleted', 'timestamp'], name='message_sender_time_idx'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from core.models import Farmer  # assuming Farmer model is here
 from accounts.models import CustomUser
 
 class Product(models.Model):
+    # name and description are full-text indexed outside the ORM (migration 0003, marketplace/search.py)
     farmer = models.ForeignKey(Farmer, on_delete=models.CASCADE, related_name='products')
     name = models.CharField(max_length=100)
     description = models.TextField()
@@ -11,6 +12,11 @@ class Product(models.Model):
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),  # Keyset pages
+        ]
+
     def __str__(self):
         return f"{self.name} by {self.farmer.user.email}"
 
@@ -23,14 +29,55 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
+    # First message of the conversation, copied down from `parent` on save, so a whole thread is one
+    # indexed lookup (see marketplace/threads.py); null on the first message itself
+    thread_root = models.ForeignKey(
+        'self', null=True, blank=True, editable=False, on_delete=models.CASCADE, related_name='thread_messages'
+    )
     is_deleted = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['receiver', 'timestamp', 'id'], name='message_receiver_time_idx'),  # Inbox keyset pages
+            models.Index(fields=['thread_root', 'timestamp'], name='message_thread_time_idx'),
+            # The received and sent halves of a user's conversations (threads.conversations_for), and the
+            # dashboard's unread count
+            models.Index(fields=['receiver', 'is_deleted', 'is_read', 'timestamp'], name='message_receiver_unread_idx'),
+            models.Index(fields=['sender', 'is_deleted', 'timestamp'], name='message_sender_time_idx'),
+        ]
 
     def __str__(self):
         return f'Message from {self.sender.email} to {self.receiver.email}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        moved = not self._state.adding and self.parent_id != getattr(self, '_loaded_parent_id', self.parent_id)
+        if self._state.adding or moved:
+            self.thread_root_id = (self.parent.thread_root_id or self.parent_id) if self.parent_id else None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'thread_root'}
+        super().save(*args, **kwargs)
+        self._loaded_parent_id = self.parent_id
+        if moved:
+            self._rethread_replies()
+
+    def _rethread_replies(self):
+        """
+        Points every message below this one at its new thread root after a change of parent.
+        """
+        root, below, level = self.thread_root_id or self.id, [], [self.id]
+        while level:
+            level = list(Message.objects.filter(parent__in=level).values_list('id', flat=True))
+            below += level
+        Message.objects.filter(id__in=below).update(thread_root=root)
+
 
 class Order(models.Model):
     buyer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders')
@@ -46,5 +93,12 @@ class Order(models.Model):
     ], default='pending')
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pages of a buyer's orders. A seller's span all their products, so no
+            # per-product index can return them in timestamp order; the product FK index finds them
+            models.Index(fields=['buyer', 'timestamp', 'id'], name='order_buyer_time_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} by {self.buyer.email}"
@@ -1,6 +1,22 @@
-from rest_framework.pagination import PageNumberPagination
+from core.pagination import KeysetOrPageNumberPagination, KeysetPagination
 
-class ProductPagination(PageNumberPagination):
+class ProductPagination(KeysetOrPageNumberPagination):
     page_size = 10  # Adjust based on frontend layout (e.g., 8 or 12 for card grids)
     page_size_query_param = 'page_size'
     max_page_size = 10
+
+    def use_page_numbers(self, request):
+        # Search results are ordered by relevance, which has no keyset
+        return super().use_page_numbers(request) or bool(request.query_params.get('search', '').strip())
+
+
+class MessagePagination(KeysetPagination):
+    ordering = '-timestamp'
+    page_size = 20
+    max_page_size = 100
+
+
+class OrderPagination(KeysetPagination):
+    ordering = '-timestamp'
+    page_size = 20
+    max_page_size = 100
@@ -0,0 +1,170 @@
+# marketplace/search.py
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+
+from core.text import split_words
+
+FTS_TABLE = 'marketplace_product_fts'
+
+# Local names for crops, by language: yo Yoruba, ha Hausa, ig Igbo, sw Swahili, zu Zulu.
+# Listings are mostly written in English; a search for any of these also finds
+# the English name (and the other way round, for listings written locally).
+CROP_SYNONYMS = {
+    'maize': {'en': ['corn'], 'yo': ['agbado'], 'ha': ['masara'], 'ig': ['oka'], 'sw': ['mahindi'], 'zu': ['umbila']},
+    'rice': {'yo': ['iresi'], 'ha': ['shinkafa'], 'ig': ['osikapa'], 'sw': ['mchele', 'mpunga'], 'zu': ['ilayisi']},
+    'cassava': {'en': ['manioc'], 'yo': ['gbaguda', 'ege'], 'ha': ['rogo'], 'ig': ['akpu', 'jigbo'],
+                'sw': ['muhogo'], 'zu': ['umdumbula']},
+    'yam': {'yo': ['isu'], 'ha': ['doya'], 'ig': ['ji'], 'sw': ['kiazi kikuu']},
+    'beans': {'en': ['cowpea', 'bean'], 'yo': ['ewa'], 'ha': ['wake'], 'ig': ['agwa'], 'sw': ['maharage'],
+              'zu': ['ubhontshisi']},
+    'tomato': {'yo': ['tomati'], 'ha': ['tumatir'], 'sw': ['nyanya'], 'zu': ['utamatisi']},
+    'pepper': {'en': ['chili', 'chilli'], 'yo': ['ata'], 'ha': ['barkono'], 'ig': ['ose'], 'sw': ['pilipili'],
+               'zu': ['upelepele']},
+    'groundnut': {'en': ['peanut'], 'yo': ['epa'], 'ha': ['gyada'], 'ig': ['ahuekere'], 'sw': ['karanga'],
+                  'zu': ['amantongomane']},
+    'sorghum': {'en': ['guinea corn'], 'yo': ['oka baba'], 'ha': ['dawa'], 'sw': ['mtama'], 'zu': ['amabele']},
+    'millet': {'yo': ['jero'], 'ha': ['gero'], 'sw': ['uwele', 'ulezi']},
+    'onion': {'yo': ['alubosa'], 'ha': ['albasa'], 'ig': ['yabasi'], 'sw': ['kitunguu'], 'zu': ['anyanisi']},
+    'banana': {'yo': ['ogede'], 'ha': ['ayaba'], 'ig': ['unere'], 'sw': ['ndizi'], 'zu': ['ubhanana']},
+    'plantain': {'yo': ['ogede agbagba'], 'ig': ['ojoko'], 'sw': ['ndizi mbichi']},
+    'okra': {'yo': ['ila'], 'ha': ['kubewa'], 'ig': ['okwuru'], 'sw': ['bamia']},
+    'sweet potato': {'yo': ['odunkun'], 'ha': ['dankali'], 'sw': ['viazi vitamu'], 'zu': ['ubhatata']},
+    'potato': {'en': ['irish potato'], 'ha': ['dankalin turawa'], 'sw': ['viazi', 'kiazi'], 'zu': ['amazambane']},
+    'cocoyam': {'en': ['taro'], 'yo': ['koko'], 'ig': ['ede'], 'sw': ['magimbi'], 'zu': ['amadumbe']},
+    'mango': {'yo': ['mangoro'], 'ha': ['mangwaro'], 'sw': ['embe'], 'zu': ['umango']},
+    'orange': {'yo': ['osan'], 'ha': ['lemu'], 'sw': ['chungwa'], 'zu': ['iwolintshi']},
+    'papaya': {'en': ['pawpaw'], 'yo': ['ibepe'], 'ha': ['gwanda'], 'sw': ['papai']},
+    'coconut': {'yo': ['agbon'], 'ha': ['kwakwa'], 'sw': ['nazi']},
+    'watermelon': {'ha': ['kankana'], 'sw': ['tikiti maji']},
+    'pumpkin': {'sw': ['boga'], 'zu': ['ithanga']},
+    'cabbage': {'sw': ['kabichi'], 'zu': ['iklabishi']},
+    'amaranth': {'yo': ['tete'], 'sw': ['mchicha']},
+    'pigeon pea': {'sw': ['mbaazi']},
+    'cotton': {'yo': ['owu'], 'ha': ['auduga'], 'sw': ['pamba']},
+    'coffee': {'sw': ['kahawa'], 'zu': ['ikhofi']},
+    'grapes': {'sw': ['zabibu']},
+}
+
+
+class SynonymMap:
+    """
+    Groups of names that mean the same crop. `expand` splits a query into
+    terms, each with every name it could be written as.
+    """
+
+    def __init__(self, groups):
+        self._groups = {}
+        for english, names in groups.items():
+            group = [english] + [name for names_ in names.values() for name in names_]
+            group = [tuple(split_words(name)) for name in group]
+            for name in group:
+                # A name shared by two crops ("oka") keeps its first meaning
+                self._groups.setdefault(name, group)
+        self._max_words = max((len(name) for name in self._groups), default=1)
+
+    def expand(self, query):
+        """
+        [(term, alternatives)] for a query, where term and alternatives are
+        word tuples. Multi-word names ("oka baba") are matched as one term,
+        longest first.
+        """
+        words, terms, i = split_words(query), [], 0
+        while i < len(words):
+            for n in range(min(self._max_words, len(words) - i), 0, -1):
+                term = tuple(words[i:i + n])
+                if n == 1 or term in self._groups:
+                    break
+            alternatives = [name for name in self._groups.get(term, [term]) if name != term]
+            terms.append((term, alternatives))
+            i += len(term)
+        return terms
+
+
+synonyms = SynonymMap(CROP_SYNONYMS)
+
+
+def fts5_query(terms):
+    """
+    FTS5 MATCH expression: every term must match, as itself (by prefix) or any synonym.
+    """
+    def phrase(words, prefix=False):
+        return '"' + ' '.join(words) + '"' + ('*' if prefix else '')
+    return ' AND '.join(
+        '(' + ' OR '.join([phrase(term, prefix=True)] + [phrase(alt) for alt in alternatives]) + ')'
+        for term, alternatives in terms
+    )
+
+
+def tsquery(terms):
+    """
+    to_tsquery() input with the same meaning as fts5_query().
+    """
+    def phrase(words, prefix=False):
+        return ' <-> '.join(words) + (':*' if prefix else '')
+    return ' & '.join(
+        '(' + ' | '.join([phrase(term, prefix=True)] + [phrase(alt) for alt in alternatives]) + ')'
+        for term, alternatives in terms
+    )
+
+
+def search_products(queryset, query):
+    """
+    Products in `queryset` matching `query`, best first. Uses the search
+    index the database has (Postgres tsvector column, SQLite FTS5 table),
+    and falls back to icontains on anything else.
+    """
+    terms = synonyms.expand(query)
+    if not terms:
+        return queryset
+    table = queryset.model._meta.db_table
+
+    if connection.vendor == 'postgresql':
+        match = tsquery(terms)
+        return queryset.annotate(
+            search_match=RawSQL(f"{table}.search_vector @@ to_tsquery('english', %s)", [match], BooleanField()),
+            search_rank=RawSQL(f"ts_rank({table}.search_vector, to_tsquery('english', %s))", [match], FloatField()),
+        ).filter(search_match=True).order_by('-search_rank', '-created_at')
+
+    if connection.vendor == 'sqlite':
+        match = fts5_query(terms)
+        # bm25() is lower for better matches; name hits weigh ten times description hits
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id", [match], FloatField(),
+            ),
+        ).order_by('search_rank', '-created_at')
+
+    condition = Q()
+    for term, alternatives in terms:
+        either = Q()
+        for words in [term] + alternatives:
+            name = ' '.join(words)
+            either |= Q(name__icontains=name) | Q(description__icontains=name)
+        condition &= either
+    return queryset.filter(condition)
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    ?search= over product name and description through the full-text index, ranked.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        return search_products(queryset, query) if query.strip() else queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Search in name or description; local crop names match their English name',
+            'schema': {'type': 'string'},
+        }]
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from .models import Product
 from .models import Message
 from .models import Order
+from .threads import attach_replies
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,6 +11,13 @@ class ProductSerializer(serializers.ModelSerializer):
         read_only_fields = ['farmer']
 
 
+class MessageListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        messages = list(data.all() if hasattr(data, 'all') else data)
+        attach_replies(messages)  # Every reply tree on the page in one query
+        return super().to_representation(messages)
+
+
 class MessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.get_full_name', read_only=True)
     receiver_name = serializers.CharField(source='receiver.get_full_name', read_only=True)
@@ -23,9 +31,37 @@ class MessageSerializer(serializers.ModelSerializer):
             'sender_name', 'receiver_name', 'is_deleted'
         ]
         read_only_fields = ['sender', 'timestamp', 'is_read', 'replies', 'is_deleted']
+        list_serializer_class = MessageListSerializer
 
     def get_replies(self, obj):
-        return MessageSerializer(obj.replies.filter(is_deleted=False), many=True).data
+        attach_replies([obj])
+        return MessageSerializer(obj.thread_replies, many=True, context=self.context).data
+
+
+class ConversationSerializer(serializers.Serializer):
+    """
+    A conversation row from threads.conversations_for(): its latest message plus aggregates.
+    """
+    product = serializers.IntegerField(source='product_id')
+    product_name = serializers.CharField(source='product.name')
+    counterpart = serializers.IntegerField(source='counterpart_id')
+    counterpart_name = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
+    last_timestamp = serializers.DateTimeField(source='timestamp')
+    unread_count = serializers.IntegerField()
+    message_count = serializers.IntegerField()
+
+    def get_counterpart_name(self, obj):
+        counterpart = obj.sender if obj.sender_id == obj.counterpart_id else obj.receiver
+        return counterpart.get_full_name()
+
+    def get_last_message(self, obj):
+        return {
+            'id': obj.id,
+            'sender': obj.sender_id,
+            'content': obj.content,
+            'is_read': obj.is_read,
+        }
 
 
 class OrderSerializer(serializers.ModelSerializer):
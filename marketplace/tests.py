@@ -1,3 +1,276 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from accounts.models import CustomUser
+from core.models import Farmer
+from .models import Message, Order, Product
+from .search import fts5_query, search_products, synonyms, tsquery
+from .serializers import ConversationSerializer
+from .threads import conversations_for, load_conversation
+from .views import DashboardNotificationView
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.farmer = Farmer.objects.create(user=CustomUser.objects.create_user(email="seller@example.com"))
+
+    def add(self, name, description=''):
+        return Product.objects.create(farmer=self.farmer, name=name, description=description, price=100, quantity=1)
+
+    def search(self, query):
+        return [p.name for p in search_products(Product.objects.all(), query)]
+
+    def test_synonyms_expand_local_names_and_phrases(self):
+        [(term, alternatives)] = synonyms.expand("Agbado")
+        self.assertEqual(term, ('agbado',))
+        self.assertIn(('maize',), alternatives)
+        self.assertIn(('mahindi',), alternatives)
+        # "oka baba" is sorghum in Yoruba, not "oka" (maize) followed by "baba"
+        [(term, alternatives)] = synonyms.expand("oka baba")
+        self.assertIn(('sorghum',), alternatives)
+
+    def test_match_expressions(self):
+        terms = synonyms.expand("Tomato, oka baba!")
+        self.assertEqual(tsquery(terms), "(tomato:* | tomati | tumatir | nyanya | utamatisi) & "
+                                         "(oka <-> baba:* | sorghum | guinea <-> corn | dawa | mtama | amabele)")
+        self.assertEqual(fts5_query(synonyms.expand("ewa")), '("ewa"* OR "beans" OR "cowpea" OR "bean" OR '
+                                                             '"wake" OR "agwa" OR "maharage" OR "ubhontshisi")')
+
+    def test_ranked_prefix_and_stemmed_matches(self):
+        self.add("Fresh tomatoes", "Roma, picked today")
+        self.add("Pepper mix", "Scotch bonnet with a few tomatoes")
+        self.add("Yellow maize", "Dry grain")
+        self.assertEqual(self.search("tomato"), ["Fresh tomatoes", "Pepper mix"])
+        self.assertEqual(self.search("toma"), ["Fresh tomatoes", "Pepper mix"])
+        self.assertEqual(self.search("tomato grain"), [])
+
+    def test_local_crop_names_find_english_listings(self):
+        self.add("Yellow maize", "Dry grain, 50kg bags")
+        self.add("Cassava tubers", "Sweet variety")
+        self.add("Kiazi kikuu", "Listed in Swahili")
+        self.assertEqual(self.search("agbado"), ["Yellow maize"])    # Yoruba
+        self.assertEqual(self.search("masara"), ["Yellow maize"])    # Hausa
+        self.assertEqual(self.search("akpu"), ["Cassava tubers"])    # Igbo
+        self.assertEqual(self.search("muhogo"), ["Cassava tubers"])  # Swahili
+        self.assertEqual(self.search("umbila"), ["Yellow maize"])    # Zulu
+        self.assertEqual(self.search("yam"), ["Kiazi kikuu"])
+
+    def test_index_follows_save_and_delete(self):
+        product = self.add("Groundnut", "Shelled")
+        self.assertEqual(self.search("gyada"), ["Groundnut"])
+        product.name = "Rice"
+        product.save()
+        self.assertEqual(self.search("gyada"), [])
+        self.assertEqual(self.search("shinkafa"), ["Rice"])
+        Product.objects.filter(pk=product.pk).update(description="Ofada, local")
+        self.assertEqual(self.search("ofada"), ["Rice"])
+        product.delete()
+        self.assertEqual(self.search("rice"), [])
+
+    def test_list_view_search(self):
+        self.add("Yellow maize")
+        self.add("Okra")
+        response = self.client.get('/api/marketplace/', {'search': 'mahindi'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['name'] for p in response.data['results']], ["Yellow maize"])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="seller@example.com")
+        self.farmer = Farmer.objects.create(user=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def walk(self, url, **params):
+        pages, response = [], self.client.get(url, params, **self.auth)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            if not response.data['next']:
+                return pages, response
+            response = self.client.get(response.data['next'], **self.auth)
+
+    def test_products_page_through_timestamp_ties(self):
+        Product.objects.bulk_create(
+            Product(farmer=self.farmer, name=f"Lot {i}", description='', price=1, quantity=1) for i in range(25)
+        )
+        Product.objects.update(created_at=timezone.now())  # Every row ties on created_at; id must order them
+        newest_first = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        pages, last = self.walk('/api/marketplace/')
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), newest_first)
+        self.assertNotIn('count', last.data)
+
+        previous = self.client.get(last.data['previous'])
+        self.assertEqual([row['id'] for row in previous.data['results']], pages[1])
+        first = self.client.get(previous.data['previous'])
+        self.assertEqual([row['id'] for row in first.data['results']], pages[0])
+        self.assertIsNone(first.data['previous'])
+
+    def test_page_numbers_stay_available(self):
+        for i in range(12):
+            Product.objects.create(farmer=self.farmer, name=f"Lot {i}", description='', price=1, quantity=1)
+        response = self.client.get('/api/marketplace/', {'page': 2})
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(self.client.get('/api/marketplace/', {'cursor': 'nonsense'}).status_code, 404)
+
+    def test_inbox_and_order_lists_are_paginated(self):
+        buyer = CustomUser.objects.create_user(email="buyer@example.com")
+        product = Product.objects.create(farmer=self.farmer, name="Maize", description='', price=2, quantity=9)
+        Message.objects.bulk_create(
+            Message(sender=buyer, receiver=self.user, product=product, content=f"Hi {i}") for i in range(45)
+        )
+        Order.objects.bulk_create(
+            Order(buyer=buyer, product=product, quantity=1, total_price=2) for _ in range(21)
+        )
+
+        pages, _ = self.walk('/api/marketplace/messages/inbox/')
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(len(set(sum(pages, []))), 45)
+
+        pages, _ = self.walk('/api/marketplace/orders/seller/')
+        self.assertEqual([len(page) for page in pages], [20, 1])
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(buyer)}"}
+        pages, _ = self.walk('/api/marketplace/orders/buyer/', page_size=7)
+        self.assertEqual([len(page) for page in pages], [7, 7, 7])
+
+
+class ThreadLoaderTests(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(email="seller@example.com", first_name="Ada", last_name="Obi")
+        self.buyer = CustomUser.objects.create_user(email="buyer@example.com", first_name="Juma", last_name="Ali")
+        self.product = Product.objects.create(
+            farmer=Farmer.objects.create(user=self.seller), name="Maize", description='', price=2, quantity=9
+        )
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {AccessToken.for_user(self.seller)}"}
+
+    def send(self, sender, receiver, content, parent=None):
+        return Message.objects.create(sender=sender, receiver=receiver, product=self.product,
+                                      content=content, parent=parent)
+
+    def conversation(self, depth):
+        root = message = self.send(self.buyer, self.seller, "Is it dry?")
+        for i in range(depth):
+            sender, receiver = (self.seller, self.buyer) if i % 2 == 0 else (self.buyer, self.seller)
+            message = self.send(sender, receiver, f"Reply {i}", parent=message)
+        return root
+
+    def test_thread_root_follows_parent(self):
+        root = self.conversation(3)
+        self.assertIsNone(root.thread_root_id)
+        self.assertEqual(set(Message.objects.exclude(pk=root.pk).values_list('thread_root', flat=True)), {root.pk})
+
+        other = self.send(self.buyer, self.seller, "Price?")
+        moved = Message.objects.get(parent=root)
+        moved.parent = other
+        moved.save()
+        self.assertEqual(set(Message.objects.filter(thread_root=other).values_list('id', flat=True)),
+                         set(Message.objects.exclude(pk__in=[root.pk, other.pk]).values_list('id', flat=True)))
+
+    def test_reply_tree_shape(self):
+        root = self.conversation(2)
+        first = Message.objects.get(parent=root)
+        hidden = self.send(self.buyer, self.seller, "Oops", parent=first)
+        self.send(self.seller, self.buyer, "Under a deleted reply", parent=hidden)
+        hidden.is_deleted = True
+        hidden.save()
+
+        data = self.client.get(f'/api/marketplace/messages/{root.pk}/', **self.auth).data
+        self.assertEqual(data['sender_name'], "Juma Ali")
+        [reply] = data['replies']
+        self.assertEqual((reply['content'], reply['sender_name'], reply['parent']), ("Reply 0", "Ada Obi", root.pk))
+        [nested] = reply['replies']
+        self.assertEqual((nested['content'], nested['replies']), ("Reply 1", []))
+
+        loaded = load_conversation(nested['id'])
+        self.assertEqual(loaded.pk, root.pk)
+        self.assertEqual([m.content for m in loaded.thread_replies[0].thread_replies], ["Reply 1"])
+
+    def test_inbox_queries_do_not_grow_with_depth_or_threads(self):
+        def inbox_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/api/marketplace/messages/inbox/', **self.auth)
+            self.assertEqual(response.status_code, 200)
+            return len(context)
+
+        self.conversation(2)
+        shallow = inbox_queries()
+        for _ in range(3):
+            self.conversation(8)
+        self.assertEqual(inbox_queries(), shallow)
+
+
+class ConversationInboxTests(TestCase):
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(email="seller@example.com", first_name="Ada", last_name="Obi")
+        farmer = Farmer.objects.create(user=self.seller)
+        self.maize = Product.objects.create(farmer=farmer, name="Maize", description='', price=2, quantity=9)
+        self.beans = Product.objects.create(farmer=farmer, name="Beans", description='', price=3, quantity=4)
+        self.buyers = [
+            CustomUser.objects.create_user(email=f"buyer{i}@example.com", first_name=f"Buyer{i}", last_name="Mensah")
+            for i in range(3)
+        ]
+
+    def send(self, sender, receiver, product, content, is_read=False):
+        return Message.objects.create(sender=sender, receiver=receiver, product=product, content=content,
+                                      is_read=is_read)
+
+    def test_one_row_per_product_and_counterpart(self):
+        first, second, third = self.buyers
+        self.send(first, self.seller, self.maize, "Is it dry?", is_read=True)
+        self.send(self.seller, first, self.maize, "Yes")
+        self.send(first, self.seller, self.maize, "I'll take 5 bags")
+        self.send(first, self.seller, self.beans, "Beans too?")
+        self.send(second, self.seller, self.maize, "Price?")
+        deleted = self.send(third, self.seller, self.beans, "Never mind")
+        deleted.is_deleted = True
+        deleted.save()
+
+        response = self.client.get('/api/marketplace/messages/conversations/',
+                                   HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.seller)}")
+        self.assertEqual(response.status_code, 200)
+        rows = [(row['product_name'], row['counterpart_name'], row['last_message']['content'],
+                 row['unread_count'], row['message_count']) for row in response.data]
+        self.assertEqual(rows, [
+            ("Maize", "Buyer1 Mensah", "Price?", 1, 1),
+            ("Beans", "Buyer0 Mensah", "Beans too?", 1, 1),
+            ("Maize", "Buyer0 Mensah", "I'll take 5 bags", 1, 3),
+        ])
+
+        # The buyer's side of the same conversation: the seller's reply is their one unread message
+        [row] = [row for row in ConversationSerializer(conversations_for(first), many=True).data
+                 if row['product'] == self.maize.pk]
+        self.assertEqual((row['counterpart'], row['unread_count']), (self.seller.pk, 1))
+
+    def test_single_query_however_many_conversations(self):
+        for buyer in self.buyers:
+            for product in (self.maize, self.beans):
+                for i in range(4):
+                    self.send(buyer, self.seller, product, f"Message {i}")
+                    self.send(self.seller, buyer, product, f"Reply {i}", is_read=True)
+        with self.assertNumQueries(1):
+            data = ConversationSerializer(conversations_for(self.seller), many=True).data
+        self.assertEqual(len(data), 6)
+        self.assertEqual({row['unread_count'] for row in data}, {4})
+
+    def test_dashboard_counts_in_one_query(self):
+        buyer = self.buyers[0]
+        self.send(buyer, self.seller, self.maize, "Is it dry?")
+        self.send(buyer, self.seller, self.beans, "Read already", is_read=True)
+        Order.objects.create(buyer=buyer, product=self.maize, quantity=1, total_price=2)
+        Order.objects.create(buyer=buyer, product=self.beans, quantity=1, total_price=3, status='shipped')
+
+        def counts(user):
+            request = APIRequestFactory().get('/')
+            force_authenticate(request, user=user)
+            with self.assertNumQueries(1):
+                return DashboardNotificationView.as_view()(request).data
+
+        self.assertEqual(counts(self.seller), {'unread_messages': 1, 'pending_orders': 1})
+        self.assertEqual(counts(buyer), {'unread_messages': 0, 'pending_orders': 1})
@@ -0,0 +1,95 @@
+# marketplace/threads.py
+
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, Q, Sum, Value, When, Window
+from django.db.models.functions import RowNumber
+
+from .models import Message
+
+
+def _thread_messages(thread_ids):
+    """
+    Every non-deleted message of the given conversations, senders and receivers joined in.
+    """
+    return (
+        Message.objects.filter(Q(id__in=thread_ids) | Q(thread_root__in=thread_ids), is_deleted=False)
+        .select_related('sender', 'receiver')
+        .order_by('-timestamp', '-id')
+    )
+
+
+def _assemble(messages, loaded):
+    """
+    Sets `thread_replies` on each of `messages` and every reply below it:
+    its direct replies among `loaded`, newest first. A deleted reply is
+    absent from `loaded`, so its whole branch is hidden, as before.
+    """
+    children = defaultdict(list)
+    for message in loaded:
+        if message.parent_id is not None:
+            children[message.parent_id].append(message)
+    for message in [*loaded, *messages]:
+        message.thread_replies = children.get(message.id, [])
+    return messages
+
+
+def attach_replies(messages):
+    """
+    Loads the reply trees below `messages` (roots or replies, from any
+    number of conversations) with one query, however deep the threads are.
+    Messages that already carry their replies are left alone.
+    """
+    messages = [message for message in messages if not hasattr(message, 'thread_replies')]
+    if not messages:
+        return messages
+    thread_ids = {message.thread_root_id or message.id for message in messages}
+    return _assemble(messages, list(_thread_messages(thread_ids)))
+
+
+def load_conversation(message_id):
+    """
+    The first message of the conversation `message_id` belongs to, with
+    the whole reply tree attached, in two queries; None if it is missing
+    or deleted.
+    """
+    root_id = Message.objects.filter(id=message_id).values_list('thread_root_id', flat=True).first()
+    root_id = root_id or message_id
+    loaded = list(_thread_messages([root_id]))
+    root = next((message for message in loaded if message.id == root_id), None)
+    if root is None:
+        return None
+    return _assemble([root], loaded)[0]
+
+
+def conversations_for(user):
+    """
+    One Message per conversation (product × the other party) `user` is
+    in: the latest non-deleted one, annotated with `counterpart_id`,
+    `unread_count` (messages to `user` not yet read) and `message_count`.
+    Newest conversation first; a single query, with sender, receiver and
+    product joined in.
+
+    The user's messages are found as a UNION of those received and those
+    sent, so each half seeks its own index (receiver, sender) where an OR
+    of the two would scan the table.
+    """
+    mine = Message.objects.filter(is_deleted=False).order_by().values('id')
+    conversation = [F('product'), F('counterpart_id')]
+    return (
+        Message.objects.filter(id__in=mine.filter(receiver=user).union(mine.filter(sender=user)))
+        .select_related('sender', 'receiver', 'product')
+        .annotate(
+            counterpart_id=Case(When(receiver=user, then=F('sender')), default=F('receiver')),
+        )
+        .annotate(
+            position=Window(RowNumber(), partition_by=conversation, order_by=[F('timestamp').desc(), F('id').desc()]),
+            unread_count=Window(
+                Sum(Case(When(receiver=user, is_read=False, then=Value(1)), default=Value(0))),
+                partition_by=conversation,
+            ),
+            message_count=Window(Count('id'), partition_by=conversation),
+        )
+        .filter(position=1)
+        .order_by('-timestamp', '-id')
+    )
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import BuyerOrderListView, MessageCreateView, MessageDetailView, MessageListView, OrderCreateView, OrderUpdateStatusView, ProductCreateView, ProductDeleteView, ProductDetailView, ProductListView, ProductUpdateView, SellerOrderListView
+from .views import BuyerOrderListView, ConversationListView, MessageCreateView, MessageDetailView, MessageListView, OrderCreateView, OrderUpdateStatusView, ProductCreateView, ProductDeleteView, ProductDetailView, ProductListView, ProductUpdateView, SellerOrderListView
 
 urlpatterns = [
     path('create/', ProductCreateView.as_view(), name='product-create'),
@@ -9,6 +9,7 @@ urlpatterns = [
     path('<int:id>/delete/', ProductDeleteView.as_view(), name='product-delete'),
     path('messages/send/', MessageCreateView.as_view(), name='send-message'),
     path('messages/inbox/', MessageListView.as_view(), name='inbox'),
+    path('messages/conversations/', ConversationListView.as_view(), name='conversations'),
     path('messages/<int:pk>/', MessageDetailView.as_view(), name='message-detail'),
     path('orders/create/', OrderCreateView.as_view()),
     path('orders/buyer/', BuyerOrderListView.as_view()),
@@ -3,13 +3,16 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 
-from .pagination import ProductPagination
+from .pagination import MessagePagination, OrderPagination, ProductPagination
+from .search import ProductSearchFilter
 from .models import Product, Message
-from .serializers import MessageSerializer, ProductSerializer
+from .serializers import ConversationSerializer, MessageSerializer, ProductSerializer
+from .threads import conversations_for
 from core.models import Farmer  # adjust if located elsewhere
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters
-from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Count, Value
+from core.outbox import enqueue_email
 from django.conf import settings
 from .models import Order
 from .serializers import OrderSerializer
@@ -39,10 +42,11 @@ class ProductCreateView(generics.CreateAPIView):
     parameters=[
         OpenApiParameter(name='name', location='query', required=False, description='Filter by product name'),
         OpenApiParameter(name='farmer__id', location='query', required=False, description='Filter by farmer ID'),
-        OpenApiParameter(name='search', location='query', required=False, description='Search in name or description'),
     ],
     responses={200: ProductSerializer(many=True)},
-    description="List all products. Supports filtering by name and farmer ID, and search in name/description."
+    description="List all products, newest first, a cursor page at a time (pass ?page=N for numbered pages). "
+                "Supports filtering by name and farmer ID, and full-text search in name/description "
+                "(best matches first; crop names in Yoruba, Hausa, Igbo, Swahili and Zulu match their English names)."
 )
 class ProductListView(generics.ListAPIView):
     queryset = Product.objects.all().order_by('-created_at')
@@ -51,10 +55,9 @@ class ProductListView(generics.ListAPIView):
     pagination_class = ProductPagination
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        ProductSearchFilter,  # 🔍 Full-text index, see marketplace/search.py
     ]
     filterset_fields = ['name', 'farmer__id']  # Existing filters
-    search_fields = ['name', 'description']   # 🔍 New search fields
 
 
 # ✅ Retrieve a single product by ID
@@ -115,11 +118,12 @@ class MessageCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        message = serializer.save(sender=self.request.user)
+        with transaction.atomic():
+            message = serializer.save(sender=self.request.user)
 
-        # Email notification
-        subject = _(f'New message from {message.sender.get_full_name()} on AgriSmart')
-        body = _(f'''
+            # Email notification, sent by the outbox worker once this commits
+            subject = _(f'New message from {message.sender.get_full_name()} on AgriSmart')
+            body = _(f'''
 Hi {message.receiver.get_full_name()},
 
 You have received a new message regarding the product: {message.product.name}.
@@ -131,27 +135,23 @@ Please log in to your account to reply.
 
 AgriSmart Team
         ''')
-        send_mail(
-            subject,
-            body,
-            settings.DEFAULT_FROM_EMAIL,
-            [message.receiver.email],
-            fail_silently=True
-        )
+            enqueue_email(subject, body, [message.receiver.email], settings.DEFAULT_FROM_EMAIL)
 
 
 @extend_schema(
     responses={200: MessageSerializer(many=True)},
-    description="List all messages received by the authenticated user. Only non-deleted messages are shown."
+    description="List all messages received by the authenticated user, newest first, a cursor page at a time. "
+                "Only non-deleted messages are shown."
 )
 class MessageListView(generics.ListAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessagePagination
 
     # Only show non-deleted messages
     def get_queryset(self):
         user = self.request.user
-        return Message.objects.filter(receiver=user, is_deleted=False)
+        return Message.objects.filter(receiver=user, is_deleted=False).select_related('sender', 'receiver')
 
     # Soft delete
     def delete(self, request, *args, **kwargs):
@@ -164,13 +164,27 @@ class MessageListView(generics.ListAPIView):
 
 
 
+@extend_schema(
+    responses={200: ConversationSerializer(many=True)},
+    description="The authenticated user's conversations, one row per product and other party, newest first: "
+                "the last message, its timestamp and how many messages in it are unread."
+)
+class ConversationListView(generics.ListAPIView):
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None  # One row per conversation, computed in one grouped query
+
+    def get_queryset(self):
+        return conversations_for(self.request.user)
+
+
 @extend_schema(
     request=MessageSerializer,
     responses={200: MessageSerializer},
     description="View or mark a message as read. Automatically marks the message as read on update."
 )
 class MessageDetailView(generics.RetrieveUpdateAPIView):
-    queryset = Message.objects.all()
+    queryset = Message.objects.select_related('sender', 'receiver')
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -197,11 +211,12 @@ class OrderCreateView(generics.CreateAPIView):
 
 @extend_schema(
     responses={200: OrderSerializer(many=True)},
-    description="List all orders made by the currently authenticated user (as buyer)."
+    description="List all orders made by the currently authenticated user (as buyer), newest first, a cursor page at a time."
 )
 class BuyerOrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OrderPagination
 
     def get_queryset(self):
         return Order.objects.filter(buyer=self.request.user)
@@ -209,14 +224,15 @@ class BuyerOrderListView(generics.ListAPIView):
 
 @extend_schema(
     responses={200: OrderSerializer(many=True)},
-    description="List all orders received by the authenticated farmer (as seller)."
+    description="List all orders received by the authenticated farmer (as seller), newest first, a cursor page at a time."
 )
 class SellerOrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OrderPagination
 
     def get_queryset(self):
-        return Order.objects.filter(product__farmer=self.request.user)
+        return Order.objects.filter(product__farmer__user=self.request.user)
 
 
 @extend_schema(
@@ -254,14 +270,21 @@ class DashboardNotificationView(APIView):
 
     def get(self, request):
         user = request.user
-        unread_messages = Message.objects.filter(receiver=user, is_read=False, is_deleted=False).count()
-
-        if hasattr(user, 'farmer'):
-            pending_orders = Order.objects.filter(product__farmer=user, status='pending').count()
-        else:
-            pending_orders = Order.objects.filter(buyer=user, status='pending').count()
+        counted = {
+            'unread_messages': Message.objects.filter(receiver=user, is_read=False, is_deleted=False),
+            'farmer': Farmer.objects.filter(user=user),
+            'sold': Order.objects.filter(product__farmer__user=user, status='pending'),
+            'bought': Order.objects.filter(buyer=user, status='pending'),
+        }
+        # Every count in one round trip, as a UNION ALL of index lookups; each is an ungrouped COUNT, so one row apiece
+        queries = [self._count(queryset, name) for name, queryset in counted.items()]
+        counts = {row['counted']: row['count'] for row in queries[0].union(*queries[1:], all=True)}
 
         return Response({
-            'unread_messages': unread_messages,
-            'pending_orders': pending_orders
+            'unread_messages': counts['unread_messages'],
+            'pending_orders': counts['sold'] if counts['farmer'] else counts['bought'],
         })
+
+    @staticmethod
+    def _count(queryset, name):
+        return queryset.order_by().values(counted=Value(name)).annotate(count=Count('id'))
@@ -0,0 +1,124 @@
+# scripts/benchmark_pagination.py
+"""
+Deep-page latency of the product list, numbered pages vs keyset cursors.
+
+Fills a scratch database with products, then times GET /api/marketplace/
+at increasing depths both ways. Numbered pages pay for the OFFSET (and a
+COUNT(*)) and slow down linearly with depth; cursor pages should stay flat.
+
+    python scripts/benchmark_pagination.py --products 200000
+    python scripts/benchmark_pagination.py --database-url postgres://localhost/agrismart_bench
+
+The database is migrated and filled from scratch: never point it at real data.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SPREAD_SQL = {
+    # One product a minute, so created_at is distinct and in id order
+    'sqlite': "UPDATE marketplace_product SET created_at = datetime('2024-01-01', '+' || id || ' minutes')",
+    'postgresql': "UPDATE marketplace_product SET created_at = timestamptz '2024-01-01' + id * interval '1 minute'",
+}
+
+
+def fill(n_products, batch_size=5000):
+    from django.db import connection
+
+    from accounts.models import CustomUser
+    from core.models import Farmer
+    from marketplace.models import Product
+
+    farmer = Farmer.objects.create(user=CustomUser.objects.create_user(email="bench@example.com"))
+    for start in range(0, n_products, batch_size):
+        Product.objects.bulk_create(
+            Product(farmer=farmer, name=f"Lot {i}", description="Benchmark listing", price=1, quantity=1)
+            for i in range(start, min(start + batch_size, n_products))
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(SPREAD_SQL[connection.vendor])
+        if connection.vendor == 'postgresql':
+            cursor.execute("ANALYZE marketplace_product")
+
+
+def timed(view, factory, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = view(factory.get('/api/marketplace/', params))
+        response.render()
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(timings) * 1000
+
+
+def benchmark(n_products, depths, repeat):
+    from rest_framework.test import APIRequestFactory
+
+    from marketplace.models import Product
+    from marketplace.pagination import ProductPagination
+    from marketplace.views import ProductListView
+
+    view, factory = ProductListView.as_view(), APIRequestFactory()
+    page_size = ProductPagination.page_size
+    newest_first = Product.objects.order_by('-created_at', '-id')
+
+    cursors = ProductPagination()
+    cursors.base_url = 'http://testserver/api/marketplace/'
+    cursors.field = Product._meta.get_field('created_at')
+
+    print(f"{n_products} products, {page_size} per page, median of {repeat} runs")
+    print(f"{'page':>8}{'numbered ms':>14}{'cursor ms':>12}")
+    for page in depths:
+        if (page - 1) * page_size >= n_products:
+            break
+        numbered = timed(view, factory, {'page': page}, repeat)
+        if page == 1:
+            cursor_params = {}
+        else:
+            # The cursor a client holds after reading page - 1 pages
+            last_seen = newest_first[(page - 1) * page_size - 1]
+            link = cursors.encode_cursor(False, last_seen)
+            cursor_params = {'cursor': link.split('cursor=', 1)[1]}
+        cursor = timed(view, factory, cursor_params, repeat)
+        print(f"{page:>8}{numbered:>14.2f}{cursor:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', help="Scratch database (default: a temporary SQLite file)")
+    parser.add_argument('--depths', default='1,10,100,1000,5000,10000,20000',
+                        help="Comma-separated page numbers to time")
+    args = parser.parse_args()
+
+    scratch = None
+    if not args.database_url:
+        scratch = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        args.database_url = f"sqlite:///{scratch.name}"
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agrismart.settings')
+
+    import django
+    from django.core.management import call_command
+    django.setup()
+
+    try:
+        call_command('migrate', verbosity=0)
+        start = time.perf_counter()
+        fill(args.products)
+        print(f"Filled in {time.perf_counter() - start:.1f}s")
+        benchmark(args.products, [int(d) for d in args.depths.split(',')], args.repeat)
+    finally:
+        if scratch:
+            os.unlink(scratch.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# scripts/loadtest_weather.py
+"""
+Load test for the weather-bound endpoints, WSGI vs ASGI.
+
+1. Start a fake OpenWeather that answers any city after a fixed delay:
+
+     python scripts/loadtest_weather.py stub --port 9100 --latency-ms 300
+
+2. Start both servers against it, with the same number of workers:
+
+     export OPENWEATHER_BASE_URL=http://127.0.0.1:9100
+     gunicorn agrismart.wsgi -w 4 -b 127.0.0.1:8001
+     gunicorn agrismart.asgi -w 4 -k uvicorn.workers.UvicornWorker -b 127.0.0.1:8002   # pip install uvicorn
+
+3. Fire the same load at both (every request uses a different city, so each is a cache miss):
+
+     python scripts/loadtest_weather.py run --token <JWT> --requests 400 --concurrency 100 \\
+         --target wsgi=http://127.0.0.1:8001/api/core/weather/ \\
+         --target asgi=http://127.0.0.1:8002/api/core/weather/async/
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+
+def stub_handler(latency):
+    class StubOpenWeather(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path.startswith('/forecast'):
+                now = int(time.time()) // 10800 * 10800
+                body = {"list": [
+                    {"dt": now + i * 10800, "main": {"temp": 22.0, "humidity": 60},
+                     "weather": [{"description": "few clouds", "icon": "02d"}], "wind": {"speed": 3.0}}
+                    for i in range(40)
+                ]}
+            else:
+                body = {
+                    "name": "Stub", "sys": {"country": "KE"},
+                    "main": {"temp": 22.0, "feels_like": 21.5, "humidity": 60},
+                    "weather": [{"description": "few clouds", "icon": "02d"}], "wind": {"speed": 3.0},
+                }
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return StubOpenWeather
+
+
+def run_stub(port, latency_ms):
+    server = ThreadingHTTPServer(('127.0.0.1', port), stub_handler(latency_ms / 1000))
+    server.daemon_threads = True
+    print(f"Fake OpenWeather on http://127.0.0.1:{port} ({latency_ms} ms per request)")
+    server.serve_forever()
+
+
+async def load(url, token, n_requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(
+        timeout=60, pool_limits=httpx.PoolLimits(max_keepalive=concurrency, max_connections=concurrency)
+    ) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(
+                        url, params={"city": f"town-{uuid.uuid4().hex[:12]}"},
+                        headers={"Authorization": f"Bearer {token}"},
+                    )
+                    if response.status_code != 200:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n_requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': n_requests,
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'req_per_s': round(n_requests / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stub = commands.add_parser('stub', help="Run a fake OpenWeather API.")
+    stub.add_argument('--port', type=int, default=9100)
+    stub.add_argument('--latency-ms', type=int, default=300)
+
+    run = commands.add_parser('run', help="Load test one or more endpoints.")
+    run.add_argument('--target', action='append', required=True, help="name=url, repeatable")
+    run.add_argument('--token', required=True, help="JWT access token")
+    run.add_argument('--requests', type=int, default=400)
+    run.add_argument('--concurrency', type=int, default=100)
+
+    args = parser.parse_args()
+    if args.command == 'stub':
+        run_stub(args.port, args.latency_ms)
+        return
+
+    print(f"{'target':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for target in args.target:
+        name, url = target.split('=', 1)
+        result = asyncio.run(load(url, args.token, args.requests, args.concurrency))
+        print(f"{name:<10}{result['req_per_s']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()